@@ -0,0 +1,14 @@
+import shutil
+import tempfile
+import pytest
+from pymicro.crystal.lattice import Lattice
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cif_cache_dir():
+    """Keep the CIF cache of the test session out of the user home directory."""
+    cache_dir = Lattice.cif_cache_dir
+    Lattice.cif_cache_dir = tempfile.mkdtemp()
+    yield Lattice.cif_cache_dir
+    shutil.rmtree(Lattice.cif_cache_dir)
+    Lattice.cif_cache_dir = cache_dir
@@ -1,6 +1,9 @@
 """The lattice module define the class to handle 3D crystal lattices (the 14 Bravais lattices).
 """
 import os
+import re
+import json
+import hashlib
 from pymicro.external import CifFile
 import enum
 import numpy as np
@@ -131,7 +134,7 @@ class Symmetry(enum.Enum):
             sym = np.zeros((4, 3, 3), dtype=np.float)
             sym[0] = np.array([[1., 0., 0.], [0., 1., 0.], [0., 0., 1.]])
             sym[1] = np.array([[1., 0., 0.], [0., -1., 0.], [0., 0., -1.]])
-            sym[2] = np.array([[-1., 0., -1.], [0., 1., 0.], [0., 0., -1.]])
+            sym[2] = np.array([[-1., 0., 0.], [0., 1., 0.], [0., 0., -1.]])
             sym[3] = np.array([[-1., 0., 0.], [0., -1., 0.], [0., 0., 1.]])
         elif self is Symmetry.tetragonal:
             sym = np.zeros((8, 3, 3), dtype=np.float)
@@ -235,6 +238,7 @@ class Lattice:
         self._matrix = m
         self._centering = centering
         self._symmetry = symmetry
+        self._reciprocal_matrix = None
 
     def __eq__(self, other):
         """Override the default Equals behavior.
@@ -277,19 +281,51 @@ class Lattice:
          * a.a^* = 1
          * b.b^* = 1
          * c.c^* = 1
+
+        The reciprocal lattice vectors are computed only once and cached.
         '''
-        [a, b, c] = self._matrix
-        V = self.volume()
-        astar = np.cross(b, c) / V
-        bstar = np.cross(c, a) / V
-        cstar = np.cross(a, b) / V
-        return [astar, bstar, cstar]
+        return list(self.reciprocal_matrix)
+
+    @property
+    def reciprocal_matrix(self):
+        '''Returns a copy of the matrix whose rows are the reciprocal lattice vectors.'''
+        if self._reciprocal_matrix is None:
+            [a, b, c] = self._matrix
+            V = self.volume()
+            self._reciprocal_matrix = np.array([np.cross(b, c), np.cross(c, a), np.cross(a, b)]) / V
+        return np.copy(self._reciprocal_matrix)
 
     @property
     def matrix(self):
         '''Returns a copy of matrix representing the Lattice.'''
         return np.copy(self._matrix)
 
+    def hkl_symmetry_operators(self, symmetry=None):
+        """Express the symmetry operators in the basis of the Miller indices.
+
+        The symmetry operators of the `Symmetry` class act on cartesian vectors. To
+        apply them directly to the Miller indices of lattice planes, they are
+        expressed in the reciprocal lattice basis, so that the indices of an
+        equivalent plane are given by :math:`(h', k', l') = T.(h, k, l)`. Unsupported
+        symmetries fall back to the triclinic symmetry.
+
+        :param symmetry: the `Symmetry` to use (the lattice symmetry by default).
+        :raise ValueError: if the symmetry operators do not map the lattice onto itself.
+        :returns: a (n, 3, 3) integer numpy array.
+        """
+        if symmetry is None:
+            symmetry = self._symmetry or Symmetry.triclinic
+        try:
+            syms = symmetry.symmetry_operators()
+        except ValueError:
+            syms = Symmetry.triclinic.symmetry_operators()
+        Bt = self.reciprocal_matrix.T  # columns are the reciprocal lattice vectors
+        T = np.einsum('ij,njk,kl->nil', np.linalg.inv(Bt), syms, Bt)
+        T_int = np.round(T).astype(int)
+        if not np.allclose(T, T_int, atol=1.e-6):
+            raise ValueError('the %s symmetry operators are not compatible with this lattice' % symmetry)
+        return T_int
+
     @staticmethod
     def symmetry(crystal_structure=Symmetry.cubic):
         """Define the equivalent crystal symmetries.
@@ -347,7 +383,7 @@ class Lattice:
             sym = np.zeros((4, 3, 3), dtype=np.float)
             sym[0] = np.array([[1., 0., 0.], [0., 1., 0.], [0., 0., 1.]])
             sym[1] = np.array([[1., 0., 0.], [0., -1., 0.], [0., 0., -1.]])
-            sym[2] = np.array([[-1., 0., -1.], [0., 1., 0.], [0., 0., -1.]])
+            sym[2] = np.array([[-1., 0., 0.], [0., 1., 0.], [0., 0., -1.]])
             sym[3] = np.array([[-1., 0., 0.], [0., -1., 0.], [0., 0., 1.]])
         elif crystal_structure == Symmetry.tetragonal:
             sym = np.zeros((8, 3, 3), dtype=np.float)
@@ -391,8 +427,87 @@ class Lattice:
         else:
             return Symmetry.triclinic
 
+    # the disk cache of the CIF files, set the PYMICRO_CIF_CACHE environment variable or this attribute to use
+    # another directory, or to an empty string to disable it
+    cif_cache_dir = os.environ.get('PYMICRO_CIF_CACHE', os.path.join(os.path.expanduser('~'), '.pymicro', 'cif_cache'))
+    _cif_cache = {}
+    _cif_tag = re.compile(r'^[ \t]*(_\S+)[ \t]+(\'[^\']*\'|"[^"]*"|[^\s\'"]+)[ \t]*$', re.M)
+
+    @staticmethod
+    def _parse_cif_parameters(text):
+        """Read the lattice parameters from the text of a CIF file.
+
+        This is a fast path reading only the tags (of the first data block) needed to define the lattice. If one of
+        the cell tags is not found in the simple `tag value` form, None is returned and the full CIF parser must be
+        used.
+
+        :param str text: the content of the CIF file.
+        :returns: a tuple (a, b, c, alpha, beta, gamma, cell_setting) with lengths in Angstrom, or None.
+        """
+        blocks = [m.start() for m in re.finditer(r'^data_', text, re.M)]
+        if blocks:
+            text = text[blocks[0]:blocks[1] if len(blocks) > 1 else len(text)]
+        tags = {}
+        for tag, value in Lattice._cif_tag.findall(text):
+            tags.setdefault(tag.lower(), value.strip('\'"'))
+        try:
+            parameters = [float(re.sub(r'\(\d+\)$', '', tags['_cell_%s' % name]))
+                          for name in ['length_a', 'length_b', 'length_c', 'angle_alpha', 'angle_beta', 'angle_gamma']]
+        except (KeyError, ValueError):
+            return None
+        return tuple(parameters) + (tags.get('_symmetry_cell_setting'),)
+
+    @staticmethod
+    def _read_cif_parameters(file_path, use_cache=True):
+        """Read the lattice parameters of a CIF file, using the fast path or the full parser.
+
+        The parameters are cached in memory and on disk (in `Lattice.cif_cache_dir`) with a key built from the file
+        path, its modification time and the hash of its content, so that a given file is only parsed once. Nothing
+        is written to disk if the cache directory is not set or not writable.
+        """
+        path = os.path.abspath(file_path)
+        mtime = os.path.getmtime(path)
+        if use_cache and (path, mtime) in Lattice._cif_cache:
+            return Lattice._cif_cache[(path, mtime)]
+        with open(path, 'rb') as f:
+            text = f.read()
+        key = hashlib.sha1(('%s:%r:' % (path, mtime)).encode('utf-8') + hashlib.sha1(text).digest()).hexdigest()
+        cache_dir = Lattice.cif_cache_dir if use_cache else None
+        cache_path = os.path.join(cache_dir, '%s.json' % key) if cache_dir else None
+        parameters = None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    parameters = tuple(json.load(f)['parameters'])
+            except (IOError, ValueError, KeyError):
+                parameters = None
+        if parameters is None:
+            parameters = Lattice._parse_cif_parameters(text.decode('utf-8', 'replace'))
+            if parameters is None:
+                # fall back on the full CIF parser
+                crystal = CifFile.ReadCif(path).first_block()
+                try:
+                    setting = crystal['_symmetry_cell_setting']
+                except KeyError:
+                    setting = None
+                parameters = tuple(float(crystal['_cell_%s' % name]) for name in
+                                   ['length_a', 'length_b', 'length_c', 'angle_alpha', 'angle_beta', 'angle_gamma'])
+                parameters += (setting,)
+            if cache_path:
+                try:
+                    if not os.path.exists(cache_dir):
+                        os.makedirs(cache_dir)
+                    if os.access(cache_dir, os.W_OK):
+                        with open(cache_path, 'w') as f:
+                            json.dump({'path': path, 'mtime': mtime, 'parameters': parameters}, f)
+                except (IOError, OSError):
+                    pass  # the cache is optional
+        if use_cache:
+            Lattice._cif_cache[(path, mtime)] = parameters
+        return parameters
+
     @staticmethod
-    def from_cif(file_path):
+    def from_cif(file_path, use_cache=True):
         """
         Create a crystal Lattice using information contained in a given CIF
         file (Crystallographic Information Framework, a standard for
@@ -403,26 +518,23 @@ class Lattice:
         Acta Crystallographica Section A, 47(6):655-685 (1991)
         doi = 10.1107/S010876739101067X
 
+        The cell parameters are read with a lightweight parser of the common cell tags, the full CIF parser is only
+        used when those cannot be found. The results are cached on disk, so that loading the same file again is
+        immediate.
+
         .. note::
 
            Lattice constants are given in Angstrom in CIF files and so
            converted to nanometer.
 
         :param str file_path: The path to the CIF file representing the crystal structure.
+        :param bool use_cache: use the cache of the CIF files already read (True by default).
         :returns: A `Lattice` instance corresponding to the given CIF file.
         """
-        cf = CifFile.ReadCif(file_path)
-        # crystal = eval('cf[\'%s\']' % symbol)
-        crystal = cf.first_block()
-        a = 0.1 * float(crystal['_cell_length_a'])
-        b = 0.1 * float(crystal['_cell_length_b'])
-        c = 0.1 * float(crystal['_cell_length_c'])
-        alpha = float(crystal['_cell_angle_alpha'])
-        beta = float(crystal['_cell_angle_beta'])
-        gamma = float(crystal['_cell_angle_gamma'])
-        try:
-            symmetry = Symmetry.from_string(crystal['_symmetry_cell_setting'])
-        except KeyError:
+        (a, b, c, alpha, beta, gamma, setting) = Lattice._read_cif_parameters(file_path, use_cache=use_cache)
+        a, b, c = 0.1 * a, 0.1 * b, 0.1 * c
+        symmetry = Symmetry.from_string(setting) if setting is not None else None
+        if symmetry is None:
             symmetry = Lattice.guess_symmetry_from_parameters(a, b, c, alpha, beta, gamma)
         return Lattice.from_parameters(a, b, c, alpha, beta, gamma, symmetry=symmetry)
 
@@ -689,6 +801,22 @@ class Lattice:
             vector_c = [0.0, 0.0, float(c)]
         return Lattice([vector_a, vector_b, vector_c], centering=centering, symmetry=symmetry)
 
+    def centering_translations(self):
+        """Get the lattice translations associated with the centering of the unit cell.
+
+        :return: a (n, 3) numpy array with the translations in fractional coordinates, the first one being (0, 0, 0).
+        """
+        translations = {'P': [],
+                        'I': [(0.5, 0.5, 0.5)],
+                        'F': [(0., 0.5, 0.5), (0.5, 0., 0.5), (0.5, 0.5, 0.)],
+                        'A': [(0., 0.5, 0.5)],
+                        'B': [(0.5, 0., 0.5)],
+                        'C': [(0.5, 0.5, 0.)],
+                        'R': [(2. / 3, 1. / 3, 1. / 3), (1. / 3, 2. / 3, 2. / 3)]}
+        if self._centering not in translations:
+            raise ValueError('unsupported lattice centering: %s' % self._centering)
+        return np.array([(0., 0., 0.)] + translations[self._centering])
+
     def volume(self):
         """Compute the volume of the unit cell."""
         m = self._matrix
@@ -745,53 +873,171 @@ class SlipSystem:
         return SlipSystem(plane, direction)
 
     @staticmethod
-    def get_slip_systems(plane_type='111'):
+    def get_slip_systems(plane_type='111', lattice=None):
         '''A static method to get all slip systems for a given hkl plane family.
 
-        :params str plane_type: a string of the 3 miller indices of the crystallographic plane family.
+        :params str plane_type: the name of the slip family, see :py:class:`~pymicro.crystal.lattice.SlipFamily`.
+        :param Lattice lattice: The reference crystal lattice (default None).
         :returns list: a list of :py:class:`~pymicro.crystal.lattice.SlipSystem`.
+        '''
+        if plane_type not in SlipFamily.families:
+            print('warning only %s slip planes supported for the moment!' % ', '.join(sorted(SlipFamily.families)))
+            return []
+        return SlipFamily.get(plane_type, lattice).slip_systems()
+
+
+class SlipFamily:
+    '''A class to represent all the slip systems of a slip family with numpy arrays.
+
+    The slip plane normals, slip directions and Schmid tensors of all the slip systems are computed once in the
+    crystal frame and stored as (n_ss, 3) and (n_ss, 3, 3) arrays. Instances are shared through the `get` static
+    method, which memoizes them by family name and lattice:
 
-        .. warning::
+    ::
+
+      octahedral = SlipFamily.get('111')
+      sf = octahedral.schmid_factors(micro.get_orientation_matrices(), load_direction=[0., 0., 1.])
 
-          only working for 111 and 112 planes...
+    The supported families are the octahedral {111}<110> and cube {001}<110> slip for FCC crystals, the {110}<111>,
+    {112}<111> and {123}<111> slip for BCC crystals, and the 'basal' (0001)<11-20>, 'prismatic' {10-10}<11-20>,
+    'pyramidal' {10-11}<11-20> and 'pyramidal_ca' {10-11}<11-23> slip for HCP crystals. The families defined by a
+    single slip system are completed using the lattice symmetry.
+    '''
+    families = {
+        '001': (Symmetry.cubic,
+                [[0, 0, 1], [0, 0, 1], [1, 0, 0], [1, 0, 0], [0, 1, 0], [0, 1, 0]],  # E5, E6, F1, F2, G4, G3
+                [[-1, 1, 0], [1, 1, 0], [0, 1, 1], [0, -1, 1], [-1, 0, 1], [1, 0, 1]]),
+        '111': (Symmetry.cubic,
+                [[1, 1, 1], [1, 1, 1], [1, 1, 1],  # Bd, Ba, Bc
+                 [1, -1, 1], [1, -1, 1], [1, -1, 1],  # Db, Dc, Da
+                 [-1, 1, 1], [-1, 1, 1], [-1, 1, 1],  # Ab, Ad, Ac
+                 [1, 1, -1], [1, 1, -1], [1, 1, -1]],  # Cb, Ca, Cd
+                [[-1, 0, 1], [0, -1, 1], [-1, 1, 0],
+                 [-1, 0, 1], [0, 1, 1], [1, 1, 0],
+                 [0, -1, 1], [1, 1, 0], [1, 0, 1],
+                 [-1, 1, 0], [1, 0, 1], [0, 1, 1]]),
+        '110': (Symmetry.cubic, [[1, 1, 0]], [[1, -1, 1]]),
+        '112': (Symmetry.cubic,
+                [[1, 1, 2], [-1, 1, 2], [1, -1, 2], [1, 1, -2], [1, 2, 1], [-1, 2, 1],
+                 [1, -2, 1], [1, 2, -1], [2, 1, 1], [-2, 1, 1], [2, -1, 1], [2, 1, -1]],
+                [[1, 1, -1], [1, -1, 1], [-1, 1, 1], [1, 1, 1], [1, -1, 1], [1, 1, -1],
+                 [1, 1, 1], [-1, 1, 1], [-1, 1, 1], [1, 1, 1], [1, 1, -1], [1, -1, 1]]),
+        '123': (Symmetry.cubic, [[1, 2, 3]], [[1, 1, -1]]),
+        'basal': (Symmetry.hexagonal, [[0, 0, 0, 1]], [[2, -1, -1, 0]]),
+        'prismatic': (Symmetry.hexagonal, [[1, 0, -1, 0]], [[-1, 2, -1, 0]]),
+        'pyramidal': (Symmetry.hexagonal, [[1, 0, -1, 1]], [[-1, 2, -1, 0]]),
+        'pyramidal_ca': (Symmetry.hexagonal, [[1, 0, -1, 1]], [[-1, -1, 2, 3]]),
+    }
+    _library = {}
+
+    def __init__(self, name, lattice=None):
+        '''Create a new slip family, consider using `SlipFamily.get` to reuse already computed families.
+
+        :param str name: the name of the slip family (eg. '111' or 'basal').
+        :param Lattice lattice: the crystal lattice (a cubic lattice or a hexagonal lattice with the ideal c/a ratio
+          is used by default).
+        :raise ValueError: if the family is not supported.
         '''
-        slip_systems = []
-        if plane_type == '001':
-            slip_systems.append(SlipSystem(HklPlane(0, 0, 1), HklDirection(-1, 1, 0)))  # E5
-            slip_systems.append(SlipSystem(HklPlane(0, 0, 1), HklDirection(1, 1, 0)))  # E6
-            slip_systems.append(SlipSystem(HklPlane(1, 0, 0), HklDirection(0, 1, 1)))  # F1
-            slip_systems.append(SlipSystem(HklPlane(1, 0, 0), HklDirection(0, -1, 1)))  # F2
-            slip_systems.append(SlipSystem(HklPlane(0, 1, 0), HklDirection(-1, 0, 1)))  # G4
-            slip_systems.append(SlipSystem(HklPlane(0, 1, 0), HklDirection(1, 0, 1)))  # G3
-        elif plane_type == '111':
-            slip_systems.append(SlipSystem(HklPlane(1, 1, 1), HklDirection(-1, 0, 1)))  # Bd
-            slip_systems.append(SlipSystem(HklPlane(1, 1, 1), HklDirection(0, -1, 1)))  # Ba
-            slip_systems.append(SlipSystem(HklPlane(1, 1, 1), HklDirection(-1, 1, 0)))  # Bc
-            slip_systems.append(SlipSystem(HklPlane(1, -1, 1), HklDirection(-1, 0, 1)))  # Db
-            slip_systems.append(SlipSystem(HklPlane(1, -1, 1), HklDirection(0, 1, 1)))  # Dc
-            slip_systems.append(SlipSystem(HklPlane(1, -1, 1), HklDirection(1, 1, 0)))  # Da
-            slip_systems.append(SlipSystem(HklPlane(-1, 1, 1), HklDirection(0, -1, 1)))  # Ab
-            slip_systems.append(SlipSystem(HklPlane(-1, 1, 1), HklDirection(1, 1, 0)))  # Ad
-            slip_systems.append(SlipSystem(HklPlane(-1, 1, 1), HklDirection(1, 0, 1)))  # Ac
-            slip_systems.append(SlipSystem(HklPlane(1, 1, -1), HklDirection(-1, 1, 0)))  # Cb
-            slip_systems.append(SlipSystem(HklPlane(1, 1, -1), HklDirection(1, 0, 1)))  # Ca
-            slip_systems.append(SlipSystem(HklPlane(1, 1, -1), HklDirection(0, 1, 1)))  # Cd
-        elif plane_type == '112':
-            slip_systems.append(SlipSystem(HklPlane(1, 1, 2), HklDirection(1, 1, -1)))
-            slip_systems.append(SlipSystem(HklPlane(-1, 1, 2), HklDirection(1, -1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(1, -1, 2), HklDirection(-1, 1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(1, 1, -2), HklDirection(1, 1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(1, 2, 1), HklDirection(1, -1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(-1, 2, 1), HklDirection(1, 1, -1)))
-            slip_systems.append(SlipSystem(HklPlane(1, -2, 1), HklDirection(1, 1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(1, 2, -1), HklDirection(-1, 1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(2, 1, 1), HklDirection(-1, 1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(-2, 1, 1), HklDirection(1, 1, 1)))
-            slip_systems.append(SlipSystem(HklPlane(2, -1, 1), HklDirection(1, 1, -1)))
-            slip_systems.append(SlipSystem(HklPlane(2, 1, -1), HklDirection(1, -1, 1)))
-        else:
-            print 'warning only 001, 111 or 112 slip planes supported for the moment!'
-        return slip_systems
+        if name not in SlipFamily.families:
+            raise ValueError('unsupported slip family: %s' % name)
+        symmetry, planes, directions = SlipFamily.families[name]
+        if lattice is None:
+            if symmetry is Symmetry.hexagonal:
+                lattice = Lattice.hexagonal(1.0, np.sqrt(8. / 3))
+            else:
+                lattice = Lattice.cubic(1.0)
+        self.name = name
+        self.lattice = lattice
+        planes = np.array(planes)
+        directions = np.array(directions)
+        if planes.shape[1] == 4:
+            # convert Miller-Bravais indices to Miller indices
+            planes = planes[:, [0, 1, 3]]
+            directions = directions[:, [0, 1, 3]] - directions[:, [2, 2, 2]] * [1, 1, 0]
+            directions //= np.gcd.reduce(directions, axis=1)[:, np.newaxis]
+        if len(planes) == 1:
+            planes, directions = SlipFamily._generate(lattice, symmetry, planes[0], directions[0])
+        self.plane_indices = planes
+        self.direction_indices = directions
+        normals = np.dot(planes, lattice.reciprocal_matrix)
+        self.normals = normals / np.linalg.norm(normals, axis=1)[:, np.newaxis]
+        directions = np.dot(directions, lattice.matrix)
+        self.directions = directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]
+        self.schmid_tensors = np.einsum('si,sj->sij', self.directions, self.normals)
+        self.sym_tensors = 0.5 * (self.schmid_tensors + self.schmid_tensors.transpose(0, 2, 1))
+        self.skew_tensors = 0.5 * (self.schmid_tensors - self.schmid_tensors.transpose(0, 2, 1))
+
+    @staticmethod
+    def get(name, lattice=None):
+        '''Get the slip family with the given name, the arrays are computed only once for each lattice.
+
+        :param str name: the name of the slip family (eg. '111' or 'basal').
+        :param Lattice lattice: the crystal lattice (default None).
+        :returns: a `SlipFamily` instance.
+        '''
+        key = (name, None if lattice is None else (tuple(lattice._matrix.ravel()), lattice._centering))
+        if key not in SlipFamily._library:
+            SlipFamily._library[key] = SlipFamily(name, lattice)
+        return SlipFamily._library[key]
+
+    @staticmethod
+    def _generate(lattice, symmetry, plane, direction):
+        '''Generate all the slip systems equivalent to one slip system by symmetry.
+
+        The slip systems (n, l), (-n, l), (n, -l) and (-n, -l) are considered identical, only one is retained.
+        '''
+        T_planes = lattice.hkl_symmetry_operators(symmetry)
+        # symmetry operators for the direction indices
+        M = lattice.matrix.T
+        T_directions = np.round(np.einsum('ij,njk,kl->nil', np.linalg.inv(M), symmetry.symmetry_operators(), M))
+        planes = np.dot(T_planes, plane)
+        directions = np.dot(T_directions, direction).astype(int)
+
+        def canonical(hkl):
+            # make the first non zero index positive
+            sign = np.sign(hkl[np.arange(len(hkl)), np.argmax(hkl != 0, axis=1)])
+            return hkl * sign[:, np.newaxis]
+
+        planes, directions = canonical(planes), canonical(directions)
+        m = max(np.abs(planes).max(), np.abs(directions).max())
+        base = 2 * m + 1
+        codes = np.dot(np.hstack((planes, directions)) + m, base ** np.arange(5, -1, -1))
+        first = np.sort(np.unique(codes, return_index=True)[1])
+        return planes[first], directions[first]
+
+    def __len__(self):
+        return len(self.plane_indices)
+
+    def __repr__(self):
+        return '%s %s (%d slip systems)' % (self.__class__.__name__, self.name, len(self))
+
+    def slip_systems(self):
+        '''Create the list of :py:class:`~pymicro.crystal.lattice.SlipSystem` instances of this family.'''
+        return [SlipSystem.from_indices(p, d, self.lattice)
+                for (p, d) in zip(self.plane_indices.tolist(), self.direction_indices.tolist())]
+
+    def orientation_tensors(self, orientations, tensor='schmid'):
+        '''Express the tensors of all the slip systems in the laboratory frame for a series of orientations.
+
+        :param orientations: a (n, 3, 3) array of orientation matrices (a single (3, 3) matrix is also accepted).
+        :param str tensor: the tensor to rotate, 'schmid' (:math:`l^s \\otimes n^s`, default), 'sym' or 'skew'
+          (its symmetric or skew-symmetric parts).
+        :returns: a (n, n_ss, 3, 3) numpy array.
+        '''
+        m = {'schmid': self.schmid_tensors, 'sym': self.sym_tensors, 'skew': self.skew_tensors}[tensor]
+        g = np.asarray(orientations, dtype=float).reshape(-1, 3, 3)
+        return np.einsum('nji,nsjl->nsil', g, np.einsum('sjk,nkl->nsjl', m, g))
+
+    def schmid_factors(self, orientations, load_direction=[0., 0., 1]):
+        '''Compute the Schmid factors of all the slip systems for a series of orientations.
+
+        :param orientations: a (n, 3, 3) array of orientation matrices (a single (3, 3) matrix is also accepted).
+        :param load_direction: a unit vector describing the loading direction (default: vertical axis [0, 0, 1]).
+        :returns: a (n, n_ss) numpy array of the Schmid factors.
+        '''
+        g = np.asarray(orientations, dtype=float).reshape(-1, 3, 3)
+        load_crystal = np.dot(g, load_direction)  # loading direction in the crystal frame
+        return np.abs(np.dot(load_crystal, self.normals.T) * np.dot(load_crystal, self.directions.T))
 
 
 class HklObject:
@@ -812,6 +1058,55 @@ class HklObject:
         '''
         return (self._h, self._k, self._l)
 
+    @staticmethod
+    def miller_indices_grid(max_miller):
+        """Enumerate all the Miller indices up to a maximum value.
+
+        :param int max_miller: the maximum absolute value of the Miller indices.
+        :returns: a (n, 3) numpy array of all the Miller indices except (0, 0, 0).
+        """
+        r = slice(-max_miller, max_miller + 1)
+        hkl = np.mgrid[r, r, r].reshape(3, -1).T
+        return hkl[np.any(hkl != 0, axis=1)]
+
+    @staticmethod
+    def skip_higher_order_indices(hkl, keep_friedel_pair=False):
+        """Find the first order entries in an array of Miller indices.
+
+        Each Miller triplet is reduced by the greatest common divisor of its indices, the triplets
+        with the same reduced indices are then the different orders of the same hkl object and only
+        the one with the lowest order is retained. This works directly on arrays of Miller indices
+        (for instance the `hkl` field of a `ReflectionTable`) and runs in O(n log n).
+
+        :param hkl: a (n, 3) array like of Miller indices.
+        :param bool keep_friedel_pair: flag to keep order -1 (so both (h, k, l) and (-h, -k, -l)) in the result.
+        :returns: an array of the indices of the retained entries, sorted by ascending sum of the absolute
+          values of the Miller indices.
+        """
+        hkl = np.asarray(hkl, dtype=int).reshape(-1, 3)
+        if len(hkl) == 0:
+            return np.empty(0, dtype=int)
+        hkl_sum = np.sum(np.abs(hkl), axis=1)
+        order = np.argsort(hkl_sum, kind='mergesort')
+        hkl, hkl_sum = hkl[order], hkl_sum[order]
+        gcd = np.gcd.reduce(hkl, axis=1)
+        gcd[gcd == 0] = 1
+        reduced = hkl // gcd[:, np.newaxis]
+        # make the first non zero index positive so that the Friedel pairs have the same reduced indices
+        sign = np.sign(reduced[np.arange(len(hkl)), np.argmax(reduced != 0, axis=1)])
+        sign[sign == 0] = 1
+        m = np.abs(hkl).max()
+        base = 2 * m + 1
+        weights = np.array([base ** 2, base, 1])
+        codes = np.dot(reduced * sign[:, np.newaxis] + m, weights)
+        _, first, group = np.unique(codes, return_index=True, return_inverse=True)
+        if not keep_friedel_pair:
+            return order[np.sort(first)]
+        # keep all the distinct entries with the lowest order in each group
+        lowest = np.where(hkl_sum == hkl_sum[first][group])[0]
+        _, first = np.unique(np.dot(hkl[lowest] + m, weights), return_index=True)
+        return order[lowest[np.sort(first)]]
+
     @staticmethod
     def skip_higher_order(hkl_list, keep_friedel_pair=False, verbose=False):
         """Create a copy of a list of some hkl object retaining only the first order.
@@ -821,45 +1116,11 @@ class HklObject:
         :param bool verbose: activate verbose mode.
         :returns list: A new list of :py:class:`~pymicro.crystal.lattice.HklObject` without any multiple reflection.
         """
-        # create array with all the miller indices
-        hkl_array = np.empty((len(hkl_list), 3), dtype=int)
-        for i in range(len(hkl_list)):
-            hkl = hkl_list[i]
-            hkl_array[i] = np.array(hkl.miller_indices())
-        # first start by ordering the HklObjects by ascending miller indices sum
-        hkl_sum = np.sum(np.abs(hkl_array), axis=1)
-        hkl_sum_sort = np.argsort(hkl_sum)
-        first_order_list = [hkl_list[hkl_sum_sort[0]]]
-        for i in range(1, len(hkl_sum_sort)):
-            hkl_next = hkl_sum_sort[i]
-            hkl = hkl_list[hkl_next]
-            (h, k, l) = hkl.miller_indices()
-            if verbose:
-                print('trying hkl object (%d, %d, %d)' % (h, k, l))
-            lower = False
-            # check if a hkl object already exist in the list
-            for uvw in first_order_list:
-                # try to assess the multiple from the sum of miller indices
-                (u, v, w) = uvw.miller_indices()
-                if verbose:
-                    print('looking at: (%d, %d, %d)' % (u, v, w))
-                n = hkl_sum[hkl_next] / np.sum(np.abs(np.array((u, v, w))), axis=0)
-                for order in [-n, n]:
-                    if keep_friedel_pair and order == -1:
-                        if verbose:
-                            print('keeping Friedel pair reflexion: (%d, %d, %d) with n=%d' % (u, v, w, order))
-                        continue
-                    if (u * order == h) and (v * order == k) and (w * order) == l:
-                        if verbose:
-                            print('lower order reflexion was found: (%d, %d, %d) with n=%d' % (u, v, w, order))
-                        lower = True
-                        break
-            # if no lower order reflexion was found, add the hkl object to the list
-            if not lower:
-                if verbose:
-                    print('adding hkl object (%d, %d, %d) to the list' % (h, k, l))
-                first_order_list.append(hkl)
-        return first_order_list
+        hkl_array = np.array([hkl.miller_indices() for hkl in hkl_list], dtype=int)
+        index = HklObject.skip_higher_order_indices(hkl_array, keep_friedel_pair=keep_friedel_pair)
+        if verbose:
+            print('%d first order hkl objects retained out of %d' % (len(index), len(hkl_list)))
+        return [hkl_list[i] for i in index]
 
 
 class HklDirection(HklObject):
@@ -932,27 +1193,24 @@ class HklDirection(HklObject):
                  np.sqrt(h2 ** 2 + k2 ** 2 + i2 ** 2 + lambda_square * l2 ** 2))
         return np.arccos(value)
 
-    def find_planes_in_zone(self, max_miller=5):
+    def find_planes_in_zone(self, max_miller=5, as_table=False):
         '''
         This method finds the hkl planes in zone with the crystallographic
         direction. If (u,v,w) denotes the zone axis, this means finding all
         hkl planes which verify :math:`h.u + k.v + l.w = 0`.
 
+        All the Miller indices are tested at once with a single dot product.
+
         :param max_miller: The maximum miller index to limt the search`
+        :param bool as_table: return a `ReflectionTable` instead of a list (False by default).
         :returns list: A list of :py:class:`~pymicro.crystal.lattice.HklPlane` objects \
-        describing all the planes in zone with the direction.
+        describing all the planes in zone with the direction (or a `ReflectionTable`).
         '''
-        (u, v, w) = self.miller_indices()
-        indices = range(-max_miller, max_miller + 1)
-        hklplanes_in_zone = []
-        for h in indices:
-            for k in indices:
-                for l in indices:
-                    if h == k == l == 0:  # skip (0, 0, 0)
-                        continue
-                    if np.dot(np.array([h, k, l]), np.array([u, v, w])) == 0:
-                        hklplanes_in_zone.append(HklPlane(h, k, l, self._lattice))
-        return hklplanes_in_zone
+        hkl = HklObject.miller_indices_grid(max_miller)
+        hkl = hkl[np.dot(hkl, self.miller_indices()) == 0]
+        if as_table:
+            return ReflectionTable(hkl, self._lattice)
+        return [HklPlane(h, k, l, self._lattice) for (h, k, l) in hkl.tolist()]
 
 
 class HklPlane(HklObject):
@@ -1014,10 +1272,8 @@ class HklPlane(HklObject):
 
         :returns: a numpy vector expressed in the cartesian coordinate system of the crystal.
         '''
-        [astar, bstar, cstar] = self._lattice.reciprocal_lattice()
-        (h, k, l) = self.miller_indices()
         # express (h, k, l) in the cartesian crystal CS
-        Gc = h * astar + k * bstar + l * cstar
+        Gc = np.dot(self.miller_indices(), self._lattice.reciprocal_matrix)
         return Gc
 
     def __repr__(self):
@@ -1047,21 +1303,11 @@ class HklPlane(HklObject):
            d = a / \sqrt{h^2 + k^2 + l^2}
 
         The general formula comes from 'Introduction to Crystallography'
-        p. 68 by Donald E. Sands.
+        p. 68 by Donald E. Sands, it is equal to the inverse of the norm of the
+        scattering vector.
         '''
-        (a, b, c) = self._lattice._lengths
-        (h, k, l) = self.miller_indices()
-        (alpha, beta, gamma) = radians(self._lattice._angles)
-        # d = a / np.sqrt(h**2 + k**2 + l**2) # for cubic structure only
-        d = self._lattice.volume() / np.sqrt(h ** 2 * b ** 2 * c ** 2 * np.sin(alpha) ** 2 + \
-                                             k ** 2 * a ** 2 * c ** 2 * np.sin(
-                                                 beta) ** 2 + l ** 2 * a ** 2 * b ** 2 * np.sin(gamma) ** 2 + \
-                                             2 * h * l * a * b ** 2 * c * (
-                                                 np.cos(alpha) * np.cos(gamma) - np.cos(beta)) + \
-                                             2 * h * k * a * b * c ** 2 * (
-                                                 np.cos(alpha) * np.cos(beta) - np.cos(gamma)) + \
-                                             2 * k * l * a ** 2 * b * c * (
-                                                 np.cos(beta) * np.cos(gamma) - np.cos(alpha)))
+        # this is the inverse of the norm of the scattering vector
+        d = 1. / np.linalg.norm(self.scattering_vector())
         return d
 
     def bragg_angle(self, lambda_keV, verbose=False):
@@ -1107,24 +1353,107 @@ class HklPlane(HklObject):
             return self in hkl_planes or self.friedel_pair() in hkl_planes
 
     @staticmethod
-    def is_same_family(hkl1, hkl2, crystal_structure=Symmetry.cubic):
+    def is_same_family(hkl1, hkl2, crystal_structure=None):
         """Static method to test if both lattice planes belongs to the same family.
         
         A family {hkl} is composed by all planes that are equivalent to (hkl) using the symmetry of the lattice. 
-        The lattice assoiated with `hkl2`is not taken into account here.
+        The lattice assoiated with `hkl2`is not taken into account here. Since the Laue classes are
+        centrosymmetric, a plane and its Friedel pair belong to the same family.
         """
-        return hkl1.is_in_list(HklPlane.get_family(hkl2.miller_indices(), lattice=hkl1._lattice,
-                                                   crystal_structure=crystal_structure))
+        members = HklPlane.get_family_set(hkl2.miller_indices(), lattice=hkl1._lattice,
+                                          include_friedel_pairs=True, crystal_structure=crystal_structure)
+        return tuple(hkl1.miller_indices()) in members
+
+    _family_cache = {}
+
+    @staticmethod
+    def _family_key(hkl, lattice=None, include_friedel_pairs=False, crystal_structure=None):
+        """Parse the arguments of the family methods into a memoization key."""
+        if crystal_structure is None:
+            # use the symmetry of the lattice if known, cubic otherwise
+            crystal_structure = getattr(lattice, '_symmetry', None) or Symmetry.cubic
+        if isinstance(crystal_structure, str):
+            crystal_structure = Symmetry.from_string(crystal_structure)
+        if len(hkl) == 4 and crystal_structure == Symmetry.hexagonal:
+            (h, k, l) = HklPlane.four_to_three_indices(int(hkl[0]), int(hkl[1]), int(hkl[2]), int(hkl[3]))
+        elif not len(hkl) == 3:
+            raise ValueError('warning, family not supported: %s' % hkl)
+        else:
+            (h, k, l) = (int(hkl[0]), int(hkl[1]), int(hkl[2]))
+        if lattice is None:
+            # use a reference lattice compatible with the symmetry
+            if crystal_structure in [Symmetry.hexagonal, Symmetry.trigonal]:
+                lattice = Lattice.hexagonal(1.0, 1.0)
+            else:
+                lattice = Lattice.cubic(1.0)
+        return (h, k, l), lattice, crystal_structure, bool(include_friedel_pairs)
+
+    @staticmethod
+    def _family(hkl, lattice=None, include_friedel_pairs=False, crystal_structure=None):
+        """Compute (once) the Miller indices array and set of a family of lattice planes."""
+        (h, k, l), lattice, symmetry, friedel = HklPlane._family_key(hkl, lattice, include_friedel_pairs,
+                                                                     crystal_structure)
+        key = ((h, k, l), tuple(lattice._matrix.ravel()), symmetry, friedel)
+        if key in HklPlane._family_cache:
+            return HklPlane._family_cache[key]
+        hkl_sym = np.dot(lattice.hkl_symmetry_operators(symmetry), [h, k, l])
+        if friedel:
+            # interleave each equivalent plane with its Friedel pair
+            hkl_sym = np.stack((hkl_sym, -hkl_sym), axis=1).reshape(-1, 3)
+        m = max(np.abs(hkl_sym).max(), 1)
+        base = 2 * m + 1
+        codes = np.dot(hkl_sym + m, [base ** 2, base, 1])
+        if not friedel:
+            codes = np.minimum(codes, np.dot(m - hkl_sym, [base ** 2, base, 1]))
+        first = np.sort(np.unique(codes, return_index=True)[1])
+        family = hkl_sym[first]
+        if not friedel:
+            # for each hkl plane chose between (h, k, l) and (-h, -k, -l) to have the less minus signs
+            flip = np.any(family < 0, axis=1) & (np.sum(family <= 0, axis=1) >= 2)
+            family[flip] *= -1
+        family.flags.writeable = False
+        HklPlane._family_cache[key] = (family, frozenset(map(tuple, family.tolist())), lattice)
+        return HklPlane._family_cache[key]
 
     @staticmethod
-    def get_family(hkl, lattice=None, include_friedel_pairs=False, crystal_structure=Symmetry.cubic):
+    def get_family_indices(hkl, lattice=None, include_friedel_pairs=False, crystal_structure=None):
+        """Static method to obtain the Miller indices of the planes in a particular family.
+
+        The family is generated by applying the symmetry operators expressed in the basis of the Miller
+        indices (see :py:meth:`~pymicro.crystal.lattice.Lattice.hkl_symmetry_operators`) to (hkl). The
+        duplicates are removed using an integer code of the indices, and the result is memoized by Miller
+        indices, lattice, symmetry and Friedel pair flag, so that each family is only computed once.
+
+        :param hkl: a string or a sequence of 3 (or 4 for hexagonal) numbers corresponding to the miller indices.
+        :param Lattice lattice: The reference crystal lattice (default None).
+        :param bool include_friedel_pairs: Flag to include the Friedel pairs in the family (False by default).
+        :param crystal_structure: the `Symmetry` of the crystal (None by default to use the lattice symmetry,
+          or the cubic symmetry if no lattice is given).
+        :raise ValueError: if the given string does not correspond to a supported family.
+        :returns: a read-only (n, 3) numpy array of the Miller indices in the family.
+        """
+        return HklPlane._family(hkl, lattice, include_friedel_pairs, crystal_structure)[0]
+
+    @staticmethod
+    def get_family_set(hkl, lattice=None, include_friedel_pairs=False, crystal_structure=None):
+        """Static method to obtain the family of a lattice plane as a set of Miller indices tuples.
+
+        This is useful to test family membership, see `get_family_indices` for the parameters.
+
+        :returns frozenset: the set of the Miller indices tuples in the family.
+        """
+        return HklPlane._family(hkl, lattice, include_friedel_pairs, crystal_structure)[1]
+
+    @staticmethod
+    def get_family(hkl, lattice=None, include_friedel_pairs=False, crystal_structure=None):
         """Static method to obtain a list of the different crystallographic
         planes in a particular family.
 
         :param str hkl: a string of 3 numbers corresponding to the miller indices.
         :param Lattice lattice: The reference crystal lattice (default None).
         :param bool include_friedel_pairs: Flag to include the Friedel pairs in the list (False by default).
-        :param str crystal_structure: A string descibing the crystal structure (cubic by default). 
+        :param str crystal_structure: A string descibing the crystal structure (None by default to use the
+          lattice symmetry, or cubic if no lattice is given).
         :raise ValueError: if the given string does not correspond to a supported family.
         :returns list: a list of the :py:class:`~pymicro.crystal.lattice.HklPlane` in the given hkl family.
 
@@ -1135,218 +1464,19 @@ class HklPlane(HklObject):
           family is contstructed using the miller indices limited the number of minus signs. For instance  (1,0,0) 
           will be in the list and not (-1,0,0).
         """
-        if len(hkl) == 4 and crystal_structure == Symmetry.hexagonal:
-            (h, k, l) = HklPlane.four_to_three_indices(int(hkl[0]), int(hkl[1]), int(hkl[2]), int(hkl[3]))
-        elif not len(hkl) == 3:
-            raise ValueError('warning, family not supported: %s' % hkl)
-        else:
-            h = int(hkl[0])
-            k = int(hkl[1])
-            l = int(hkl[2])
-        print(h, k, l)
-        family = []
-        # construct lattice plane family from symmetry operators
-        syms = Lattice.symmetry(crystal_structure)
-        for sym in syms:
-            n_sym = np.dot(sym, np.array([h, k, l]))#.astype(np.int)
-            hkl_sym = HklPlane(n_sym[0], n_sym[1], n_sym[2], lattice=lattice)
-            if not hkl_sym.is_in_list(family, friedel_pair=True):  # not include_friedel_pairs):
-                family.append(hkl_sym)
-            if include_friedel_pairs:
-                hkl_sym = HklPlane(-n_sym[0], -n_sym[1], -n_sym[2], lattice=lattice)
-                if not hkl_sym.is_in_list(family, friedel_pair=False):  # not include_friedel_pairs):
-                    family.append(hkl_sym)
-        if not include_friedel_pairs:
-            # for each hkl plane chose between (h, k, l) and (-h, -k, -l) to have the less minus signs
-            for i in range(len(family)):
-                hkl = family[i]
-                (h, k, l) = hkl.miller_indices()
-                if np.where(np.array([h, k, l]) < 0)[0].size > 0 and np.where(np.array([h, k, l]) <= 0)[0].size >= 2:
-                    family[i] = hkl.friedel_pair()
-                    #print('replacing plane (%d%d%d) by its pair: (%d%d%d)' % (h, k, l, -h, -k, -l))
+        family, _, ref_lattice = HklPlane._family(hkl, lattice, include_friedel_pairs, crystal_structure)
+        if lattice is None:
+            lattice = ref_lattice
+        return [HklPlane(h, k, l, lattice) for (h, k, l) in family.tolist()]
 
+    def multiplicity(self, symmetry=None):
+        """compute the general multiplicity for this `HklPlane` and the given symmetry.
 
-        '''
-        if not len(hkl) == 3:
-            raise ValueError('warning, family not supported: %s' % hkl)
-        family = []
-        hkl_list = list(hkl)
-        hkl_list.sort()  # miller indices are now sorted by increasing order
-        h = int(hkl[0])
-        k = int(hkl[1])
-        l = int(hkl[2])
-        if hkl == '001' or hkl == '010' or hkl == '100':
-            family.append(HklPlane(1, 0, 0, lattice))
-            family.append(HklPlane(0, 1, 0, lattice))
-            family.append(HklPlane(0, 0, 1, lattice))
-        elif hkl in ['011', '101', '110']:
-            family.append(HklPlane(1, 1, 0, lattice))
-            family.append(HklPlane(-1, 1, 0, lattice))
-            family.append(HklPlane(1, 0, 1, lattice))
-            family.append(HklPlane(-1, 0, 1, lattice))
-            family.append(HklPlane(0, 1, 1, lattice))
-            family.append(HklPlane(0, -1, 1, lattice))
-        elif hkl == '111':
-            family.append(HklPlane(1, 1, 1, lattice))
-            family.append(HklPlane(-1, 1, 1, lattice))
-            family.append(HklPlane(1, -1, 1, lattice))
-            family.append(HklPlane(1, 1, -1, lattice))
-        elif hkl in ['112', '121', '211']:
-            family.append(HklPlane(1, 1, 2, lattice))
-            family.append(HklPlane(-1, 1, 2, lattice))
-            family.append(HklPlane(1, -1, 2, lattice))
-            family.append(HklPlane(1, 1, -2, lattice))
-            family.append(HklPlane(1, 2, 1, lattice))
-            family.append(HklPlane(-1, 2, 1, lattice))
-            family.append(HklPlane(1, -2, 1, lattice))
-            family.append(HklPlane(1, 2, -1, lattice))
-            family.append(HklPlane(2, 1, 1, lattice))
-            family.append(HklPlane(-2, 1, 1, lattice))
-            family.append(HklPlane(2, -1, 1, lattice))
-            family.append(HklPlane(2, 1, -1, lattice))
-        elif hkl in ['113', '131', '311']:
-            family.append(HklPlane(1, 1, 3, lattice))
-            family.append(HklPlane(-1, 1, 3, lattice))
-            family.append(HklPlane(1, -1, 3, lattice))
-            family.append(HklPlane(1, 1, -3, lattice))
-            family.append(HklPlane(1, 3, 1, lattice))
-            family.append(HklPlane(-1, 3, 1, lattice))
-            family.append(HklPlane(1, -3, 1, lattice))
-            family.append(HklPlane(1, 3, -1, lattice))
-            family.append(HklPlane(3, 1, 1, lattice))
-            family.append(HklPlane(-3, 1, 1, lattice))
-            family.append(HklPlane(3, -1, 1, lattice))
-            family.append(HklPlane(3, 1, -1, lattice))
-        elif hkl in ['331', '313', '133']:
-            family.append(HklPlane(3, 3, 1, lattice))
-            family.append(HklPlane(-3, 3, 1, lattice))
-            family.append(HklPlane(3, -3, 1, lattice))
-            family.append(HklPlane(3, 3, -1, lattice))
-            family.append(HklPlane(3, 1, 3, lattice))
-            family.append(HklPlane(-3, 1, 3, lattice))
-            family.append(HklPlane(3, -1, 3, lattice))
-            family.append(HklPlane(3, 1, -3, lattice))
-            family.append(HklPlane(1, 3, 3, lattice))
-            family.append(HklPlane(-1, 3, 3, lattice))
-            family.append(HklPlane(1, -3, 3, lattice))
-            family.append(HklPlane(1, 3, -3, lattice))
-        elif hkl in ['662', '626', '266']:
-            family.append(HklPlane(6, 6, 2, lattice))
-            family.append(HklPlane(-6, 6, 2, lattice))
-            family.append(HklPlane(6, -6, 2, lattice))
-            family.append(HklPlane(6, 6, -2, lattice))
-            family.append(HklPlane(6, 2, 6, lattice))
-            family.append(HklPlane(-6, 2, 6, lattice))
-            family.append(HklPlane(6, -2, 6, lattice))
-            family.append(HklPlane(6, 2, -6, lattice))
-            family.append(HklPlane(2, 6, 6, lattice))
-            family.append(HklPlane(-2, 6, 6, lattice))
-            family.append(HklPlane(2, -6, 6, lattice))
-            family.append(HklPlane(2, 6, -6, lattice))
-        elif hkl == '002':
-            family.append(HklPlane(2, 0, 0, lattice))
-            family.append(HklPlane(0, 2, 0, lattice))
-            family.append(HklPlane(0, 0, 2, lattice))
-        elif hkl == '022':
-            family.append(HklPlane(2, 2, 0, lattice))
-            family.append(HklPlane(-2, 2, 0, lattice))
-            family.append(HklPlane(2, 0, 2, lattice))
-            family.append(HklPlane(-2, 0, 2, lattice))
-            family.append(HklPlane(0, 2, 2, lattice))
-            family.append(HklPlane(0, -2, 2, lattice))
-        elif hkl == '123':
-            family.append(HklPlane(1, 2, 3, lattice))
-            family.append(HklPlane(-1, 2, 3, lattice))
-            family.append(HklPlane(1, -2, 3, lattice))
-            family.append(HklPlane(1, 2, -3, lattice))
-            family.append(HklPlane(3, 1, 2, lattice))
-            family.append(HklPlane(-3, 1, 2, lattice))
-            family.append(HklPlane(3, -1, 2, lattice))
-            family.append(HklPlane(3, 1, -2, lattice))
-            family.append(HklPlane(2, 3, 1, lattice))
-            family.append(HklPlane(-2, 3, 1, lattice))
-            family.append(HklPlane(2, -3, 1, lattice))
-            family.append(HklPlane(2, 3, -1, lattice))
-            family.append(HklPlane(1, 3, 2, lattice))
-            family.append(HklPlane(-1, 3, 2, lattice))
-            family.append(HklPlane(1, -3, 2, lattice))
-            family.append(HklPlane(1, 3, -2, lattice))
-            family.append(HklPlane(2, 1, 3, lattice))
-            family.append(HklPlane(-2, 1, 3, lattice))
-            family.append(HklPlane(2, -1, 3, lattice))
-            family.append(HklPlane(2, 1, -3, lattice))
-            family.append(HklPlane(3, 2, 1, lattice))
-            family.append(HklPlane(-3, 2, 1, lattice))
-            family.append(HklPlane(3, -2, 1, lattice))
-            family.append(HklPlane(3, 2, -1, lattice))
-        elif len(np.unique(list(hkl))) == 1 and not '0' in hkl:
-            # hhh planes -> 4 planes
-            family.append(HklPlane(h, h, h, lattice))
-            family.append(HklPlane(-h, h, h, lattice))
-            family.append(HklPlane(h, -h, h, lattice))
-            family.append(HklPlane(h, h, -h, lattice))
-        elif len(np.unique(hkl_list)) == 2 and hkl_list[0] == hkl_list[1] and not '0' in hkl:
-            # 2 different ints, hhl type -> 12 planes
-            family.append(HklPlane(h, h, l, lattice))
-            family.append(HklPlane(-h, h, l, lattice))
-            family.append(HklPlane(h, -h, l, lattice))
-            family.append(HklPlane(h, h, -l, lattice))
-            family.append(HklPlane(h, l, h, lattice))
-            family.append(HklPlane(-h, l, h, lattice))
-            family.append(HklPlane(h, -l, h, lattice))
-            family.append(HklPlane(h, l, -h, lattice))
-            family.append(HklPlane(l, h, h, lattice))
-            family.append(HklPlane(-l, h, h, lattice))
-            family.append(HklPlane(l, -h, h, lattice))
-            family.append(HklPlane(l, h, -h, lattice))
-        elif len(np.unique(hkl_list)) == 2 and hkl_list[1] == hkl_list[2] and not '0' in hkl:
-            # 2 different ints, hkk type -> 12 planes
-            family.append(HklPlane(k, k, h, lattice))
-            family.append(HklPlane(-k, k, h, lattice))
-            family.append(HklPlane(k, -k, h, lattice))
-            family.append(HklPlane(k, k, -h, lattice))
-            family.append(HklPlane(k, h, k, lattice))
-            family.append(HklPlane(-k, h, k, lattice))
-            family.append(HklPlane(k, -h, k, lattice))
-            family.append(HklPlane(k, h, -k, lattice))
-            family.append(HklPlane(h, k, k, lattice))
-            family.append(HklPlane(-h, k, k, lattice))
-            family.append(HklPlane(h, -k, k, lattice))
-            family.append(HklPlane(h, k, -k, lattice))
-        elif len(np.unique(list(hkl))) == 3 and not '0' in hkl:
-            # 3 different ints, all nonzeros -> 24 planes
-            family.append(HklPlane(h, k, l, lattice))
-            family.append(HklPlane(-h, k, l, lattice))
-            family.append(HklPlane(h, -k, l, lattice))
-            family.append(HklPlane(h, k, -l, lattice))
-            family.append(HklPlane(l, h, k, lattice))
-            family.append(HklPlane(-l, h, k, lattice))
-            family.append(HklPlane(l, -h, k, lattice))
-            family.append(HklPlane(l, h, -k, lattice))
-            family.append(HklPlane(k, l, h, lattice))
-            family.append(HklPlane(-k, l, h, lattice))
-            family.append(HklPlane(k, -l, h, lattice))
-            family.append(HklPlane(k, l, -h, lattice))
-            family.append(HklPlane(h, l, k, lattice))
-            family.append(HklPlane(-h, l, k, lattice))
-            family.append(HklPlane(h, -l, k, lattice))
-            family.append(HklPlane(h, l, -k, lattice))
-            family.append(HklPlane(k, h, l, lattice))
-            family.append(HklPlane(-k, h, l, lattice))
-            family.append(HklPlane(k, -h, l, lattice))
-            family.append(HklPlane(k, h, -l, lattice))
-            family.append(HklPlane(l, k, h, lattice))
-            family.append(HklPlane(-l, k, h, lattice))
-            family.append(HklPlane(l, -k, h, lattice))
-            family.append(HklPlane(l, k, -h, lattice))
-        else:
-            raise ValueError('warning, family not supported: %s' % hkl)
-        '''
-        return family
-
-    def multiplicity(self, symmetry='cubic'):
-        """compute the general multiplicity for this `HklPlane` and the given symmetry."""
-        return len(HklPlane.get_family(self.miller_indices(), include_friedel_pairs=True, crystal_structure=symmetry))
+        :param symmetry: the `Symmetry` to use (None by default to use the symmetry of the plane lattice, or the
+          cubic symmetry if the plane has no lattice).
+        """
+        return len(HklPlane.get_family_indices(self.miller_indices(), lattice=self._lattice,
+                                               include_friedel_pairs=True, crystal_structure=symmetry))
 
     def slip_trace(self, orientation, n_int=np.array([0, 0, 1]), view_up=np.array([0, 1, 0]), trace_size=100, verbose=False):
         """
@@ -1382,6 +1512,81 @@ class HklPlane(HklObject):
             print('trace in (XpYpZp):', trace)
         return trace
 
+    @staticmethod
+    def slip_traces(orientations, hkl='111', lattice=None, n_int=np.array([0, 0, 1]),
+                    view_up=np.array([0, 1, 0]), trace_size=1., crystal_structure=None):
+        """
+        Compute the slip traces of a family of planes for many crystal orientations at once.
+
+        This is the batched version of `slip_trace`: the plane normals are computed
+        once and all the traces are obtained with vectorized operations.
+
+        :param orientations: a (n, 3, 3) array of orientation matrices or a list of `Orientation` instances.
+        :param hkl: the slip plane family (eg. '111' or '110') or a list of `HklPlane` instances.
+        :param Lattice lattice: The reference crystal lattice (default None).
+        :param n_int: normal to the plane of intersection (laboratory local frame).
+        :param view_up: vector to place upwards on the plot.
+        :param float trace_size: size of the traces.
+        :param crystal_structure: the `Symmetry` used to build the family (the lattice symmetry by default).
+        :return: a (n_grains, n_planes, 2) numpy array with the trace vectors in the intersection plane
+          (traces are zero if the slip plane is parallel to the intersection plane).
+        """
+        if isinstance(hkl, str):
+            hkl_planes = HklPlane.get_family(hkl, lattice=lattice, crystal_structure=crystal_structure)
+        else:
+            hkl_planes = hkl
+        normals = np.array([plane.normal() for plane in hkl_planes])
+        if hasattr(orientations[0], 'orientation_matrix'):
+            orientations = [o.orientation_matrix() for o in orientations]
+        g = np.asarray(orientations, dtype=float).reshape(-1, 3, 3)
+        n_rot = np.einsum('nji,pj->npi', g, normals)
+        Zp = np.asarray(n_int, dtype=float) / np.linalg.norm(n_int)
+        Yp = np.asarray(view_up, dtype=float) / np.linalg.norm(view_up)
+        Xp = np.cross(Yp, Zp)
+        traces_xyz = np.cross(n_rot, Zp)
+        norms = np.linalg.norm(traces_xyz, axis=2)
+        traces_xyz /= np.where(norms > np.finfo(float).eps, norms, np.inf)[:, :, np.newaxis]
+        # express the traces in the coordinate system of the intersection plane
+        return trace_size * np.dot(traces_xyz, np.array([Xp, Yp]).T)
+
+    @staticmethod
+    def plot_slip_traces_collection(orientations, positions, hkl='111', lattice=None, n_int=np.array([0, 0, 1]),
+                                    view_up=np.array([0, 1, 0]), trace_size=10., ax=None, colors='rgykcmbw',
+                                    **kwargs):
+        """
+        Draw the slip traces of many grains at once, for instance on top of a SEM image.
+
+        All the traces are gathered in a single matplotlib `LineCollection` centered on
+        the grain positions, each plane of the family having its own color.
+
+        :param orientations: a (n, 3, 3) array of orientation matrices or a list of `Orientation` instances.
+        :param positions: a (n, 2) array with the position of each grain in the plot coordinates.
+        :param hkl: the slip plane family (eg. '111' or '110') or a list of `HklPlane` instances.
+        :param Lattice lattice: The reference crystal lattice (default None).
+        :param n_int: normal to the plane of intersection (laboratory local frame).
+        :param view_up: vector to place upwards on the plot.
+        :param float trace_size: length of the traces in the plot coordinates.
+        :param ax: the matplotlib axis to use (a new figure is created if None).
+        :param colors: the colors used for the different planes of the family.
+        :param kwargs: additional parameters passed to the `LineCollection`.
+        :returns: the `LineCollection` added to the axis.
+        """
+        from matplotlib.collections import LineCollection
+        from matplotlib.colors import to_rgba
+        traces = HklPlane.slip_traces(orientations, hkl=hkl, lattice=lattice, n_int=n_int, view_up=view_up,
+                                      trace_size=trace_size)
+        n_grains, n_planes = traces.shape[:2]
+        centers = np.asarray(positions, dtype=float).reshape(n_grains, 1, 2)
+        segments = np.stack((centers - 0.5 * traces, centers + 0.5 * traces), axis=2).reshape(-1, 2, 2)
+        plane_colors = [to_rgba(colors[i % len(colors)]) for i in range(n_planes)]
+        kwargs.setdefault('linewidths', 1)
+        lines = LineCollection(segments, colors=np.tile(plane_colors, (n_grains, 1)), **kwargs)
+        if ax is None:
+            ax = plt.figure().add_subplot(111)
+        ax.add_collection(lines)
+        ax.autoscale_view()
+        return lines
+
     @staticmethod
     def plot_slip_traces(orientation, hkl='111', n_int=np.array([0, 0, 1]), \
                          view_up=np.array([0, 1, 0]), verbose=False, title=True, legend=True, \
@@ -1405,8 +1610,11 @@ class HklPlane(HklObject):
         plt.figure()
         hkl_planes = HklPlane.get_family(hkl)
         colors = 'rgykcmbw'
+        traces = HklPlane.slip_traces([orientation], hkl_planes, n_int=n_int, view_up=view_up)[0]
         for i, hkl_plane in enumerate(hkl_planes):
-            trace = hkl_plane.slip_trace(orientation, n_int=n_int, view_up=view_up, trace_size=1, verbose=verbose)
+            trace = traces[i]
+            if verbose:
+                print('trace of plane %s: %s' % (hkl_plane.miller_indices(), trace))
             x = [-trace[0] / 2, trace[0] / 2]
             y = [-trace[1] / 2, trace[1] / 2]
             plt.plot(x, y, colors[i % len(hkl_planes)], label='%d%d%d' % hkl_plane.miller_indices(), linewidth=2)
@@ -1467,3 +1675,198 @@ class HklPlane(HklObject):
         k = w1 * u2 - u1 * w2
         l = u1 * v2 - v1 * u2
         return h, k, l
+
+
+class ReflectionTable:
+    '''
+    An array based table of lattice planes (reflections) for a given crystal lattice.
+
+    Instead of manipulating a list of :py:class:`~pymicro.crystal.lattice.HklPlane`
+    objects, the Miller indices are stored in a (N, 3) array and all the quantities
+    of interest are precomputed once with vectorized operations: the scattering
+    vectors, the unit normals, the interplanar spacings, the multiplicities and
+    the family ids (reflections equivalent by symmetry share the same id).
+
+    ::
+
+      l = Lattice.face_centered_cubic(0.352)  # FCC Nickel
+      table = ReflectionTable([[1, 1, 1], [2, 0, 0], [0, 2, 0]], l)
+      print(table.d_spacings)
+      print(table.bragg_angles(40.))  # in radians
+      print(table[0])  # HklPlane view of the first reflection
+
+    The :py:class:`~pymicro.crystal.lattice.HklPlane` API remains available through
+    indexing or the `planes` method.
+    '''
+
+    def __init__(self, hkl, lattice=None, symmetry=None):
+        '''Create a new reflection table.
+
+        :param hkl: a (N, 3) array like of the Miller indices.
+        :param Lattice lattice: the crystal lattice (cubic with lattice parameter of 1.0 by default).
+        :param symmetry: the `Symmetry` used to compute the families (the lattice symmetry by default).
+        '''
+        if lattice is None:
+            lattice = Lattice.cubic(1.0)
+        self.lattice = lattice
+        self.symmetry = symmetry or lattice._symmetry or Symmetry.triclinic
+        self.hkl = np.array(hkl, dtype=int).reshape(-1, 3)
+        self.scattering_vectors = np.dot(self.hkl, lattice.reciprocal_matrix)
+        g_norms = np.linalg.norm(self.scattering_vectors, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.normals = self.scattering_vectors / g_norms[:, np.newaxis]
+            self.d_spacings = 1. / g_norms
+        self.family_ids, self.multiplicities = self._compute_families()
+
+    @staticmethod
+    def from_planes(hkl_planes, symmetry=None):
+        '''Create a reflection table from a list of `HklPlane` instances.
+
+        :param list hkl_planes: a list of `HklPlane` objects sharing the same lattice.
+        :param symmetry: the `Symmetry` used to compute the families (the lattice symmetry by default).
+        :returns: a new `ReflectionTable` instance.
+        '''
+        hkl = [plane.miller_indices() for plane in hkl_planes]
+        return ReflectionTable(hkl, hkl_planes[0]._lattice, symmetry)
+
+    @staticmethod
+    def extinction_mask(hkl, centering='P'):
+        '''Compute the reflections allowed by the lattice centering.
+
+        The following reflection conditions are applied:
+
+         * P: no condition;
+         * I: h + k + l = 2n;
+         * F: h, k, l all even or all odd;
+         * A: k + l = 2n;
+         * B: h + l = 2n;
+         * C: h + k = 2n;
+         * R: -h + k + l = 3n (obverse setting with hexagonal axes).
+
+        :param hkl: a (N, 3) array of Miller indices.
+        :param str centering: the lattice centering ('P' by default).
+        :raise ValueError: if the centering is not supported.
+        :returns: a boolean array, True for the allowed reflections.
+        '''
+        hkl = np.asarray(hkl, dtype=int).reshape(-1, 3)
+        (h, k, l) = hkl.T
+        if centering == 'P':
+            return np.ones(len(hkl), dtype=bool)
+        elif centering == 'I':
+            return (h + k + l) % 2 == 0
+        elif centering == 'F':
+            return ((h - k) % 2 == 0) & ((k - l) % 2 == 0)
+        elif centering == 'A':
+            return (k + l) % 2 == 0
+        elif centering == 'B':
+            return (h + l) % 2 == 0
+        elif centering == 'C':
+            return (h + k) % 2 == 0
+        elif centering == 'R':
+            return (-h + k + l) % 3 == 0
+        else:
+            raise ValueError('unsupported lattice centering: %s' % centering)
+
+    @staticmethod
+    def generate(lattice, max_miller=3, d_min=None, max_keV=None, centering=None, symmetry=None):
+        '''Generate all the reflections of a lattice up to a maximum Miller index.
+
+        All the Miller indices are enumerated at once on a grid, then the
+        extinction rules of the lattice centering and the spacing cuts are
+        applied with vectorized masks. The reflections are sorted by decreasing
+        interplanar spacing.
+
+        ::
+
+          l = Lattice.face_centered_cubic(0.352)
+          table = ReflectionTable.generate(l, max_miller=10, max_keV=120.)
+
+        :param Lattice lattice: the crystal lattice.
+        :param int max_miller: the maximum absolute value of the Miller indices (3 by default).
+        :param float d_min: the minimum interplanar spacing in nm (None by default).
+        :param float max_keV: the maximum X-ray energy in keV, reflections with a spacing smaller than half the
+          corresponding wavelength cannot diffract and are removed (None by default).
+        :param str centering: the lattice centering used for the extinction rules (the lattice centering by default).
+        :param symmetry: the `Symmetry` used to compute the families (the lattice symmetry by default).
+        :returns: a new `ReflectionTable` instance.
+        '''
+        if centering is None:
+            centering = lattice._centering
+        hkl = HklObject.miller_indices_grid(max_miller)
+        hkl = hkl[ReflectionTable.extinction_mask(hkl, centering)]
+        d = 1. / np.linalg.norm(np.dot(hkl, lattice.reciprocal_matrix), axis=1)
+        if max_keV is not None:
+            d_min = max(d_min or 0., 0.5 * 1.2398 / max_keV)
+        if d_min is not None:
+            hkl = hkl[d >= d_min]
+            d = d[d >= d_min]
+        # sort by decreasing spacing then by Miller indices
+        order = np.lexsort((hkl[:, 2], hkl[:, 1], hkl[:, 0], -np.round(d, 12)))
+        return ReflectionTable(hkl[order], lattice, symmetry)
+
+    def _compute_families(self):
+        '''Compute the family ids and the multiplicities of all the reflections.
+
+        All the equivalent reflections (including the Friedel pairs) are generated
+        with the symmetry operators expressed in the Miller indices basis, and each
+        triplet is encoded as an integer. The largest code among the equivalent
+        reflections identifies the family.
+        '''
+        if len(self.hkl) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        ops = self.lattice.hkl_symmetry_operators(self.symmetry)
+        equivalents = np.einsum('sij,nj->nsi', ops, self.hkl)
+        equivalents = np.concatenate((equivalents, -equivalents), axis=1)
+        offset = np.abs(equivalents).max()
+        base = 2 * offset + 1
+        codes = ((equivalents[:, :, 0] + offset) * base + equivalents[:, :, 1] + offset) * base + \
+                equivalents[:, :, 2] + offset
+        codes.sort(axis=1)
+        multiplicities = 1 + np.count_nonzero(np.diff(codes, axis=1), axis=1)
+        family_ids = np.unique(codes[:, -1], return_inverse=True)[1]
+        return family_ids, multiplicities
+
+    def __len__(self):
+        return len(self.hkl)
+
+    def __getitem__(self, index):
+        '''Access one reflection as a `HklPlane` or a subset of the table as a new `ReflectionTable`.'''
+        if isinstance(index, (int, np.integer)):
+            (h, k, l) = self.hkl[index]
+            return HklPlane(int(h), int(k), int(l), self.lattice)
+        return self.select(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return 'ReflectionTable with %d reflections\n%s' % (len(self), self.lattice)
+
+    def select(self, index):
+        '''Create a new table with a subset of the reflections.
+
+        The precomputed quantities are copied so nothing is recomputed.
+
+        :param index: a boolean mask or an array of indices.
+        :returns: a new `ReflectionTable` instance.
+        '''
+        from copy import copy
+        table = copy(self)
+        for field in ['hkl', 'scattering_vectors', 'normals', 'd_spacings', 'family_ids', 'multiplicities']:
+            setattr(table, field, getattr(self, field)[index])
+        return table
+
+    def planes(self):
+        '''Returns the list of `HklPlane` corresponding to this table.'''
+        return list(self)
+
+    def bragg_angles(self, lambda_keV):
+        '''Compute the Bragg angles of all the reflections at the given energy.
+
+        :param float lambda_keV: the X-ray energy in keV (lattice spacing must be in nm units).
+        :returns: the Bragg angles in radians (nan for reflections that cannot diffract).
+        '''
+        lambda_nm = 1.2398 / lambda_keV
+        with np.errstate(invalid='ignore'):
+            return np.arcsin(lambda_nm / (2 * self.d_spacings))
@@ -570,10 +570,11 @@ class Orientation:
            \sin\phi_1\sin\Phi & -\cos\phi_1\sin\Phi & \cos\Phi \\\\
            \end{pmatrix}
         
-        :param euler: The triplet of the Euler angles (in degrees).
-        :returns g: The 3x3 orientation matrix.
+        :param euler: The triplet of the Euler angles (in degrees), or an array of shape (n, 3) to compute
+          n orientation matrices at once.
+        :returns g: The 3x3 orientation matrix (or a (n, 3, 3) array).
         """
-        (rphi1, rPhi, rphi2) = np.radians(euler)
+        (rphi1, rPhi, rphi2) = np.radians(euler).T
         c1 = np.cos(rphi1)
         s1 = np.sin(rphi1)
         c = np.cos(rPhi)
@@ -592,6 +593,8 @@ class Orientation:
         g32 = -c1 * s
         g33 = c
         g = np.array([[g11, g12, g13], [g21, g22, g23], [g31, g32, g33]])
+        if g.ndim == 3:
+            g = np.moveaxis(g, -1, 0)
         return g
 
     @staticmethod
@@ -794,6 +797,43 @@ class Orientation:
         q3 = np.sin(0.5 * (phi1 + phi2)) * np.cos(0.5 * Phi)
         return np.array([q0, q1, q2, q3])
 
+    @staticmethod
+    def OrientationMatrix2Quaternion(g):
+        """
+        Compute the unit quaternion from the orientation matrix.
+
+        The quaternion follows the same convention as `Euler2Quaternion` and is
+        returned with a positive scalar part. The largest component is computed
+        first to keep the conversion stable close to 180 degrees rotations.
+
+        :param g: The 3x3 orientation matrix, or a (n, 3, 3) array of orientation matrices.
+        :returns: The quaternion as a 4 components array (or a (n, 4) array).
+        """
+        g = np.asarray(g, dtype=float)
+        single = g.ndim == 2
+        g = g.reshape(-1, 3, 3)
+        tr = g[:, 0, 0] + g[:, 1, 1] + g[:, 2, 2]
+        # squared components (up to a factor 4)
+        q2 = np.array([1 + tr,
+                       1 + g[:, 0, 0] - g[:, 1, 1] - g[:, 2, 2],
+                       1 - g[:, 0, 0] + g[:, 1, 1] - g[:, 2, 2],
+                       1 - g[:, 0, 0] - g[:, 1, 1] + g[:, 2, 2]]).T
+        largest = np.argmax(q2, axis=1)
+        qk = 0.5 * np.sqrt(np.maximum(q2[np.arange(len(g)), largest], 0.))
+        d = 0.25 / qk
+        # antisymmetric and symmetric parts of the off-diagonal terms
+        a0, a1, a2 = g[:, 1, 2] - g[:, 2, 1], g[:, 2, 0] - g[:, 0, 2], g[:, 0, 1] - g[:, 1, 0]
+        s0, s1, s2 = g[:, 1, 2] + g[:, 2, 1], g[:, 2, 0] + g[:, 0, 2], g[:, 0, 1] + g[:, 1, 0]
+        candidates = np.array([[qk, a0 * d, a1 * d, a2 * d],
+                               [a0 * d, qk, s2 * d, s1 * d],
+                               [a1 * d, s2 * d, qk, s0 * d],
+                               [a2 * d, s1 * d, s0 * d, qk]])  # shape (4, 4, n)
+        q = candidates[largest, :, np.arange(len(g))]
+        q[q[:, 0] < 0] *= -1
+        if single:
+            return q[0]
+        return q
+
     @staticmethod
     def Euler2Rodrigues(euler):
         """
@@ -824,24 +864,28 @@ class Orientation:
 
         The text file must be organised in 3 columns (the other are ignored), corresponding to either the three euler
         angles or the three rodrigues veotor components, depending on the data_type). Internally the ascii file is read
-        by the genfromtxt function of numpy, additional keyworks (such as the delimiter) can be passed to via the
-        kwargs dictionnary.
+        by chunks with :py:func:`~pymicro.file.file_utils.read_txt_columns`, additional keyworks (usecols, delimiter,
+        comments, skip_header or cache) can be passed to via the kwargs dictionnary. Other keywords are passed to the
+        genfromtxt function of numpy.
 
         :param str txt_path: path to the text file containing the orientations.
         :param str data_type: 'euler' (default) or 'rodrigues'.
-        :param dict kwargs: additional parameters passed to genfromtxt.
+        :param dict kwargs: additional parameters passed to the text reader.
         :returns dict: a dictionary with the line number and the corresponding orientation.
         """
-        data = np.genfromtxt(txt_path, **kwargs)
-        size = len(data)
-        orientations = []
-        for i in range(size):
-            angles = np.array([float(data[i, 0]), float(data[i, 1]), float(data[i, 2])])
-            if data_type == 'euler':
-                orientations.append([i + 1, Orientation.from_euler(angles)])
-            elif data_type == 'rodrigues':
-                orientations.append([i + 1, Orientation.from_rodrigues(angles)])
-        return dict(orientations)
+        from pymicro.file.file_utils import read_txt_columns
+        if set(kwargs.keys()) <= set(['usecols', 'delimiter', 'comments', 'skip_header', 'cache']):
+            data = read_txt_columns(txt_path, **kwargs)
+        else:
+            data = np.genfromtxt(txt_path, **kwargs)
+        data = np.atleast_2d(data)[:, :3]
+        if data_type == 'euler':
+            matrices = Orientation.Euler2OrientationMatrix(data).reshape(-1, 3, 3)
+        elif data_type == 'rodrigues':
+            matrices = [Orientation.Rodrigues2OrientationMatrix(rod) for rod in data]
+        else:
+            raise ValueError('unsupported data_type: %s' % data_type)
+        return dict([(i + 1, Orientation(g)) for (i, g) in enumerate(matrices)])
 
     @staticmethod
     def read_euler_from_zset_inp(inp_path):
@@ -861,11 +905,15 @@ class Orientation:
          **elset elset4 *file au.mat *integration theta_method_a 1.0 1.e-9 150 *rotation x1 -0.941278 0.700996 0.034552 x3 1.000816 1.006824 0.885212
          **elset elset5 *file au.mat *integration theta_method_a 1.0 1.e-9 150 *rotation x1 -2.383786 0.479058 -0.488336 x3 0.899545 0.806075 0.984268
 
+        The values are first gathered in arrays and all the orientation
+        matrices are then computed at once.
+
         :param str inp_path: the path to the ascii file to read.
         :returns dict: a dictionary of the orientations associated with the elset names.
         """
         inp = open(inp_path)
         lines = inp.readlines()
+        inp.close()
         for i, line in enumerate(lines):
             if line.lstrip().startswith('***material'):
                 break
@@ -876,39 +924,47 @@ class Orientation:
                 break
             if (not line.lstrip().startswith('%') and line.find('**elset') >= 0):
                 euler_lines.append(line)
-        euler = []
+        elsets = []
+        is_x1x3 = []
+        values = []
         for l in euler_lines:
             tokens = l.split()
-            elset = tokens[tokens.index('**elset') + 1]
+            elsets.append(tokens[tokens.index('**elset') + 1])
             irot = tokens.index('*rotation')
             if tokens[irot + 1] == 'x1':
-                x1 = np.empty(3, dtype=float)
-                x1[0] = float(tokens[irot + 2])
-                x1[1] = float(tokens[irot + 3])
-                x1[2] = float(tokens[irot + 4])
-                x3 = np.empty(3, dtype=float)
-                x3[0] = float(tokens[irot + 6])
-                x3[1] = float(tokens[irot + 7])
-                x3[2] = float(tokens[irot + 8])
-                euler.append([elset, Orientation.Zrot2OrientationMatrix(x1=x1, x3=x3)])
+                is_x1x3.append(True)
+                values.append(tokens[irot + 2:irot + 5] + tokens[irot + 6:irot + 9])
             else:  # euler angles
-                phi1 = tokens[irot + 1]
-                Phi = tokens[irot + 2]
-                phi2 = tokens[irot + 3]
-                angles = np.array([float(phi1), float(Phi), float(phi2)])
-                euler.append([elset, Orientation.from_euler(angles)])
-        return dict(euler)
+                is_x1x3.append(False)
+                values.append(tokens[irot + 1:irot + 4] + ['0.', '0.', '0.'])
+        values = np.array(values, dtype=float).reshape(-1, 6)
+        is_x1x3 = np.array(is_x1x3, dtype=bool)
+        matrices = np.empty((len(values), 3, 3))
+        if np.any(~is_x1x3):
+            matrices[~is_x1x3] = Orientation.Euler2OrientationMatrix(values[~is_x1x3, :3]).reshape(-1, 3, 3)
+        if np.any(is_x1x3):
+            # same as Zrot2OrientationMatrix with x1 and x3: the columns of g are x1, x3 ^ x1 and x3
+            x1 = values[is_x1x3, :3]
+            x3 = values[is_x1x3, 3:]
+            x2 = np.cross(x3, x1)
+            xs = [x / np.linalg.norm(x, axis=1)[:, np.newaxis] for x in (x1, x2, x3)]
+            matrices[is_x1x3] = np.stack(xs, axis=2)
+        return dict([(elset, Orientation(g)) for (elset, g) in zip(elsets, matrices)])
 
     def slip_system_orientation_tensor(self, s):
         """Compute the orientation strain tensor m^s for this :py:class:`~pymicro.crystal.microstructure.Orientation`
         and the given slip system.
 
-        :param s: an instance of :py:class:`~pymicro.crystal.lattice.SlipSystem`
+        :param s: an instance of :py:class:`~pymicro.crystal.lattice.SlipSystem`, or of
+          :py:class:`~pymicro.crystal.lattice.SlipFamily` to get a (n_ss, 3, 3) array with the tensors of all
+          its slip systems.
 
         .. math::
 
           M^s_{ij} = \left(l^s_i.n^s_j)
         """
+        if hasattr(s, 'orientation_tensors'):
+            return s.orientation_tensors(self.orientation_matrix(), tensor='schmid')[0]
         gt = self.orientation_matrix().transpose()
         plane = s.get_slip_plane()
         n_rot = np.dot(gt, plane.normal())
@@ -920,12 +976,16 @@ class Orientation:
         """Compute the orientation strain tensor m^s for this :py:class:`~pymicro.crystal.microstructure.Orientation`
         and the given slip system.
 
-        :param s: an instance of :py:class:`~pymicro.crystal.lattice.SlipSystem`
+        :param s: an instance of :py:class:`~pymicro.crystal.lattice.SlipSystem`, or of
+          :py:class:`~pymicro.crystal.lattice.SlipFamily` to get a (n_ss, 3, 3) array with the tensors of all
+          its slip systems.
 
         .. math::
 
           m^s_{ij} = \\frac{1}{2}\left(l^s_i.n^s_j + l^s_j.n^s_i)
         """
+        if hasattr(s, 'orientation_tensors'):
+            return s.orientation_tensors(self.orientation_matrix(), tensor='sym')[0]
         gt = self.orientation_matrix().transpose()
         plane = s.get_slip_plane()
         n_rot = np.dot(gt, plane.normal())
@@ -938,12 +998,16 @@ class Orientation:
         """Compute the orientation rotation tensor q^s for this :py:class:`~pymicro.crystal.microstructure.Orientation`
         and the given slip system.
 
-        :param s: an instance of :py:class:`~pymicro.crystal.lattice.SlipSystem`
+        :param s: an instance of :py:class:`~pymicro.crystal.lattice.SlipSystem`, or of
+          :py:class:`~pymicro.crystal.lattice.SlipFamily` to get a (n_ss, 3, 3) array with the tensors of all
+          its slip systems.
 
         .. math::
 
           q^s_{ij} = \\frac{1}{2}\left(l^s_i.n^s_j - l^s_j.n^s_i)
         """
+        if hasattr(s, 'orientation_tensors'):
+            return s.orientation_tensors(self.orientation_matrix(), tensor='skew')[0]
         gt = self.orientation_matrix().transpose()
         plane = s.get_slip_plane()
         n_rot = np.dot(gt, plane.normal())
@@ -973,11 +1037,18 @@ class Orientation:
         """Compute all Schmid factors for this crystal orientation and the
         given list of slip systems.
 
-        :param slip_systems: a list of the slip system from which to compute the Schmid factor values.
+        :param slip_systems: a list of the slip system from which to compute the Schmid factor values, or a
+          :py:class:`~pymicro.crystal.lattice.SlipFamily` instance to compute them all at once.
         :param load_direction: a unit vector describing the loading direction (default: vertical axis [0, 0, 1]).
         :param bool verbose: activate verbose mode.
         :returns list: a list of the schmid factors.
         """
+        if hasattr(slip_systems, 'schmid_factors'):
+            SF_list = slip_systems.schmid_factors(self.orientation_matrix(), load_direction)[0].tolist()
+            if verbose:
+                for ss, sf in zip(slip_systems.slip_systems(), SF_list):
+                    print('Slip system: %s, Schmid factor is %.3f' % (ss, sf))
+            return SF_list
         SF_list = []
         for ss in slip_systems:
             sf = self.schmid_factor(ss, load_direction)
@@ -1266,6 +1337,68 @@ class Microstructure:
             micro.grains.append(Grain.from_xml(node, verbose))
         return micro
 
+    # column layout of the TSL grain files such as EBSD_20grains.txt
+    ebsd_columns = {'id': 0, 'euler': [1, 2, 3], 'xy': [4, 5], 'iq': 6, 'ci': 7}
+
+    @staticmethod
+    def iter_ebsd_txt(txt_path, columns=None, chunk_lines=1000000, **kwargs):
+        """Iterate over an EBSD text export by chunks of points.
+
+        This is useful to process huge EBSD files with a bounded memory usage.
+        See `read_ebsd_txt` for the description of the columns.
+
+        :param str txt_path: path to the EBSD text file.
+        :param dict columns: the column indices of each field (see `read_ebsd_txt`).
+        :param int chunk_lines: the number of lines read at once (1000000 by default).
+        :param kwargs: additional parameters passed to :py:func:`~pymicro.file.file_utils.iter_txt_chunks`.
+        :returns: a generator of dictionaries of numpy arrays.
+        """
+        from pymicro.file.file_utils import iter_txt_chunks
+        if columns is None:
+            columns = Microstructure.ebsd_columns
+        for data in iter_txt_chunks(txt_path, chunk_lines=chunk_lines, **kwargs):
+            yield Microstructure._ebsd_fields(data, columns)
+
+    @staticmethod
+    def _ebsd_fields(data, columns):
+        """Split the columns of some EBSD data into named fields."""
+        fields = {}
+        for name, cols in columns.items():
+            fields[name] = data[:, cols]
+            if name in ['id', 'phase']:
+                fields[name] = fields[name].astype(int)
+        return fields
+
+    @staticmethod
+    def read_ebsd_txt(txt_path, columns=None, chunk_lines=1000000, cache=False, **kwargs):
+        """Read an EBSD text export into arrays.
+
+        The file is parsed by chunks and each field is returned as a numpy array
+        instead of a list of objects, which makes it possible to load millions
+        of points quickly. The column layout is described by a dictionary
+        associating each field name with a column index (or a list of indices).
+        By default, the layout of the TSL grain files is used (see
+        `ebsd_columns`). A phase column can be added, for instance:
+
+        ::
+
+          ebsd = Microstructure.read_ebsd_txt('scan.txt', columns={'euler': [0, 1, 2], 'xy': [3, 4],
+                                                                   'ci': 6, 'phase': 7}, cache=True)
+          g = Orientation.Euler2OrientationMatrix(ebsd['euler'])
+
+        :param str txt_path: path to the EBSD text file.
+        :param dict columns: the column indices of each field.
+        :param int chunk_lines: the number of lines read at once (1000000 by default).
+        :param bool cache: save a binary .npz cache next to the source for instant reloads (False by default).
+        :param kwargs: additional parameters passed to :py:func:`~pymicro.file.file_utils.read_txt_columns`.
+        :returns dict: a dictionary of numpy arrays, one for each field.
+        """
+        from pymicro.file.file_utils import read_txt_columns
+        if columns is None:
+            columns = Microstructure.ebsd_columns
+        data = read_txt_columns(txt_path, chunk_lines=chunk_lines, cache=cache, **kwargs)
+        return Microstructure._ebsd_fields(data, columns)
+
     def get_grain(self, gid):
         """Get a particular grain given its id.
 
@@ -1286,6 +1419,20 @@ class Microstructure:
                 return grain
         raise ValueError('grain %d not found in the microstructure' % gid)
 
+    def get_orientation_matrices(self):
+        """Get the orientation matrices of all the grains as a single array.
+
+        :returns: a (n, 3, 3) numpy array with the orientation matrix of each grain.
+        """
+        return np.array([grain.orientation.orientation_matrix() for grain in self.grains]).reshape(-1, 3, 3)
+
+    def get_grain_volumes(self):
+        """Get the volumes of all the grains as a single array.
+
+        :returns: a numpy array with the volume of each grain.
+        """
+        return np.array([grain.volume for grain in self.grains], dtype=float)
+
     def __repr__(self):
         """Provide a string representation of the class."""
         s = '%s\n' % self.__class__.__name__
@@ -1606,3 +1753,30 @@ class Microstructure:
         else:
             # save projection image with origin = lower since Z-axis is upwards
             plt.imsave('proj/proj_omega=%05.1f.png' % omega, full_proj, cmap=cm.gray, vmin=0, vmax=100, origin='lower')
+
+
+def orientation_matrices(orientations):
+    """Convert the given orientations into a (n, 3, 3) array of orientation matrices.
+
+    This generalises :py:meth:`Microstructure.get_orientation_matrices` to the various ways orientations are passed
+    to the vectorized functions of pymicro.
+
+    :param orientations: a `Microstructure`, an `Orientation` or a `Grain`, a list of `Orientation` or `Grain`
+      instances, a (n, 3, 3) array of orientation matrices or a (n, 3) array of Euler angles (in degrees). Note
+      that a 2D array is always read as Euler angles, a single orientation matrix must be given as a (1, 3, 3) array.
+    :returns: a (n, 3, 3) numpy array of orientation matrices.
+    """
+    if isinstance(orientations, Microstructure):
+        return orientations.get_orientation_matrices()
+    if isinstance(orientations, (Orientation, Grain)):
+        orientations = [orientations]
+    if isinstance(orientations, (list, tuple)) and len(orientations) > 0 and \
+            isinstance(orientations[0], (Orientation, Grain)):
+        return np.array([o.orientation.orientation_matrix() if isinstance(o, Grain) else o.orientation_matrix()
+                         for o in orientations])
+    orientations = np.asarray(orientations, dtype=float)
+    if orientations.ndim == 3 and orientations.shape[1:] == (3, 3):
+        return orientations
+    elif orientations.ndim <= 2 and orientations.shape[-1] == 3:
+        return Orientation.Euler2OrientationMatrix(orientations.reshape(-1, 3)).reshape(-1, 3, 3)
+    raise ValueError('unsupported orientations argument with shape %s' % str(orientations.shape))
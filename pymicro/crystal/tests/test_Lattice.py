@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 from math import pi, cos, sin, acos, atan
-from pymicro.crystal.lattice import Lattice, Symmetry, HklObject, HklDirection, HklPlane, SlipSystem
+from pymicro.crystal.lattice import Lattice, Symmetry, HklObject, HklDirection, HklPlane, SlipSystem, SlipFamily, \
+    ReflectionTable
 
 
 class LatticeTests(unittest.TestCase):
@@ -35,6 +36,35 @@ class LatticeTests(unittest.TestCase):
             self.assertAlmostEqual(al._lengths[i], 0.40495, 4)
             self.assertEqual(al._angles[i], 90.0)
 
+    def test_from_cif_cache(self):
+        import os, shutil, tempfile
+        cif_path = os.path.join(os.path.dirname(__file__), os.pardir, 'cif', 'Ti.cif')
+        cache_dir = Lattice.cif_cache_dir
+        Lattice.cif_cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, Lattice.cif_cache_dir)
+        Lattice._cif_cache.clear()
+        try:
+            ti = Lattice.from_cif(cif_path, use_cache=False)
+            self.assertEqual(os.listdir(Lattice.cif_cache_dir), [])
+            self.assertEqual(ti._symmetry, Symmetry.hexagonal)
+            self.assertAlmostEqual(ti._lengths[2], 0.4686, 4)
+            self.assertEqual(Lattice.from_cif(cif_path), ti)
+            self.assertEqual(len(os.listdir(Lattice.cif_cache_dir)), 1)
+            # read from the disk cache
+            Lattice._cif_cache.clear()
+            self.assertEqual(Lattice.from_cif(cif_path), ti)
+            # no disk cache if the directory is not set
+            Lattice._cif_cache.clear()
+            Lattice.cif_cache_dir = ''
+            self.assertEqual(Lattice.from_cif(cif_path), ti)
+        finally:
+            Lattice.cif_cache_dir = cache_dir
+        # the fast path handles quoted values and uncertainties
+        text = "data_test\n_cell_length_a 3.52(1)\n_cell_length_b '3.52'\n_cell_length_c 3.52\n" \
+               "_cell_angle_alpha 90\n_cell_angle_beta 90\n_cell_angle_gamma 90\n_symmetry_cell_setting cubic\n"
+        self.assertEqual(Lattice._parse_cif_parameters(text), (3.52, 3.52, 3.52, 90., 90., 90., 'cubic'))
+        self.assertEqual(Lattice._parse_cif_parameters(text.replace('_cell_length_c', '_other')), None)
+
     def test_reciprocal_lattice(self):
         Mg2Si = Lattice.from_parameters(1.534, 0.405, 0.683, 90., 106., 90., x_aligned_with_a=False)
         [astar, bstar, cstar] = Mg2Si.reciprocal_lattice()
@@ -102,6 +132,14 @@ class HklDirectionTests(unittest.TestCase):
         hkl_planes2 = HklObject.skip_higher_order(hkl_planes)
         self.assertEqual(len(hkl_planes2), 7)
 
+    def test_skip_higher_order_indices(self):
+        hkl = [[2, 2, 2], [1, 1, 1], [-1, -1, -1], [0, 0, 3], [2, 0, 0], [-4, 0, 0], [1, 2, 0], [1, 2, 0]]
+        index = HklObject.skip_higher_order_indices(hkl)
+        self.assertEqual(list(index), [4, 1, 3, 6])
+        index = HklObject.skip_higher_order_indices(hkl, keep_friedel_pair=True)
+        self.assertEqual(list(index), [4, 1, 2, 3, 6])
+        self.assertEqual(len(HklObject.skip_higher_order_indices(np.empty((0, 3)))), 0)
+
     def test_4indices_representation(self):
         u, v, w = HklDirection.four_to_three_indices(2, -1, -1, 0)
         self.assertEqual(u, 1)
@@ -154,6 +192,27 @@ class HklPlaneTests(unittest.TestCase):
         self.assertEqual(len(HklPlane.get_family([0, 1, 2], crystal_structure=Symmetry.tetragonal, include_friedel_pairs=True)), 8)
         self.assertEqual(len(HklPlane.get_family([0, -1, 2], crystal_structure=Symmetry.tetragonal, include_friedel_pairs=True)), 8)
 
+    def test_family_indices(self):
+        family = HklPlane.get_family_indices('111')
+        self.assertTrue(family is HklPlane.get_family_indices([1, 1, 1]))  # memoized
+        self.assertEqual(family.tolist(), [[1, 1, 1], [-1, 1, 1], [1, -1, 1], [1, 1, -1]])
+        self.assertTrue((-1, 1, 1) in HklPlane.get_family_set('111'))
+        self.assertTrue(HklPlane.is_same_family(HklPlane(-1, -1, 1), HklPlane(1, 1, 1)))
+        self.assertFalse(HklPlane.is_same_family(HklPlane(1, 1, 0), HklPlane(1, 1, 1)))
+        # hexagonal families using 3 or 4 indices
+        l = Lattice.hexagonal(0.295, 0.468)
+        self.assertEqual(len(HklPlane.get_family('100', lattice=l, crystal_structure=Symmetry.hexagonal)), 3)
+        self.assertEqual(len(HklPlane.get_family('1010', lattice=l, crystal_structure=Symmetry.hexagonal,
+                                                 include_friedel_pairs=True)), 6)
+        self.assertEqual(HklPlane(1, 0, 1, l).multiplicity(symmetry=Symmetry.hexagonal), 12)
+        # by default the family follows the symmetry of the lattice
+        self.assertEqual(HklPlane.get_family_set('100', lattice=l),
+                         HklPlane.get_family_set('100', lattice=l, crystal_structure=Symmetry.hexagonal))
+        self.assertEqual(HklPlane(1, 0, 1, l).multiplicity(), 12)
+        self.assertEqual(HklPlane(1, 0, 0, Lattice.tetragonal(0.3, 0.4)).multiplicity(), 4)
+        traces = HklPlane.slip_traces(np.eye(3)[np.newaxis], '100', lattice=l)
+        self.assertEqual(traces.shape, (1, 3, 2))
+
     def test_multiplicity(self):
         """Int Tables of Crystallography Vol. 1 p 32."""
         self.assertEqual(HklPlane(1, 0, 0).multiplicity(symmetry=Symmetry.cubic), 6)
@@ -247,6 +306,85 @@ class HklPlaneTests(unittest.TestCase):
         hkl = HklPlane(2, 0, 0, l)  # 200 reflection at 8 keV is at 32.7 deg
         self.assertAlmostEqual(hkl.bragg_angle(8), 0.5704164)
 
+    def test_slip_traces(self):
+        from pymicro.crystal.microstructure import Orientation
+        eulers = np.array([[10., 20., 30.], [191.9, 69.9, 138.9], [0., 0., 0.]])
+        orientations = [Orientation.from_euler(euler) for euler in eulers]
+        planes = HklPlane.get_family('111')
+        traces = HklPlane.slip_traces(orientations, '111', trace_size=2.)
+        self.assertEqual(traces.shape, (3, 4, 2))
+        for i in range(len(orientations)):
+            for j in range(len(planes)):
+                trace = planes[j].slip_trace(orientations[i], trace_size=2.)
+                self.assertAlmostEqual(traces[i, j, 0], trace[0])
+                self.assertAlmostEqual(traces[i, j, 1], trace[1])
+        # orientation matrices can also be used directly
+        traces_g = HklPlane.slip_traces(Orientation.Euler2OrientationMatrix(eulers), planes, trace_size=2.)
+        self.assertTrue(np.allclose(traces, traces_g))
+
+
+class ReflectionTableTests(unittest.TestCase):
+    def setUp(self):
+        print('testing the ReflectionTable class')
+
+    def test_reflection_table(self):
+        l = Lattice.face_centered_cubic(0.352)
+        hkl = [[1, 1, 1], [-1, 1, 1], [2, 0, 0], [0, 0, -2], [2, 2, 0], [1, 2, 3]]
+        table = ReflectionTable(hkl, l)
+        self.assertEqual(len(table), 6)
+        self.assertEqual(list(table.multiplicities), [8, 8, 6, 6, 12, 48])
+        self.assertEqual(table.family_ids[0], table.family_ids[1])
+        self.assertEqual(table.family_ids[2], table.family_ids[3])
+        self.assertEqual(len(np.unique(table.family_ids)), 4)
+        thetas = table.bragg_angles(40.)
+        for i in range(len(table)):
+            plane = table[i]
+            self.assertTrue(isinstance(plane, HklPlane))
+            self.assertAlmostEqual(table.d_spacings[i], plane.interplanar_spacing())
+            self.assertAlmostEqual(thetas[i], plane.bragg_angle(40.))
+            self.assertTrue(np.allclose(table.normals[i], plane.normal()))
+        sub_table = table[table.d_spacings > 0.15]
+        self.assertEqual(len(sub_table), 4)
+        self.assertEqual(list(sub_table.multiplicities), [8, 8, 6, 6])
+
+    def test_generate(self):
+        l = Lattice.face_centered_cubic(0.352)
+        table = ReflectionTable.generate(l, max_miller=2)
+        # 8 {111}, 6 {200}, 12 {220} and 8 {222}
+        self.assertEqual(len(table), 8 + 6 + 12 + 8)
+        self.assertTrue(np.all(np.diff(table.d_spacings) < 1e-12))
+        self.assertEqual(list(table.multiplicities[:14]), 8 * [8] + 6 * [6])
+        self.assertTrue(np.allclose(table.d_spacings[0], 0.352 / np.sqrt(3)))
+        # energy cut
+        table = ReflectionTable.generate(l, max_miller=10, max_keV=40.)
+        self.assertTrue(np.all(table.d_spacings >= 0.5 * 1.2398 / 40.))
+        self.assertFalse(np.any(np.isnan(table.bragg_angles(40.))))
+        # body centered lattice
+        l = Lattice.body_centered_cubic(0.287)
+        hkl = ReflectionTable.generate(l, max_miller=1).hkl
+        self.assertEqual(len(hkl), 12)
+        self.assertTrue(np.all(hkl.sum(axis=1) % 2 == 0))
+
+    def test_extinction_mask(self):
+        hkl = np.array([[1, 0, 0], [1, 1, 0], [1, 1, 1], [2, 0, 0], [0, 1, 1], [1, 0, 1], [1, 1, 2]])
+        self.assertEqual(list(ReflectionTable.extinction_mask(hkl, 'P')), 7 * [True])
+        self.assertEqual(list(ReflectionTable.extinction_mask(hkl, 'I')),
+                         [False, True, False, True, True, True, True])
+        self.assertEqual(list(ReflectionTable.extinction_mask(hkl, 'F')),
+                         [False, False, True, True, False, False, False])
+        self.assertEqual(list(ReflectionTable.extinction_mask(hkl, 'A')),
+                         [True, False, True, True, True, False, False])
+        self.assertEqual(list(ReflectionTable.extinction_mask(hkl, 'C')),
+                         [False, True, True, True, False, False, True])
+        self.assertRaises(ValueError, ReflectionTable.extinction_mask, hkl, 'X')
+
+    def test_hexagonal_families(self):
+        l = Lattice.hexagonal(0.295, 0.468)
+        table = ReflectionTable([[1, 0, 0], [0, 1, 0], [1, -1, 0], [1, 1, 0], [0, 0, 1], [1, 0, 1]], l)
+        self.assertEqual(list(table.multiplicities), [6, 6, 6, 6, 2, 12])
+        self.assertEqual(len(np.unique(table.family_ids[:3])), 1)
+        self.assertNotEqual(table.family_ids[0], table.family_ids[3])
+
 
 class SlipSystemTests(unittest.TestCase):
     def setUp(self):
@@ -267,5 +405,41 @@ class SlipSystemTests(unittest.TestCase):
             self.assertEqual(np.dot(n, l), 0.)
 
 
+class SlipFamilyTests(unittest.TestCase):
+    def setUp(self):
+        print('testing the SlipFamily class')
+
+    def test_slip_families(self):
+        counts = {'001': 6, '111': 12, '110': 12, '112': 12, '123': 24,
+                  'basal': 3, 'prismatic': 3, 'pyramidal': 6, 'pyramidal_ca': 12}
+        for name in counts:
+            family = SlipFamily.get(name)
+            self.assertEqual(len(family), counts[name])
+            self.assertTrue(np.allclose(np.sum(family.normals * family.directions, axis=1), 0.))
+            self.assertTrue(np.allclose(family.sym_tensors + family.skew_tensors, family.schmid_tensors))
+        self.assertTrue(SlipFamily.get('111') is SlipFamily.get('111'))
+        self.assertRaises(ValueError, SlipFamily, '100')
+        # the slip systems are consistent with the SlipSystem objects
+        family = SlipFamily.get('112')
+        for i, s in enumerate(SlipSystem.get_slip_systems('112')):
+            self.assertTrue(np.allclose(family.normals[i], s.get_slip_plane().normal()))
+            self.assertTrue(np.allclose(family.directions[i], s.get_slip_direction().direction()))
+
+    def test_schmid_factors(self):
+        from pymicro.crystal.microstructure import Orientation
+        octahedral = SlipFamily.get('111')
+        orientations = [Orientation.cube(), Orientation.from_euler([20., 35., 50.])]
+        g = np.array([o.orientation_matrix() for o in orientations])
+        sf = octahedral.schmid_factors(g)
+        self.assertEqual(sf.shape, (2, 12))
+        self.assertAlmostEqual(sf[0].max(), 0.4082, 4)
+        for i in range(2):
+            self.assertTrue(np.allclose(sf[i], orientations[i].compute_all_schmid_factors(
+                octahedral.slip_systems())))
+            m = orientations[i].slip_system_orientation_strain_tensor(octahedral)
+            self.assertTrue(np.allclose(m[3], orientations[i].slip_system_orientation_strain_tensor(
+                octahedral.slip_systems()[3])))
+
+
 if __name__ == '__main__':
     unittest.main()
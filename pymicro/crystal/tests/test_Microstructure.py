@@ -1,7 +1,7 @@
 import unittest
 import os
 import numpy as np
-from pymicro.crystal.microstructure import Orientation, Grain, Microstructure
+from pymicro.crystal.microstructure import Orientation, Grain, Microstructure, orientation_matrices
 from pymicro.crystal.lattice import Symmetry, Lattice, HklPlane, HklDirection, SlipSystem
 from pymicro.xray.xray_utils import lambda_keV_to_nm
 
@@ -24,6 +24,20 @@ class MicrostructureTests(unittest.TestCase):
         self.assertEqual(len(m.grains), len(self.test_eulers))
         os.remove('%s.h5' % self.micro.name)
 
+    def test_read_ebsd_txt(self):
+        ebsd_path = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir, 'examples', 'data',
+                                 'EBSD_20grains.txt')
+        ebsd = Microstructure.read_ebsd_txt(ebsd_path)
+        self.assertEqual(ebsd['euler'].shape, (20, 3))
+        self.assertEqual(ebsd['xy'].shape, (20, 2))
+        self.assertEqual(ebsd['id'][-1], 20)
+        self.assertAlmostEqual(ebsd['ci'][5], 0.519)
+        orientations = Orientation.read_orientations(ebsd_path, usecols=[1, 2, 3])
+        self.assertEqual(len(orientations), 20)
+        self.assertAlmostEqual(orientations[2].phi1(), 329.319)
+        self.assertRaises(ValueError, Orientation.read_orientations, ebsd_path, data_type='quaternion',
+                          usecols=[1, 2, 3])
+
 
 class OrientationTests(unittest.TestCase):
 
@@ -36,6 +50,17 @@ class OrientationTests(unittest.TestCase):
         self.assertAlmostEqual(o.phi1(), 45.)
         self.assertAlmostEqual(o.Phi(), 45.)
 
+    def test_orientation_matrices(self):
+        orientations = [Orientation.from_euler(euler) for euler in self.test_eulers]
+        g = orientation_matrices(orientations)
+        self.assertEqual(g.shape, (3, 3, 3))
+        self.assertTrue(np.allclose(orientation_matrices(np.array(self.test_eulers)), g))
+        self.assertTrue(np.allclose(orientation_matrices([Grain(1, o) for o in orientations]), g))
+        self.assertTrue(np.allclose(orientation_matrices(g.tolist()), g))
+        self.assertTrue(np.allclose(orientation_matrices(g[:1]), g[0]))
+        self.assertTrue(np.allclose(orientation_matrices(orientations[1]), g[1]))
+        self.assertRaises(ValueError, orientation_matrices, np.zeros((4, 2)))
+
     def test_RodriguesConversion(self):
         rod = [0.1449, -0.0281, 0.0616]
         g = Orientation.Rodrigues2OrientationMatrix(rod)
@@ -0,0 +1,114 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+import numpy as np
+from pymicro.crystal.microstructure import Orientation, Grain, Microstructure
+from pymicro.crystal.lattice import Symmetry
+from pymicro.crystal.texture import ODF, texture_components, TaylorModel
+
+
+class ODFTests(unittest.TestCase):
+
+    def setUp(self):
+        print('testing the ODF class')
+        self.micro = Microstructure(name='cube')
+        self.micro.grains.append(Grain(1, Orientation.cube()))
+
+    def test_quaternion_conversion(self):
+        eulers = np.array([(45., 45, 0.), (10., 20, 30.), (191.9, 69.9, 138.9), (0., 180., 90.)])
+        q = Orientation.OrientationMatrix2Quaternion(Orientation.Euler2OrientationMatrix(eulers))
+        for i in range(len(eulers)):
+            qe = Orientation.Euler2Quaternion(eulers[i])
+            qe *= np.sign(qe[0]) if qe[0] != 0 else 1
+            for j in range(4):
+                self.assertAlmostEqual(q[i, j], qe[j])
+
+    def test_normalization(self):
+        for kernel in ['de la Vallee Poussin', 'gaussian']:
+            odf = ODF.from_microstructure(self.micro, half_width=15., kernel=kernel)
+            odf.compute(step=5.)
+            # the ODF is expressed in mrd so its integral must be 1
+            self.assertAlmostEqual(np.sum(odf.grid_weights * odf.values), 1., 2)
+
+    def test_evaluate(self):
+        odf = ODF.from_microstructure(self.micro, half_width=10.)
+        # all symmetry equivalent orientations share the same ODF value
+        values = odf.evaluate(np.array([(0., 0., 0.), (0., 0., 90.), (90., 90., 0.), (45., 0., 0.)]))
+        self.assertAlmostEqual(values[0], values[1])
+        self.assertAlmostEqual(values[0], values[2])
+        self.assertAlmostEqual(values[0], odf.kernel_values(np.zeros(1))[0] / 24)
+        self.assertLess(values[3], 0.01 * values[0])
+        phi1, Phi, section = odf.section(phi2=0., step=5.)
+        self.assertEqual(section.shape, phi1.shape)
+        self.assertAlmostEqual(section.max(), values[0])
+
+    def test_texture_index(self):
+        odf = ODF.from_microstructure(self.micro, half_width=15.)
+        self.assertGreater(odf.texture_index(), 5.)
+        random_odf = ODF.from_microstructure(Microstructure.random_texture(500), half_width=40.)
+        self.assertAlmostEqual(random_odf.texture_index(step=10.), 1., 1)
+
+
+class TextureComponentsTests(unittest.TestCase):
+
+    def setUp(self):
+        print('testing the texture components')
+        self.micro = Microstructure(name='components')
+        eulers = [(5., 0., 0.), (0., 0., 84.), (35., 44., 1.), (325., 45., 0.), (90., 35., 45.), (20., 30., 40.)]
+        for i in range(len(eulers)):
+            grain = Grain(i + 1, Orientation.from_euler(eulers[i]))
+            grain.volume = 1. + i
+            self.micro.grains.append(grain)
+
+    def test_texture_components(self):
+        fractions, assignment = texture_components(self.micro, ['cube', 'brass', 'copper'], tolerance=10.,
+                                                   weights=np.ones(6))
+        self.assertEqual(list(fractions.keys()), ['cube', 'brass', 'copper'])
+        # the second brass variant is only found using the orthotropic sample symmetry
+        self.assertEqual(list(assignment), [0, 0, 1, -1, 2, -1])
+        self.assertAlmostEqual(fractions['cube'], 2. / 6)
+        fractions, assignment = texture_components(self.micro, ['cube', 'brass', 'copper'], tolerance=10.,
+                                                   sample_symmetry=Symmetry.orthorhombic)
+        self.assertEqual(list(assignment), [0, 0, 1, 1, 2, -1])
+        # grain volumes are used as weights
+        self.assertAlmostEqual(fractions['brass'], 7. / 21)
+
+
+class TaylorModelTests(unittest.TestCase):
+
+    def setUp(self):
+        print('testing the TaylorModel class')
+        random.seed(42)
+        self.micro = Microstructure.random_texture(200)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_compute_step(self):
+        taylor = TaylorModel(self.micro)
+        Wp, gammas = taylor.compute_step(self.micro.grains[0])
+        self.assertEqual(np.count_nonzero(gammas), 5)
+        # the plastic spin is a skew-symmetric tensor
+        self.assertAlmostEqual(np.abs(Wp + Wp.T).max(), 0.)
+
+    def test_compression_texture(self):
+        taylor = TaylorModel(self.micro)
+        taylor.L = np.diag([0.5, 0.5, -1.])
+        taylor.dt = 0.02
+        taylor.max_time = 0.6
+        checkpoint = os.path.join(self.tmp_dir, 'taylor_checkpoint.npz')
+        g = taylor.run(checkpoint=checkpoint, checkpoint_interval=10)
+        self.assertAlmostEqual(taylor.time, 0.6)
+        # the compression axis rotates towards a <110> crystal direction
+        z = np.sort(np.abs(g[:, :, 2]), axis=1)
+        angles = np.degrees(np.arccos(np.clip(np.dot(z, np.array([0., 1., 1.]) / np.sqrt(2)), -1, 1)))
+        self.assertGreater(np.mean(angles < 10.), 0.3)
+        # restart from the checkpoint and continue the deformation
+        taylor.max_time = 0.7
+        taylor.run(checkpoint=checkpoint, restart=True)
+        self.assertAlmostEqual(taylor.time, 0.7)
+
+
+if __name__ == '__main__':
+    unittest.main()
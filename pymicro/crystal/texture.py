@@ -1,8 +1,8 @@
 """The texture module provide some utilities to generate, analyse and plot crystallographic textures.
 """
 import numpy as np
-from pymicro.crystal.lattice import Symmetry, Lattice, HklPlane, SlipSystem
-from pymicro.crystal.microstructure import Orientation, Grain, Microstructure
+from pymicro.crystal.lattice import Symmetry, Lattice, HklPlane, SlipSystem, SlipFamily
+from pymicro.crystal.microstructure import Orientation, Grain, Microstructure, orientation_matrices
 from matplotlib import pyplot as plt, colors, cm
 
 
@@ -585,77 +585,493 @@ class PoleFigure:
         PoleFigure.plot(Orientation.from_euler(np.array([phi1, Phi, phi2])), **kwargs)
 
 
+def texture_components(orientations, components=None, tolerance=15., symmetry=Symmetry.cubic,
+                       sample_symmetry=Symmetry.triclinic, weights=None, chunk_size=10000):
+    """Compute the volume fractions of a set of ideal texture components.
+
+    Each orientation is assigned to the closest component if its disorientation
+    with this component is below the tolerance angle. All the disorientations are
+    computed in one vectorized pass over the crystal (and optionally sample)
+    symmetry operators, the orientations being processed by chunks to limit the
+    memory usage.
+
+    ::
+
+      fractions, assignment = texture_components(micro, ['brass', 'copper', 's3'],
+                                                 sample_symmetry=Symmetry.orthorhombic)
+
+    :param orientations: the orientations to analyse (a `Microstructure`, a list of `Orientation`
+      instances, an array of orientation matrices or an array of Euler angles in degrees).
+    :param components: the ideal components, either a list of names of `Orientation` components
+      ('cube', 'brass', 'copper', 's3', 'goss', 'shear'), a list of `Orientation` instances or
+      a dictionary of `Orientation` instances indexed by name (the 6 named components by default).
+    :param float tolerance: the tolerance angle in degrees (15 by default).
+    :param symmetry: the crystal `Symmetry` (cubic by default).
+    :param sample_symmetry: the sample `Symmetry` (triclinic by default), use orthorhombic to
+      account for all the variants of the rolling components.
+    :param weights: the weight of each orientation, if None and a `Microstructure` is given,
+      the grain volumes are used if they are all positive, uniform weights are used otherwise.
+    :param int chunk_size: number of orientations processed at once (10000 by default).
+    :returns: a tuple with an ordered dictionary of the volume fractions of each component and
+      the array of the component index for each orientation (-1 if not assigned).
+    """
+    from collections import OrderedDict
+    if components is None:
+        components = ['cube', 'brass', 'copper', 's3', 'goss', 'shear']
+    if isinstance(components, dict):
+        names = list(components.keys())
+        components = [components[name] for name in names]
+    else:
+        names = [c if isinstance(c, str) else 'component %d' % i for (i, c) in enumerate(components)]
+        components = [getattr(Orientation, c)() if isinstance(c, str) else c for c in components]
+    g = orientation_matrices(orientations)
+    if weights is None:
+        weights = np.ones(len(g))
+        if isinstance(orientations, Microstructure):
+            volumes = orientations.get_grain_volumes()
+            if np.all(volumes > 0):
+                weights = volumes
+    weights = np.asarray(weights, dtype=float)
+    # all the variants of the components accounting for the sample symmetry
+    c = orientation_matrices(components)
+    r = sample_symmetry.symmetry_operators()
+    c_variants = np.einsum('kij,rjl->krli', c, r)  # transposed variant matrices, shape (k, r, 3, 3)
+    syms = symmetry.symmetry_operators()
+    assignment = -np.ones(len(g), dtype=int)
+    for start in range(0, len(g), chunk_size):
+        delta = np.einsum('nij,krjl->nkril', g[start:start + chunk_size], c_variants)
+        # trace of s.delta for all the crystal symmetry operators, the largest trace gives the smallest angle
+        traces = np.einsum('sil,nkrli->nkrs', syms, delta).reshape(len(delta), len(c), -1).max(axis=2)
+        omegas = np.degrees(np.arccos(np.clip(0.5 * (traces - 1), -1., 1.)))
+        closest = np.argmin(omegas, axis=1)
+        within = omegas[np.arange(len(delta)), closest] <= tolerance
+        assignment[start:start + chunk_size][within] = closest[within]
+    fractions = np.bincount(assignment[assignment >= 0], weights=weights[assignment >= 0],
+                            minlength=len(c)) / weights.sum()
+    return OrderedDict(zip(names, fractions)), assignment
+
+
+class ODF:
+    """A class to estimate and evaluate an orientation distribution function.
+
+    The ODF is estimated from a set of (weighted) discrete orientations by
+    kernel density estimation on the rotation group:
+
+    .. math::
+
+       f(g) = \\frac{1}{|S|}\\sum_i w_i \\sum_{s\\in S}K(\\omega(g, s\\,g_i))
+
+    where :math:`S` is the set of crystal symmetry operators, :math:`w_i`
+    the normalized weights and :math:`K` a radial kernel function of the
+    misorientation angle :math:`\\omega`, normalized so that the ODF is expressed
+    in multiples of a random distribution (mrd).
+
+    Two kernels are available: de la Vallee Poussin (:math:`K \\propto \\cos^{2\\kappa}(\\omega/2)`)
+    and Gaussian (:math:`K \\propto \\exp(-\\omega^2/2\\sigma^2)`), both parametrized by
+    their half width at half maximum. The kernel is truncated where it drops below
+    a small fraction of its maximum so that the ODF can be evaluated with neighbour
+    lists built with a KD-tree in the quaternion space. The cost is then linear with
+    the number of orientations instead of scaling with orientations x evaluation points.
+    """
+
+    # number of fold of the crystal symmetry axis along Z used to reduce the phi2 range
+    phi2_fold = {Symmetry.cubic: 4, Symmetry.hexagonal: 6, Symmetry.tetragonal: 4,
+                 Symmetry.orthorhombic: 2, Symmetry.triclinic: 1}
+
+    def __init__(self, orientations, weights=None, symmetry=Symmetry.cubic, kernel='de la Vallee Poussin',
+                 half_width=10., cutoff=1.e-3):
+        """
+        Create a new ODF estimated from the given orientations.
+
+        :param orientations: the orientations used to estimate the ODF (a `Microstructure`, a list of
+          `Orientation` instances, an array of orientation matrices or an array of Euler angles in degrees).
+        :param weights: the weight of each orientation (uniform by default), for instance the grain volumes.
+        :param symmetry: the crystal `Symmetry` (cubic by default).
+        :param str kernel: the kernel function, 'de la Vallee Poussin' (default) or 'gaussian'.
+        :param float half_width: the kernel half width at half maximum in degrees (10 by default).
+        :param float cutoff: relative kernel value below which it is truncated (1.e-3 by default).
+        """
+        self.g = orientation_matrices(orientations)
+        n = len(self.g)
+        if weights is None:
+            weights = np.ones(n)
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) != n:
+            raise ValueError('the number of weights (%d) does not match the number of orientations (%d)'
+                             % (len(weights), n))
+        self.weights = weights / weights.sum()
+        self.symmetry = symmetry
+        self.kernel = kernel
+        self.half_width = half_width
+        self.cutoff = cutoff
+        self._tree = None
+        self.grid = None
+        self.grid_step = None
+        self.grid_weights = None
+        self.values = None
+        # compute the kernel shape, truncation angle and normalization constant
+        self._kernel_function = self._kernel_shape()
+        omega = np.linspace(0., np.pi, 20001)
+        k = self._kernel_function(omega)
+        above = np.where(k >= cutoff)[0]
+        self.omega_max = min(omega[above[-1]], np.pi * (1 - 1.e-6))
+        # normalize the kernel with respect to the (normalized) Haar measure
+        self._norm = 1. / np.trapz(k * (1 - np.cos(omega)) / np.pi, omega)
+
+    @staticmethod
+    def from_microstructure(micro, use_volume=False, **kwargs):
+        """Estimate the ODF of a microstructure.
+
+        :param micro: the `Microstructure` instance.
+        :param bool use_volume: weight each grain orientation with its volume (False by default).
+        :param kwargs: additional parameters passed to the `ODF` constructor.
+        :returns: a new `ODF` instance.
+        """
+        weights = micro.get_grain_volumes() if use_volume else None
+        return ODF(micro, weights=weights, **kwargs)
+
+    def _kernel_shape(self):
+        """Return the kernel function of the misorientation angle (in radians) with a maximum of 1."""
+        h = np.radians(self.half_width)
+        if self.kernel.lower().startswith('de la'):
+            kappa = np.log(0.5) / (2 * np.log(np.cos(0.5 * h)))
+            return lambda omega: np.abs(np.cos(0.5 * omega)) ** (2 * kappa)
+        elif self.kernel.lower() == 'gaussian':
+            sigma = h / np.sqrt(2 * np.log(2.))
+            return lambda omega: np.exp(-omega ** 2 / (2 * sigma ** 2))
+        else:
+            raise ValueError('unsupported kernel: %s' % self.kernel)
+
+    def kernel_values(self, omega):
+        """Compute the normalized kernel for the given misorientation angles.
+
+        :param omega: the misorientation angles in radians.
+        :returns: the kernel values (in mrd).
+        """
+        omega = np.asarray(omega)
+        k = self._norm * self._kernel_function(omega)
+        k[omega > self.omega_max] = 0.
+        return k
+
+    def _build_tree(self):
+        """Build the KD-tree of all the symmetry equivalent orientations in quaternion space."""
+        from scipy.spatial import cKDTree
+        syms = self.symmetry.symmetry_operators()
+        gs = np.einsum('sij,njk->nsik', syms, self.g).reshape(-1, 3, 3)
+        q = Orientation.OrientationMatrix2Quaternion(gs)
+        # q and -q represent the same rotation
+        self._tree = cKDTree(np.concatenate((q, -q)))
+
+    def evaluate(self, orientations, chunk_pairs=4000000):
+        """Evaluate the ODF for the given orientations.
+
+        :param orientations: the orientations where to evaluate the ODF (see the `ODF` constructor).
+        :param int chunk_pairs: approximate number of neighbour pairs processed at once, the evaluation
+          points are processed by chunks to limit the memory usage.
+        :returns: the ODF values (in mrd) as a numpy array.
+        """
+        from scipy.spatial import cKDTree
+        if self._tree is None:
+            self._build_tree()
+        n_sym = len(self.symmetry.symmetry_operators())
+        q = Orientation.OrientationMatrix2Quaternion(orientation_matrices(orientations)).reshape(-1, 4)
+        # the distance between unit quaternions relates to the misorientation angle by d = 2 sin(omega / 4)
+        d_max = 2 * np.sin(0.25 * self.omega_max)
+        # fraction of the rotation space within the kernel support, used to bound the memory footprint
+        support = (self.omega_max - np.sin(self.omega_max)) / np.pi
+        chunk_size = max(1, int(chunk_pairs / max(1., support * len(self.g) * n_sym)))
+        f = np.zeros(len(q), dtype=float)
+        for start in range(0, len(q), chunk_size):
+            chunk = q[start:start + chunk_size]
+            pairs = self._tree.sparse_distance_matrix(cKDTree(chunk), d_max, output_type='coo_matrix')
+            omega = 4 * np.arcsin(np.minimum(0.5 * pairs.data, 1.))
+            # recover the orientation index from the index of the symmetry equivalent
+            index = (pairs.row % (len(self.g) * n_sym)) // n_sym
+            values = self.weights[index] * self.kernel_values(omega) / n_sym
+            f[start:start + len(chunk)] = np.bincount(pairs.col, weights=values, minlength=len(chunk))
+        return f
+
+    def fz_grid(self, step=5.):
+        """Build a grid of Euler angles covering the space reduced by the crystal symmetry.
+
+        The Euler space is reduced using the rotational symmetry of the crystal
+        around the Z axis, so :math:`\\phi_2` spans :math:`[0, 360/n]` where n is the
+        fold of this axis. Grid points are located at the center of the cells and
+        weighted by :math:`\\sin\\Phi` to account for the invariant measure.
+
+        :param float step: the grid step in degrees (5 by default).
+        :returns: a tuple with the (n, 3) array of Euler angles and the (n,) array of weights.
+        """
+        phi2_max = 360. / ODF.phi2_fold.get(self.symmetry, 1)
+        phi1 = np.arange(0., 360., step) + 0.5 * step
+        Phi = np.arange(0., 180., step) + 0.5 * step
+        phi2 = np.arange(0., phi2_max, step) + 0.5 * step
+        euler = np.array(np.meshgrid(phi1, Phi, phi2, indexing='ij')).reshape(3, -1).T
+        weights = np.sin(np.radians(euler[:, 1]))
+        return euler, weights / weights.sum()
+
+    def compute(self, step=5.):
+        """Evaluate the ODF on a grid covering the reduced Euler space.
+
+        The grid and the ODF values are stored in the `grid`, `grid_step`,
+        `grid_weights` and `values` attributes.
+
+        :param float step: the grid step in degrees (5 by default).
+        :returns: the ODF values on the grid.
+        """
+        self.grid, self.grid_weights = self.fz_grid(step)
+        self.grid_step = step
+        self.values = self.evaluate(self.grid)
+        return self.values
+
+    def texture_index(self, step=5.):
+        """Compute the texture index of this ODF.
+
+        The texture index is defined as :math:`J = \\int f(g)^2 dg`, it is equal to 1
+        for a random texture and increases with the texture sharpness.
+
+        :param float step: the grid step in degrees used to integrate the ODF (5 by default).
+        :returns float: the texture index.
+        """
+        if self.values is None or self.grid_step != step:
+            self.compute(step)
+        return np.sum(self.grid_weights * self.values ** 2)
+
+    def section(self, phi2=45., step=2.5, phi1_max=360., Phi_max=90.):
+        """Compute a constant :math:`\\phi_2` section of the ODF.
+
+        :param float phi2: the value of the :math:`\\phi_2` Euler angle of the section in degrees (45 by default).
+        :param float step: the step in degrees (2.5 by default).
+        :param float phi1_max: the maximum value of :math:`\\phi_1` in degrees (360 by default).
+        :param float Phi_max: the maximum value of :math:`\\Phi` in degrees (90 by default).
+        :returns: a tuple with the 2D arrays of :math:`\\phi_1`, :math:`\\Phi` and the ODF values.
+        """
+        phi1, Phi = np.meshgrid(np.arange(0., phi1_max + 0.5 * step, step),
+                                np.arange(0., Phi_max + 0.5 * step, step), indexing='ij')
+        euler = np.array([phi1.ravel(), Phi.ravel(), phi2 * np.ones(phi1.size)]).T
+        values = self.evaluate(euler).reshape(phi1.shape)
+        return phi1, Phi, values
+
+    def plot_sections(self, phi2s=(0., 45., 65.), step=2.5, phi1_max=90., Phi_max=90., levels=10, display=True):
+        """Plot constant :math:`\\phi_2` sections of the ODF.
+
+        :param tuple phi2s: the values of :math:`\\phi_2` in degrees for the sections (0, 45 and 65 by default).
+        :param float step: the step in degrees (2.5 by default).
+        :param float phi1_max: the maximum value of :math:`\\phi_1` in degrees (90 by default).
+        :param float Phi_max: the maximum value of :math:`\\Phi` in degrees (90 by default).
+        :param int levels: the number of contour levels (10 by default).
+        :param bool display: display the figure if True, save it as a png file otherwise (True by default).
+        """
+        fig, axes = plt.subplots(1, len(phi2s), figsize=(4 * len(phi2s), 4), squeeze=False)
+        for ax, phi2 in zip(axes[0], phi2s):
+            phi1, Phi, values = self.section(phi2, step, phi1_max, Phi_max)
+            cs = ax.contourf(phi1, Phi, values, levels, cmap=cm.jet)
+            ax.set_xlim(0, phi1_max)
+            ax.set_ylim(Phi_max, 0)
+            ax.set_aspect('equal')
+            ax.set_xlabel(r'$\phi_1$')
+            ax.set_ylabel(r'$\Phi$')
+            ax.set_title(r'$\phi_2=%g$' % phi2)
+            fig.colorbar(cs, ax=ax, shrink=0.8, label='mrd')
+        if display:
+            plt.show()
+        else:
+            plt.savefig('odf_sections.png', format='png')
+
+
+def _taylor_slip_rates(g, schmid_tensors, L, nact):
+    """Solve the full constrained Taylor problem for a set of orientations.
+
+    For each grain, the slip systems are ranked by the magnitude of their resolved
+    plastic strain rate and the active set is formed by the `nact` first linearly
+    independent systems in this ranking (the selection runs over the slip systems
+    for all the grains at once). The slip rates are then computed in one batched
+    solve (pseudo inverse when less than 5 systems are active) of the 5 independent components of
+    :math:`D = \\sum_s \\dot{\\gamma}_s m^s`.
+
+    :param g: a (n, 3, 3) array of orientation matrices.
+    :param schmid_tensors: a (n_ss, 3, 3) array of the :math:`l^s \\otimes n^s` tensors in the crystal frame.
+    :param L: the 3x3 velocity gradient in the sample frame.
+    :param int nact: the number of active slip systems (at most 5).
+    :returns: a tuple with the (n, n_ss) slip rates, the (n, 3, 3) plastic spin tensors and the (n,)
+      residuals of the strain rate decomposition.
+    """
+    D = 0.5 * (L + L.T)
+    # express the Schmid tensors in the sample frame: m = g^T.P.g
+    m = np.einsum('nji,nsjl->nsil', g, np.einsum('sjk,nkl->nsjl', schmid_tensors, g))
+    m_sym = 0.5 * (m + np.swapaxes(m, 2, 3))
+    q = 0.5 * (m - np.swapaxes(m, 2, 3))
+    components = ([0, 1, 0, 0, 1], [0, 1, 1, 2, 2])  # D11, D22, D12, D13, D23
+    V = m_sym[:, :, components[0], components[1]]  # shape (n, n_ss, 5)
+    n = len(g)
+    rows = np.arange(n)
+    # active set selection with a Gram-Schmidt orthogonalization to skip dependent systems
+    nact = min(nact, 5)
+    ranking = np.argsort(-np.abs(np.einsum('nsij,ij->ns', m_sym, D)), axis=1)
+    basis = np.zeros((n, 5, nact))
+    n_active = np.zeros(n, dtype=int)
+    active = np.zeros((n, nact), dtype=int)
+    for rank in range(len(schmid_tensors)):
+        v = V[rows, ranking[:, rank]]
+        r = v - np.einsum('nak,nk->na', basis, np.einsum('nak,na->nk', basis, v))
+        norm = np.linalg.norm(r, axis=1)
+        add = np.where((norm > 1.e-6) & (n_active < nact))[0]
+        basis[add, :, n_active[add]] = r[add] / norm[add, np.newaxis]
+        active[add, n_active[add]] = ranking[add, rank]
+        n_active[add] += 1
+    M = np.swapaxes(V[rows[:, np.newaxis], active], 1, 2)  # shape (n, 5, nact)
+    # unused slots of the active sets do not contribute
+    M *= (np.arange(nact)[np.newaxis, :] < n_active[:, np.newaxis])[:, np.newaxis, :]
+    # square systems are solved directly, the pseudo inverse is used for the others
+    d = np.tile(D[components], (n, 1))
+    gammas_active = np.zeros((n, nact))
+    square = n_active == 5
+    if np.any(square):
+        gammas_active[square] = np.linalg.solve(M[square], d[square])
+    if not np.all(square):
+        gammas_active[~square] = np.einsum('nai,na->ni', np.linalg.pinv(M[~square], rcond=1.e-6), d[~square])
+    gammas = np.zeros((n, len(schmid_tensors)))
+    np.add.at(gammas, (np.repeat(rows, nact), active.ravel()), gammas_active.ravel())
+    residuals = np.linalg.norm(np.einsum('ns,nsij->nij', gammas, m_sym) - D, axis=(1, 2))
+    Wp = np.einsum('ns,nsij->nij', gammas, q)
+    return gammas, Wp, residuals
+
+
+def _taylor_steps(args):
+    """Advance a set of orientations over several Taylor increments.
+
+    This function works on a tuple of arguments so it can be used with a
+    process pool: (g, schmid_tensors, L, dt, n_steps, nact).
+
+    :returns: the (n, 3, 3) array of the updated orientation matrices.
+    """
+    g, schmid_tensors, L, dt, n_steps, nact = args
+    W = 0.5 * (L - L.T)
+    for step in range(n_steps):
+        gammas, Wp, residuals = _taylor_slip_rates(g, schmid_tensors, L, nact)
+        # lattice spin and corresponding rotation over the increment (Rodrigues formula)
+        omega = (W - Wp) * dt
+        theta = np.sqrt(omega[:, 2, 1] ** 2 + omega[:, 0, 2] ** 2 + omega[:, 1, 0] ** 2)
+        safe_theta = np.where(theta > 0, theta, 1.)
+        K = omega / safe_theta[:, np.newaxis, np.newaxis]
+        R = np.eye(3) + np.sin(theta)[:, np.newaxis, np.newaxis] * K + \
+            (1 - np.cos(theta))[:, np.newaxis, np.newaxis] * np.einsum('nij,njk->nik', K, K)
+        # the crystal axes rotate with the lattice spin: g_new = g.R^T
+        g = np.einsum('nij,nkj->nik', g, R)
+    return g
+
+
 class TaylorModel:
     '''A class to carry out texture evolution with the Taylor model.
 
-    Briefly explain the full constrained Taylor model [ref 1938].
+    In the full constrained Taylor model, every grain undergoes the macroscopic
+    velocity gradient :math:`L`. The plastic strain rate is accommodated by
+    crystallographic slip on a set of active slip systems and the difference
+    between the macroscopic spin and the plastic spin rotates the crystal lattice.
+
+    All the grains are updated at once using batched computations, the active set
+    being preselected for each grain using the resolved strain rate of each slip
+    system. Large aggregates can be split over a process pool and the simulation
+    can be checkpointed to restart it later.
     '''
 
-    def __init__(self, microstructure):
+    def __init__(self, microstructure, slip_systems=None):
+        """Create a new Taylor model for the given microstructure.
+
+        :param microstructure: the :py:class:`~pymicro.crystal.microstructure.Microstructure` to deform.
+        :param slip_systems: the name of a slip family, a :py:class:`~pymicro.crystal.lattice.SlipFamily` instance
+          or a list of slip systems (octahedral slip systems by default).
+        """
         self.micro = microstructure  # Microstructure instance
-        self.slip_systems = SlipSystem.get_slip_systems('111')
+        if slip_systems is None:
+            slip_systems = '111'
+        if isinstance(slip_systems, str):
+            slip_systems = SlipFamily.get(slip_systems)
+        self.slip_family = slip_systems if isinstance(slip_systems, SlipFamily) else None
+        self.slip_systems = self.slip_family.slip_systems() if self.slip_family is not None else slip_systems
         self.nact = 5  # number of active slip systems in one grain to accomodate the plastic strain
         self.dt = 1.e-3
         self.max_time = 0.001  # sec
         self.time = 0.0
         self.L = np.array([[-0.5, 0.0, 0.0], [0.0, -0.5, 0.0], [0.0, 0.0, 1.0]])  # velocity gradient
+        self.g = None  # orientation matrices of all the grains, set when running the model
 
-    def compute_step(self, g, check=True):
-        Wc = np.zeros((3, 3), dtype=np.float)
-        # compute Schmid factors
-        SF = []
-        for s in self.slip_systems:
-            SF.append(g.schmid_factor(s))
-        ss_rank = np.zeros(self.nact, dtype=int)
-        # rank the slip systems by SF
-        for i in range(self.nact):
-            ss_rank[i] = np.argmax(SF)
-            print('index of ss % d is %d' % (i, ss_rank[i]))
-            SF[ss_rank[i]] = 0.0
-        # now we need to solve: L = gam1*m1 + gam2*m2+ ...
-        iu = np.triu_indices(3)  # indices of the upper part of a 3x3 matrix
-        L = self.L[iu][:5]  # form a vector with the velocity gradient components
-        M = np.zeros((5, self.nact), dtype=np.float)
-        for i in range(len(ss_rank)):
-            s = self.slip_systems[ss_rank[i]]
-            m = g.orientation.slip_system_orientation_tensor(s)
-            # m = g.orientation.slip_system_orientation_strain_tensor(s)
-            M[0, i] += m[0, 0]
-            M[1, i] += m[0, 1]
-            M[2, i] += m[0, 2]
-            M[3, i] += m[1, 1]
-            M[4, i] += m[1, 2]
-            # M[5, i] += m[2, 2]
-        dgammas = np.linalg.lstsq(M, L, rcond=1.e-3)[0]
-        '''
-        U, s, V = np.linalg.svd(M) # solve by SVD
-        print 'U:\n'
-        print U
-        print 's:\n'
-        print s
-        print 'V:\n'
-        print V
-        pinv_svd = np.dot(np.dot(V.T, np.linalg.inv(np.diag(s))), U.T)
-        dgammas_svd = np.dot(pinv_svd, L) # solving Ax=b computing x = A^-1*b
-        print 'dgammas (SVD) =', dgammas_svd
-        '''
-        print 'dgammas (LST) =', dgammas
-        if check:
-            # check consistency
-            Lcheck = np.zeros((3, 3), dtype=np.float)
-            for i in range(len(ss_rank)):
-                s = self.slip_systems[ss_rank[i]]
-                ms = g.orientation.slip_system_orientation_tensor(s)
-                # ms = g.orientation.slip_system_orientation_strain_tensor(s)
-                Lcheck += dgammas[i] * ms
-            print 'check:', np.sum(Lcheck - self.L), '\n', Lcheck
-            if abs(np.sum(Lcheck - self.L)) > 1e-1:
-                raise ValueError(
-                    'Problem with solving for plastic slip, trying to increase the number of active slip systems')
-        # compute the plastic spin
-        for i in range(len(ss_rank)):
-            s = self.slip_systems[ss_rank[i]]
-            qs = g.orientation.slip_system_orientation_rotation_tensor(s)
-            Wc += dgammas[i] * qs
-        print 'plastic spin:\n', Wc
-        return Wc, dgammas
+    def schmid_tensors(self):
+        """Compute the Schmid tensors :math:`l^s \\otimes n^s` of all the slip systems in the crystal frame.
+
+        :returns: a (n_ss, 3, 3) numpy array.
+        """
+        if self.slip_family is not None:
+            return self.slip_family.schmid_tensors
+        return np.array([np.outer(s.get_slip_direction().direction(), s.get_slip_plane().normal())
+                         for s in self.slip_systems])
+
+    def compute_step(self, g, check=True, verbose=False):
+        """Compute the plastic slip of a single grain.
+
+        :param g: the :py:class:`~pymicro.crystal.microstructure.Grain` instance.
+        :param bool check: verify that the velocity gradient is accommodated by the slip.
+        :param bool verbose: activate verbose mode.
+        :returns: a tuple with the 3x3 plastic spin tensor and the slip rates of all the slip systems.
+        """
+        gammas, Wp, residuals = _taylor_slip_rates(g.orientation.orientation_matrix().reshape(1, 3, 3),
+                                                   self.schmid_tensors(), self.L, self.nact)
+        if verbose:
+            print('slip rates: %s' % gammas[0])
+            print('plastic spin:\n%s' % Wp[0])
+        if check and residuals[0] > 1e-1:
+            raise ValueError(
+                'Problem with solving for plastic slip, trying to increase the number of active slip systems')
+        return Wp[0], gammas[0]
+
+    def run(self, n_processes=1, checkpoint=None, checkpoint_interval=100, restart=False, verbose=False):
+        """Run the Taylor simulation until the maximum time is reached.
+
+        The orientations of all the grains are updated at each time increment. At
+        the end of the simulation, the grain orientations of the microstructure are
+        updated.
+
+        :param int n_processes: the number of processes used to split the grains (1 by default).
+        :param str checkpoint: path of a npz file to save the state of the simulation (None by default).
+        :param int checkpoint_interval: number of increments between two checkpoints (100 by default).
+        :param bool restart: restart the simulation from the checkpoint file if it exists (False by default).
+        :param bool verbose: activate verbose mode.
+        :returns: the (n, 3, 3) array of the final orientation matrices.
+        """
+        import os
+        self.g = self.micro.get_orientation_matrices()
+        if restart and checkpoint and os.path.exists(checkpoint):
+            data = np.load(checkpoint)
+            self.g = data['g']
+            self.time = float(data['time'])
+            if verbose:
+                print('restarting simulation from %s at time %g' % (checkpoint, self.time))
+        schmid_tensors = self.schmid_tensors()
+        n_steps = int(round((self.max_time - self.time) / self.dt))
+        block = checkpoint_interval if checkpoint else max(n_steps, 1)
+        pool = None
+        if n_processes > 1:
+            from multiprocessing import Pool
+            pool = Pool(n_processes)
+        try:
+            while n_steps > 0:
+                steps = min(block, n_steps)
+                if pool:
+                    chunks = np.array_split(self.g, n_processes)
+                    args = [(chunk, schmid_tensors, self.L, self.dt, steps, self.nact) for chunk in chunks]
+                    self.g = np.concatenate(pool.map(_taylor_steps, args))
+                else:
+                    self.g = _taylor_steps((self.g, schmid_tensors, self.L, self.dt, steps, self.nact))
+                self.time += steps * self.dt
+                n_steps -= steps
+                if checkpoint:
+                    np.savez(checkpoint, g=self.g, time=self.time)
+                if verbose:
+                    print('time is now %g' % self.time)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        for grain, g in zip(self.micro.grains, self.g):
+            grain.orientation = Orientation(g)
+        return self.g
@@ -38,6 +38,82 @@ def read_image_sequence(data_dir, prefix, num_images, start_index=0, image_forma
     return image_stack
 
 
+def iter_txt_chunks(txt_path, usecols=None, comments='#', delimiter=None, skip_header=0, chunk_lines=1000000):
+    """Iterate over a large numerical text file by chunks of lines.
+
+    Each chunk is converted to a 2D float array with a single call to the
+    numpy parser, which is much faster than parsing line by line. The memory
+    usage is bounded by the chunk size so huge files can be streamed.
+
+    :param str txt_path: path to the text file.
+    :param usecols: the indices of the columns to keep (all by default).
+    :param str comments: lines starting with this string are ignored ('#' by default).
+    :param str delimiter: the column delimiter (white spaces by default).
+    :param int skip_header: number of lines to skip at the beginning of the file (0 by default).
+    :param int chunk_lines: the number of lines read at once (1000000 by default).
+    :returns: a generator of (n, n_cols) numpy arrays.
+    :raise ValueError: if the lines do not all have the same number of columns.
+    """
+    from itertools import islice
+    n_cols = None
+    with open(txt_path, 'r') as f:
+        for i in range(skip_header):
+            f.readline()
+        while True:
+            lines = list(islice(f, chunk_lines))
+            if not lines:
+                break
+            lines = [line for line in lines if line.strip() and not line.lstrip().startswith(comments)]
+            if not lines:
+                continue
+            text = ' '.join(lines)
+            if delimiter:
+                text = text.replace(delimiter, ' ')
+            if n_cols is None:
+                n_cols = len(lines[0].replace(delimiter, ' ').split() if delimiter else lines[0].split())
+            values = np.fromstring(text, dtype=float, sep=' ')
+            if values.size != n_cols * len(lines):
+                raise ValueError('inconsistent number of columns in %s, expected %d' % (txt_path, n_cols))
+            data = values.reshape(len(lines), n_cols)
+            if usecols is not None:
+                data = data[:, usecols]
+            yield data
+
+
+def read_txt_columns(txt_path, usecols=None, comments='#', delimiter=None, skip_header=0, chunk_lines=1000000,
+                     cache=False):
+    """Read a numerical text file into a 2D float array.
+
+    The file is parsed by chunks using `iter_txt_chunks`. If the cache option is
+    used, the data is saved as a binary `.npz` file next to the source (with the
+    same name plus the .npz extension) and reloaded instantly next time as long
+    as the source file and the reading parameters did not change.
+
+    :param str txt_path: path to the text file.
+    :param usecols: the indices of the columns to keep (all by default).
+    :param str comments: lines starting with this string are ignored ('#' by default).
+    :param str delimiter: the column delimiter (white spaces by default).
+    :param int skip_header: number of lines to skip at the beginning of the file (0 by default).
+    :param int chunk_lines: the number of lines read at once (1000000 by default).
+    :param bool cache: use a binary cache file next to the source (False by default).
+    :returns: a (n, n_cols) numpy array.
+    """
+    stat = os.stat(txt_path)
+    key = repr((None if usecols is None else list(usecols), comments, delimiter, skip_header))
+    cache_path = txt_path + '.npz'
+    if cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size and str(cached['key']) == key:
+                return cached['data']
+    chunks = list(iter_txt_chunks(txt_path, usecols=usecols, comments=comments, delimiter=delimiter,
+                                  skip_header=skip_header, chunk_lines=chunk_lines))
+    n_cols = len(usecols) if usecols is not None else 0
+    data = np.concatenate(chunks) if chunks else np.empty((0, n_cols))
+    if cache:
+        np.savez(cache_path, data=data, mtime=stat.st_mtime, size=stat.st_size, key=key)
+    return data
+
+
 def unpack_header(h):
     '''Unpack an ascii header.
 
@@ -76,6 +76,22 @@ class file_utils_Tests(unittest.TestCase):
         size = os.path.getsize('test_bool_write_as_uint8.raw')
         self.assertEqual(size, 60)
 
+    def test_read_txt_columns(self):
+        data = np.random.rand(50, 4)
+        np.savetxt('test_columns.txt', data, header='a comment line')
+        values = read_txt_columns('test_columns.txt', usecols=[0, 2], chunk_lines=7)
+        self.assertEqual(values.shape, (50, 2))
+        self.assertTrue(np.allclose(values, data[:, [0, 2]]))
+        chunks = list(iter_txt_chunks('test_columns.txt', chunk_lines=20))
+        self.assertEqual([len(chunk) for chunk in chunks], [19, 20, 11])
+        # the second reading comes from the binary cache
+        read_txt_columns('test_columns.txt', cache=True)
+        self.assertTrue(os.path.exists('test_columns.txt.npz'))
+        values = read_txt_columns('test_columns.txt', cache=True)
+        self.assertTrue(np.allclose(values, data))
+        os.remove('test_columns.txt')
+        os.remove('test_columns.txt.npz')
+
     def tearDown(self):
         os.remove('temp_20x30x10_uint8.raw')
         os.remove('temp_20x30x10_uint8.raw.info')
@@ -61,8 +61,14 @@ def flat(img, ref, dark):
     :param np.array ref: The reference image (without the sample), same shape as the image to correct.
     :param np.array dark: A 2D numpy array representing the dark image (thermal noise of the camera).
     :returns np.array float: the flat field corrected image (between 0 and 1) as a float32 numpy array.
+
+    .. note::
+
+      To correct many images with the same reference and dark, use
+      :py:class:`~pymicro.xray.detectors.FlatFieldCorrection` which computes the inverse gain once.
     '''
-    flat = (img - dark).astype(np.float32) / (ref - dark).astype(np.float32)
+    flat = np.subtract(img, dark, dtype=np.float32)
+    flat /= np.subtract(ref, dark, dtype=np.float32)
     return flat
 
 
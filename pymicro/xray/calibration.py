@@ -0,0 +1,266 @@
+"""The calibration module provide tools to calibrate the geometry of a flat detector from a powder diffraction
+image (eg. CeO2 or LaB6).
+
+The calibration proceeds in two steps: first points are picked on the Debye-Scherrer rings along radial profiles
+starting from the current beam centre, then the detector distance, beam centre and tilts are refined by least squares
+so that the 2theta angle of each point matches the one of its ring, computed from the d-spacings of the lattice:
+
+::
+
+  ceo2 = Lattice.face_centered_cubic(0.5411)
+  detector = Mar165()
+  detector.ref_pos = np.array([150., 0., 0.])
+  params, rms = calibrate(detector, ceo2, lambda_keV=30., image=image)
+
+The geometry is described by the distance from the sample to the point where the direct beam (along X) hits the
+detector, the pixel coordinates (ucen, vcen) of this point, the (kappa, delta, omega) tilts of the detector (in
+degrees, with the same convention as `RegArrayDetector2d`) and the pixel size.
+"""
+import numpy as np
+from scipy import ndimage, optimize
+from pymicro.crystal.lattice import ReflectionTable
+from pymicro.xray.xray_utils import lambda_keV_to_nm
+
+parameter_names = ('distance', 'ucen', 'vcen', 'kappa', 'delta', 'omega', 'pixel_size')
+default_refine = ('distance', 'ucen', 'vcen', 'delta', 'omega')
+
+
+def ring_two_thetas(lattice, lambda_keV, two_theta_max=None, max_miller=8, centering=None):
+    '''Compute the 2theta angles of the powder diffraction rings of a lattice.
+
+    :param Lattice lattice: the crystal lattice of the calibrant.
+    :param float lambda_keV: the X-ray energy in keV.
+    :param float two_theta_max: the maximum 2theta angle in degrees (None by default).
+    :param int max_miller: the maximum Miller index to consider (8 by default).
+    :param str centering: the centering used for the extinction rules (the lattice centering by default).
+    :returns: the sorted array of the distinct 2theta angles in degrees.
+    '''
+    lambda_nm = lambda_keV_to_nm(lambda_keV)
+    d_min = 0.5 * lambda_nm
+    if two_theta_max is not None:
+        d_min = max(d_min, 0.5 * lambda_nm / np.sin(np.radians(0.5 * two_theta_max)))
+    table = ReflectionTable.generate(lattice, max_miller=max_miller, d_min=d_min, centering=centering)
+    d_spacings = np.unique(np.round(table.d_spacings, 9))
+    return np.sort(np.degrees(2 * np.arcsin(0.5 * lambda_nm / d_spacings)))
+
+
+def tilted_directions(kappa, delta, omega):
+    '''Compute the u and v directions of a tilted detector and their derivatives with respect to the tilts.
+
+    :param float kappa: the rotation around X in radians.
+    :param float delta: the rotation around Y in radians.
+    :param float omega: the rotation around Z in radians.
+    :returns: a tuple with the u and v directions (3 elements arrays) and their derivatives as (3, 3) arrays (one
+      row per tilt angle).
+    '''
+    (ck, sk, cd, sd, co, so) = (np.cos(kappa), np.sin(kappa), np.cos(delta), np.sin(delta), np.cos(omega),
+                                np.sin(omega))
+    u = np.array([cd * so, -ck * co + sk * sd * so, -sk * co - ck * sd * so])
+    v = np.array([-sd, sk * cd, -ck * cd])
+    du = np.array([[0., sk * co + ck * sd * so, -ck * co + sk * sd * so],
+                   [-sd * so, sk * cd * so, -ck * cd * so],
+                   [cd * co, ck * so + sk * sd * co, sk * so - ck * sd * co]])
+    dv = np.array([[0., ck * cd, sk * cd],
+                   [-cd, -sk * sd, ck * sd],
+                   [0., 0., 0.]])
+    return u, v, du, dv
+
+
+def pixel_two_thetas(params, u, v, jacobian=False):
+    '''Compute the 2theta angle of pixels for a given detector geometry.
+
+    :param params: the geometry parameters, in the order given by `parameter_names`.
+    :param u: the pixel coordinates along the first direction (array).
+    :param v: the pixel coordinates along the second direction (array).
+    :param bool jacobian: if True, also return the derivatives of 2theta with respect to the parameters.
+    :returns: the 2theta angles in radians and, if requested, the (n, 7) jacobian array.
+    '''
+    (distance, ucen, vcen, kappa, delta, omega, pixel_size) = params
+    U, V, dU, dV = tilted_directions(*np.radians([kappa, delta, omega]))
+    a = np.asarray(u, dtype=float).ravel() - ucen
+    b = np.asarray(v, dtype=float).ravel() - vcen
+    P = pixel_size * (a[:, np.newaxis] * U + b[:, np.newaxis] * V)
+    P[:, 0] += distance
+    rho = np.sqrt(P[:, 1] ** 2 + P[:, 2] ** 2)
+    two_thetas = np.arctan2(rho, P[:, 0])
+    if not jacobian:
+        return two_thetas
+    # derivatives of 2theta with respect to the pixel position
+    r2 = P[:, 0] ** 2 + rho ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grad = np.stack((-rho, P[:, 0] * P[:, 1] / rho, P[:, 0] * P[:, 2] / rho), axis=1) / r2[:, np.newaxis]
+    grad[rho == 0] = 0.
+    # derivatives of the pixel position with respect to the parameters, shape (n, 7, 3)
+    dP = np.empty((len(a), 7, 3))
+    dP[:, 0] = [1., 0., 0.]
+    dP[:, 1] = -pixel_size * U
+    dP[:, 2] = -pixel_size * V
+    for i in range(3):
+        dP[:, 3 + i] = np.radians(pixel_size) * (a[:, np.newaxis] * dU[i] + b[:, np.newaxis] * dV[i])
+    dP[:, 6] = a[:, np.newaxis] * U + b[:, np.newaxis] * V
+    return two_thetas, np.einsum('npk,nk->np', dP, grad)
+
+
+def extract_ring_points(image, two_thetas, params, n_azimuth=72, window=10, min_contrast=3.):
+    '''Pick points on the powder rings of a detector image.
+
+    The image is sampled along `n_azimuth` radial profiles starting from the beam centre, all at once with a
+    linear interpolation. For each ring, the maximum of each profile is searched in a window around the expected
+    radius and refined to sub-pixel precision with a parabolic fit. The window is narrowed to half the distance to
+    the neighbouring rings and rings too close to their neighbours are skipped. Peaks not standing out of the
+    window median by `min_contrast` times the median absolute deviation are discarded.
+
+    :param image: the 2D detector image.
+    :param two_thetas: the sorted 2theta angles of the rings in degrees.
+    :param params: the approximate geometry parameters, in the order given by `parameter_names`.
+    :param int n_azimuth: the number of radial profiles (72 by default).
+    :param int window: the maximum half width in pixels of the search window (10 by default).
+    :param float min_contrast: the minimum peak contrast (3 by default).
+    :returns: a tuple with the (n, 2) array of the (u, v) coordinates of the points and the index of their ring.
+    '''
+    (distance, ucen, vcen) = params[:3]
+    pixel_size = params[6]
+    radii = distance * np.tan(np.radians(two_thetas)) / pixel_size
+    gaps = np.diff(np.concatenate(([-np.inf], radii, [np.inf])))
+    half_widths = np.minimum(window, (0.5 * np.minimum(gaps[:-1], gaps[1:])).astype(int))
+    r = np.arange(max(np.floor(radii[0]) - window - 1, 0), np.ceil(radii[-1]) + window + 2)
+    phi = np.linspace(0., 2 * np.pi, n_azimuth, endpoint=False)
+    uu = ucen + r[np.newaxis, :] * np.cos(phi)[:, np.newaxis]
+    vv = vcen + r[np.newaxis, :] * np.sin(phi)[:, np.newaxis]
+    profiles = ndimage.map_coordinates(np.asarray(image, dtype=np.float32), [uu, vv], order=1, cval=np.nan)
+    rows = np.arange(n_azimuth)
+    points, ring_ids = [], []
+    for j, radius in enumerate(radii):
+        if half_widths[j] < 3:
+            continue
+        # indices of the window around the expected radius in each profile
+        offsets = np.arange(-half_widths[j], half_widths[j] + 1)
+        idx = np.clip(int(round(radius - r[0])) + offsets, 0, len(r) - 1)
+        win = profiles[:, idx]
+        valid = ~np.any(np.isnan(win), axis=1)
+        win[~valid] = 0.
+        k = np.argmax(win, axis=1)
+        # a maximum on the window edge is the tail of a neighbouring ring
+        valid &= (k > 0) & (k < len(offsets) - 1)
+        k = np.clip(k, 1, len(offsets) - 2)
+        (y0, y1, y2) = (win[rows, k - 1], win[rows, k], win[rows, k + 1])
+        median = np.median(win, axis=1)
+        mad = np.median(np.abs(win - median[:, np.newaxis]), axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shift = 0.5 * (y0 - y2) / (y0 - 2 * y1 + y2)
+            valid &= (y1 - median > min_contrast * mad) & (np.abs(shift) <= 1)
+        radius_px = r[idx[k]] + np.where(valid, shift, 0.)
+        points.append(np.stack((ucen + radius_px * np.cos(phi), vcen + radius_px * np.sin(phi)), axis=1)[valid])
+        ring_ids.append(np.full(np.sum(valid), j, dtype=int))
+    if not points:
+        return np.empty((0, 2)), np.empty(0, dtype=int)
+    return np.concatenate(points), np.concatenate(ring_ids)
+
+
+def refine_geometry(points, ring_ids, two_thetas, params, refine=default_refine, scale=0.01):
+    '''Refine the detector geometry by least squares from points on the powder rings.
+
+    The residuals are the differences between the 2theta angle of each point and the one of its ring, the
+    jacobian is computed analytically. Note that the distance and the pixel size cannot be refined together since
+    the angles only depend on their ratio, and that kappa cannot be refined at all since a rotation of the detector
+    around the beam does not change the 2theta angles of the pixels. A robust loss is used so that the points picked
+    on a neighbouring ring have little influence.
+
+    :param points: the (n, 2) array of the (u, v) coordinates of the ring points.
+    :param ring_ids: the index of the ring of each point.
+    :param two_thetas: the 2theta angles of the rings in degrees.
+    :param params: the initial geometry parameters, in the order given by `parameter_names`.
+    :param tuple refine: the names of the parameters to refine (all but kappa and the pixel size by default).
+    :param float scale: the residual in degrees above which the loss becomes linear (0.01 by default).
+    :returns: a tuple with the refined parameters and the root mean square residual in degrees.
+    '''
+    params = np.array(params, dtype=float)
+    free = np.array([parameter_names.index(name) for name in refine])
+    target = np.radians(np.asarray(two_thetas))[ring_ids]
+
+    def residuals(x):
+        p = params.copy()
+        p[free] = x
+        return pixel_two_thetas(p, points[:, 0], points[:, 1]) - target
+
+    def jacobian(x):
+        p = params.copy()
+        p[free] = x
+        return pixel_two_thetas(p, points[:, 0], points[:, 1], jacobian=True)[1][:, free]
+
+    result = optimize.least_squares(residuals, params[free], jac=jacobian, loss='soft_l1', f_scale=np.radians(scale))
+    params[free] = result.x
+    rms = np.degrees(np.sqrt(np.mean(result.fun ** 2)))
+    return params, rms
+
+
+def detector_parameters(detector, tilts=(0., 0., 0.)):
+    '''Get the geometry parameters from the current position of a detector.
+
+    :param RegArrayDetector2d detector: the detector instance.
+    :param tuple tilts: the (kappa, delta, omega) tilts in degrees, which are not stored by the detector.
+    :returns: the geometry parameters, in the order given by `parameter_names`.
+    '''
+    beam_lab = detector.project_along_direction(np.array([1., 0., 0.]))
+    (ucen, vcen) = detector.lab_to_pixel(beam_lab)[0]
+    return np.array([beam_lab[0], ucen, vcen, tilts[0], tilts[1], tilts[2], detector.pixel_size])
+
+
+def apply_parameters(detector, params):
+    '''Position a detector according to geometry parameters.
+
+    The reference position, the u, v, w directions, the pixel size, the centre and the calib attributes are set.
+
+    :param RegArrayDetector2d detector: the detector instance.
+    :param params: the geometry parameters, in the order given by `parameter_names`.
+    '''
+    (distance, ucen, vcen, kappa, delta, omega, pixel_size) = params
+    U, V = tilted_directions(*np.radians([kappa, delta, omega]))[:2]
+    detector.u_dir, detector.v_dir = U, V
+    detector.w_dir = np.cross(U, V)
+    detector.pixel_size = pixel_size
+    detector.ref_pos = np.array([distance, 0., 0.]) + pixel_size * (
+        (0.5 * detector.size[0] - ucen) * U + (0.5 * detector.size[1] - vcen) * V)
+    detector.ucen, detector.vcen = ucen, vcen
+    detector.calib = distance / pixel_size * np.tan(np.radians(1.))
+
+
+def calibrate(detector, lattice, lambda_keV, image=None, tilts=(0., 0., 0.), refine=default_refine,
+              n_azimuth=72, n_iterations=3, verbose=False):
+    '''Calibrate the geometry of a detector from a powder diffraction image.
+
+    The ring points are picked with the current geometry and the geometry is refined; this is repeated a few
+    times, adding the outer rings progressively, so that the points are picked closer to the rings as the geometry
+    improves. The detector is finally
+    positioned with the refined parameters.
+
+    :param RegArrayDetector2d detector: the detector instance, its position is used as the initial guess.
+    :param Lattice lattice: the crystal lattice of the calibrant.
+    :param float lambda_keV: the X-ray energy in keV.
+    :param image: the powder diffraction image (the detector data by default).
+    :param tuple tilts: the initial (kappa, delta, omega) tilts in degrees.
+    :param tuple refine: the names of the parameters to refine (all but kappa and the pixel size by default).
+    :param int n_azimuth: the number of radial profiles used to pick the ring points (72 by default).
+    :param int n_iterations: the number of point picking and refinement iterations (3 by default).
+    :param bool verbose: activate verbose mode.
+    :returns: a tuple with the refined parameters and the root mean square residual in degrees.
+    '''
+    if image is None:
+        image = detector.data
+    params = detector_parameters(detector, tilts)
+    # the largest 2theta seen by the detector
+    corners = detector.pixel_to_lab(np.array([0, 0, detector.size[0], detector.size[0]]),
+                                    np.array([0, detector.size[1], 0, detector.size[1]]))
+    two_theta_max = np.degrees(np.max(np.arctan2(np.sqrt(corners[:, 1] ** 2 + corners[:, 2] ** 2), corners[:, 0])))
+    two_thetas = ring_two_thetas(lattice, lambda_keV, two_theta_max)
+    rms = None
+    for i in range(n_iterations):
+        # start with the inner rings which are well separated and add the outer ones as the geometry improves
+        n_rings = int(np.ceil(len(two_thetas) * (i + 1.) / n_iterations))
+        points, ring_ids = extract_ring_points(image, two_thetas[:n_rings], params, n_azimuth=n_azimuth)
+        params, rms = refine_geometry(points, ring_ids, two_thetas, params, refine=refine)
+        if verbose:
+            print('iteration %d: %d ring points, rms residual %.4f deg' % (i + 1, len(points), rms))
+            print(', '.join(['%s=%.4f' % (name, value) for (name, value) in zip(parameter_names, params)]))
+    apply_parameters(detector, params)
+    return params, rms
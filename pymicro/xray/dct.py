@@ -2,12 +2,14 @@
 """
 import os
 import numpy as np
+from collections import OrderedDict
 from scipy import ndimage
 from skimage.transform import radon
 from matplotlib import pyplot as plt, cm
-from pymicro.crystal.microstructure import Grain
+from pymicro.crystal.microstructure import Grain, orientation_matrices
 from pymicro.crystal.lattice import HklPlane
 from pymicro.xray.xray_utils import lambda_keV_to_nm, radiograph
+from pymicro.xray.spots import SpotTable
 
 
 def dct_projection(orientations, data, dif_grains, omega, lambda_keV, detector, lattice, include_direct_beam=True,
@@ -29,6 +31,7 @@ def dct_projection(orientations, data, dif_grains, omega, lambda_keV, detector,
 
     # add diffraction spots
     X = np.array([1., 0., 0.]) / lambda_nm
+    spots = []  # the (gid, (h, k, l), grain_data, K, g_pos_rot) values for each diffracting grain
     for (gid, (h, k, l)) in dif_grains:
         grain_data = np.where(data == gid, 1, 0)
         if np.sum(grain_data) < 1:
@@ -47,8 +50,14 @@ def dct_projection(orientations, data, dif_grains, omega, lambda_keV, detector,
         K = X + G
         # position of the grain at this rotation
         g_pos_rot = np.dot(R, g_center_mm)
-        pg = detector.project_along_direction(K, g_pos_rot)
-        (up, vp) = detector.lab_to_pixel(pg)
+        spots.append((gid, (h, k, l), grain_data, K, g_pos_rot))
+    if len(spots) == 0:
+        return full_proj
+    # project all the diffracted beams on the detector at once
+    pg = detector.project_along_direction(np.array([spot[3] for spot in spots]), np.array([spot[4] for spot in spots]))
+    uv = detector.lab_to_pixel(pg)
+    for i, (gid, (h, k, l), grain_data, K, g_pos_rot) in enumerate(spots):
+        (up, vp) = uv[i]
         if verbose:
             print('\n* gid=%d, (%d,%d,%d) plane, angle=%.1f' % (gid, h, k, l, omega))
             print('diffraction vector:', K)
@@ -236,3 +245,134 @@ def output_tikzpicture(proj_dif, omegas, gid=1, d_uv=[0, 0], suffix=''):
     f.write('\\end{tikzpicture}\n')
     f.write('\\end{document}\n')
     f.close()
+
+
+def _scattering_vectors(reflections, lattice=None):
+    """Gather the scattering vectors (in the crystal frame) of a reflection table, a list of planes or an array of
+    Miller indices (in this case the lattice must be provided)."""
+    if hasattr(reflections, 'scattering_vectors'):
+        return reflections.scattering_vectors
+    if hasattr(reflections, 'scattering_vector'):
+        reflections = [reflections]
+    if len(reflections) > 0 and hasattr(reflections[0], 'scattering_vector'):
+        return np.array([p.scattering_vector() for p in reflections])
+    if lattice is None:
+        raise ValueError('the lattice must be provided with an array of Miller indices')
+    return np.dot(np.asarray(reflections, dtype=float).reshape(-1, 3), lattice.reciprocal_matrix)
+
+
+def omega_angles(orientations, reflections, lambda_keV, lattice=None):
+    """Compute the omega angles fulfilling the Bragg condition for many grains and reflections at once.
+
+    This is the batched version of :py:meth:`~pymicro.crystal.microstructure.Orientation.dct_omega_angles`: each
+    grain sits on the vertical rotation axis and for each reflection the equation :math:`A\\cos\\omega +
+    B\\sin\\omega = C` is solved for all the (grain, reflection) pairs with array operations. The scattering angle
+    and the azimuth of the diffracted beam are computed for both solutions. The azimuth :math:`\\eta` is measured
+    in the (Y, Z) plane from the vertical axis Z towards Y.
+
+    ::
+
+      table = ReflectionTable.generate(lattice, max_miller=3, max_keV=40.)
+      omegas, two_thetas, etas, valid = omega_angles(micro, table, 40.)
+
+    :param orientations: the grain orientations, either a `Microstructure`, a list of `Orientation` or `Grain`
+      instances, a (n, 3, 3) array of orientation matrices or a (n, 3) array of Euler angles.
+    :param reflections: a `ReflectionTable`, a list of `HklPlane` or a (m, 3) array of Miller indices.
+    :param float lambda_keV: the X-ray energy in keV.
+    :param Lattice lattice: the crystal lattice, only needed when the reflections are given by Miller indices.
+    :returns tuple: (omegas, two_thetas, etas, valid) with the omega, 2theta and eta angles in degrees as
+      (n, m, 2) arrays and the (n, m) boolean array of the pairs for which the Bragg condition can be fulfilled
+      (the angles of the other pairs are nan).
+    """
+    g = orientation_matrices(orientations)
+    Gc = _scattering_vectors(reflections, lattice)
+    lambda_nm = lambda_keV_to_nm(lambda_keV)
+    Gs = np.einsum('nji,mj->nmi', g, Gc)  # scattering vectors in the sample frame
+    A = Gs[:, :, 0]
+    B = -Gs[:, :, 1]
+    C = -0.5 * lambda_nm * np.sum(Gc ** 2, axis=1)  # -2 sin(theta)^2 / lambda
+    delta = A ** 2 + B ** 2 - C ** 2
+    valid = delta >= 0
+    sq = np.sqrt(np.where(valid, delta, np.nan))
+    omegas_r = 2 * np.arctan2(np.stack((B - sq, B + sq), axis=2), (A + C)[:, :, np.newaxis])
+    # diffracted beam for both solutions
+    cw, sw = np.cos(omegas_r), np.sin(omegas_r)
+    Gx = cw * Gs[:, :, 0, np.newaxis] - sw * Gs[:, :, 1, np.newaxis]
+    Gy = sw * Gs[:, :, 0, np.newaxis] + cw * Gs[:, :, 1, np.newaxis]
+    Gz = np.broadcast_to(Gs[:, :, 2, np.newaxis], Gx.shape)
+    Kx = Gx + 1. / lambda_nm
+    two_thetas = np.degrees(np.arccos(Kx / np.sqrt(Kx ** 2 + Gy ** 2 + Gz ** 2)))
+    etas = np.degrees(np.arctan2(Gy, Gz)) % 360
+    return np.degrees(omegas_r) % 360, two_thetas, etas, valid
+
+
+def topotomo_tilts(orientations, reflections, lattice=None):
+    """Compute the topotomography alignment tilts for many grains and reflections at once.
+
+    This is the batched version of :py:meth:`~pymicro.crystal.microstructure.Orientation.topotomo_tilts`.
+
+    :param orientations: the grain orientations, either a `Microstructure`, a list of `Orientation` or `Grain`
+      instances, a (n, 3, 3) array of orientation matrices or a (n, 3) array of Euler angles.
+    :param reflections: a `ReflectionTable`, a list of `HklPlane` or a (m, 3) array of Miller indices.
+    :param Lattice lattice: the crystal lattice, only needed when the reflections are given by Miller indices.
+    :returns tuple: (ut, lt) the two (n, m) arrays of tilts to apply (in radians).
+    """
+    g = orientation_matrices(orientations)
+    Gs = np.einsum('nji,mj->nmi', g, _scattering_vectors(reflections, lattice))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ut = np.arctan(-Gs[:, :, 0] / Gs[:, :, 2])
+        lt = np.arctan(Gs[:, :, 1] / (-Gs[:, :, 0] * np.sin(ut) + Gs[:, :, 2] * np.cos(ut)))
+    return ut, lt
+
+
+def rotating_crystal_spots(orientations, reflections, lambda_keV, detector=None, omega_range=(0., 360.),
+                           positions=None, lattice=None):
+    """Simulate the diffraction spots of many grains on a rotating sample.
+
+    The sample rotates around the vertical axis in the monochromatic beam. Instead of stepping omega, the angles
+    for which each (grain, reflection) pair crosses the Bragg condition are computed analytically with
+    :py:func:`omega_angles`, and the diffracted beams are projected on the detector all at once.
+
+    :param orientations: the grain orientations, either a `Microstructure`, a list of `Orientation` or `Grain`
+      instances, a (n, 3, 3) array of orientation matrices or a (n, 3) array of Euler angles.
+    :param reflections: a `ReflectionTable`, a list of `HklPlane` or a (m, 3) array of Miller indices.
+    :param float lambda_keV: the X-ray energy in keV.
+    :param detector: a :py:class:`~pymicro.xray.detectors.RegArrayDetector2d` instance to compute the spot
+      positions (None by default).
+    :param tuple omega_range: the range of the rotation in degrees ((0, 360) by default).
+    :param positions: a (n, 3) array of the grain positions in mm in the sample frame (grains at the origin
+      by default).
+    :param Lattice lattice: the crystal lattice, only needed when the reflections are given by Miller indices.
+    :returns: a :py:class:`~pymicro.xray.spots.SpotTable` with the grain and reflection indices, the omega, 2theta and eta angles in
+      degrees and, if a detector is given, the (x, y, z) positions in the laboratory frame and the (u, v) pixel
+      coordinates of the spots (nan if the diffracted beam does not reach the detector plane).
+    """
+    omegas, two_thetas, etas, valid = omega_angles(orientations, reflections, lambda_keV, lattice)
+    omega_min, omega_max = omega_range
+    omegas = omega_min + (omegas - omega_min) % 360
+    with np.errstate(invalid='ignore'):
+        keep = valid[:, :, np.newaxis] & (omegas < omega_max)
+    grain_ids, refl_ids, solutions = np.nonzero(keep)
+    columns = OrderedDict()
+    columns['grain'] = grain_ids
+    columns['reflection'] = refl_ids
+    if hasattr(reflections, 'hkl'):
+        columns['hkl'] = reflections.hkl[refl_ids]
+    columns['omega'] = omegas[keep]
+    columns['two_theta'] = two_thetas[keep]
+    columns['eta'] = etas[keep]
+    if detector is not None:
+        tt, eta, w = np.radians(columns['two_theta']), np.radians(columns['eta']), np.radians(columns['omega'])
+        K = np.stack((np.cos(tt), np.sin(tt) * np.sin(eta), np.sin(tt) * np.cos(eta)), axis=1)
+        origins = np.zeros_like(K)
+        if positions is not None:
+            p = np.asarray(positions, dtype=float)[grain_ids]
+            origins[:, 0] = np.cos(w) * p[:, 0] - np.sin(w) * p[:, 1]
+            origins[:, 1] = np.sin(w) * p[:, 0] + np.cos(w) * p[:, 1]
+            origins[:, 2] = p[:, 2]
+        # intersection of the diffracted beams with the detector plane
+        xyz, towards = detector.project_along_direction(K, origins, return_mask=True)
+        xyz[~towards] = np.nan  # diffracted beam going away from the detector
+        columns['x'], columns['y'], columns['z'] = xyz.T
+        columns['u'], columns['v'] = detector.lab_to_pixel(xyz).T
+    return SpotTable(columns)
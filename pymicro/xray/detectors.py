@@ -1,9 +1,11 @@
 """The detectors module define classes to manipulate X-ray detectors.
 """
-import os, numpy as np
+import os, hashlib, numpy as np
+from collections import OrderedDict
 from matplotlib import pyplot as plt, cm, rcParams
 from pymicro.file.file_utils import HST_read, HST_write
 from pymicro.external.tifffile import TiffFile
+from pymicro.xray.spots import find_spots
 
 #rcParams.update({'font.size': 12})
 #rcParams['text.latex.preamble'] = [r"\usepackage{amsmath}"]
@@ -32,12 +34,33 @@ class Detector2d:
         self.pixel_size = 1.  # mm
         self.calib = 1.  # pixel by degree
         self.mask_flag = 0  # use a mask
+        self.mask = None  # boolean array, True for the pixels to exclude
         self.mask_size_increase = 0
         self.image_path = None
         self.save_path = '.'
         self.correction = 'none'  # could be none, bg, flat
         self.orientation = 'horizontal'  # either 'horizontal' or 'vertical'
 
+    def get_azimuthal_integrator(self, two_theta_mini, two_theta_maxi, two_theta_step, pixel_split=False):
+        '''Get an azimuthal integrator for the current 2theta array of the detector.
+
+        The integrator is kept and reused as long as the geometry and the binning do not change.
+
+        :param float two_theta_mini: the minimum 2theta value in degrees.
+        :param float two_theta_maxi: the maximum 2theta value in degrees.
+        :param float two_theta_step: the bin width in degrees.
+        :param bool pixel_split: split the pixel intensity between the bins it overlaps (False by default).
+        :returns: an :py:class:`~pymicro.xray.integration.AzimuthalIntegrator` instance.
+        '''
+        from pymicro.xray.integration import AzimuthalIntegrator
+        key = (two_theta_mini, two_theta_maxi, two_theta_step, pixel_split)
+        integrator = getattr(self, '_azimuthal_integrator', None)
+        if integrator is None or integrator.two_thetas is not self.two_thetas or self._azimuthal_key != key:
+            integrator = AzimuthalIntegrator(self.two_thetas, (two_theta_mini, two_theta_maxi), two_theta_step,
+                                             pixel_split=pixel_split)
+            self._azimuthal_integrator, self._azimuthal_key = integrator, key
+        return integrator
+
     def azimuthal_regroup(self, two_theta_mini=None, two_theta_maxi=None, two_theta_step=None,
                           psi_mask=None, psi_min=None, psi_max=None, write_txt=False,
                           output_image=False, debug=False):
@@ -55,24 +78,14 @@ class Detector2d:
         print('  delta range = [%.1f-%.1f] with a %g deg step (%d bins)' % (
             two_theta_mini, two_theta_maxi, two_theta_step, n_bins))
 
-        bin_edges = np.linspace(two_theta_mini, two_theta_maxi, 1 + n_bins)
-        two_theta_values = bin_edges[:-1] + 0.5 * two_theta_step
-        intensityResult = np.zeros(n_bins)  # this will be the summed intensity
-        counts = np.zeros(n_bins)  # this will be the number of pixel contributing to each point
-
-        # calculating bin indices for each pixel
-        bin_id = np.floor((self.two_thetas - two_theta_mini) / two_theta_step).astype(np.int16)
-        bin_id[self.two_thetas > two_theta_maxi] = -1
-        bin_id[self.two_thetas < two_theta_mini] = -1
-        # mark out pixels with negative intensity
-        bin_id[self.corr_data < 0] = -1
-        # mark out pixels according to the psi mask
+        integrator = self.get_azimuthal_integrator(two_theta_mini, two_theta_maxi, two_theta_step)
+        # mark out pixels with negative intensity and according to the psi mask
+        mask = self.corr_data < 0
+        if self.mask is not None:
+            mask |= self.mask
         if psi_mask is not None:
-            bin_id[psi_mask == 0] = -1
-        for ii in range(n_bins):
-            intensityResult[ii] = self.corr_data[bin_id == ii].sum()
-            counts[ii] = (bin_id == ii).sum()
-        intensityResult /= counts
+            mask |= (psi_mask == 0)
+        two_theta_values, intensityResult, counts = integrator.integrate(self.corr_data, mask=mask)
 
         if output_image:
             print self.image_path
@@ -121,36 +134,63 @@ class Detector2d:
                            fmt='%.6e')
         return two_theta_values, intensityResult, counts
 
+    def get_cake_integrator(self, two_theta_range=None, two_theta_step=None, psi_range=None, psi_step=None):
+        '''Get a (2theta, psi) cake integrator for the current angle arrays of the detector.
+
+        The integrator is kept and reused as long as the geometry and the binning do not change. The steps
+        default to one pixel (1 / calib).
+
+        :param tuple two_theta_range: the (min, max) 2theta values in degrees (the whole range by default).
+        :param float two_theta_step: the 2theta bin width in degrees.
+        :param tuple psi_range: the (min, max) psi values in degrees (the whole range by default).
+        :param float psi_step: the psi bin width in degrees.
+        :returns: a :py:class:`~pymicro.xray.integration.CakeIntegrator` instance.
+        '''
+        from pymicro.xray.integration import CakeIntegrator
+        if two_theta_step is None:
+            two_theta_step = 1. / self.calib
+        if psi_step is None:
+            psi_step = 1. / self.calib
+        key = (two_theta_range, two_theta_step, psi_range, psi_step)
+        integrator = getattr(self, '_cake_integrator', None)
+        if integrator is None or integrator.two_thetas is not self.two_thetas or integrator.psis is not self.psis \
+                or self._cake_key != key:
+            integrator = CakeIntegrator(self.two_thetas, self.psis, two_theta_range, two_theta_step, psi_range,
+                                        psi_step)
+            self._cake_integrator, self._cake_key = integrator, key
+        return integrator
+
+    def cake(self, two_theta_range=None, two_theta_step=None, psi_range=None, psi_step=None):
+        '''Regroup the corrected image on a (2theta, psi) grid in a single pass.
+
+        Pixels with a negative intensity or flagged by the mask attribute are excluded. See :py:meth:`get_cake_integrator` for the parameters.
+
+        :returns: a tuple with the 2theta and psi values of the bins, the summed intensity, the number of
+          contributing pixels and the normalised intensity (the last three being (n_two_theta, n_psi) arrays).
+        '''
+        integrator = self.get_cake_integrator(two_theta_range, two_theta_step, psi_range, psi_step)
+        mask = self.corr_data < 0
+        if self.mask is not None:
+            mask |= self.mask
+        intensity, counts, cake = integrator.integrate(self.corr_data, mask=mask)
+        return integrator.two_theta_values, integrator.psi_values, intensity, counts, cake
+
     def sagital_regroup(self, two_theta_mini=None, two_theta_maxi=None, psi_min=None, psi_max=None, psi_step=None,
                         write_txt=False, output_image=False):
         # assign default values if needed
         if not two_theta_mini: two_theta_mini = self.two_thetas.min()
         if not two_theta_maxi: two_theta_maxi = self.two_thetas.max()
-        if not psi_step: psi_step = 1. / mar.calib
+        if psi_min is None: psi_min = self.psis.min()
+        if psi_max is None: psi_max = self.psis.max()
+        if not psi_step: psi_step = 1. / self.calib
         nbOfBins = int((psi_max - psi_min) / psi_step)
         print '* Sagital regroup (psi binning)'
         print '  psi range = [%.1f-%.1f] with a %g deg step (%d bins)' % (psi_min, psi_max, psi_step, nbOfBins)
 
-        bin_edges = np.linspace(psi_min, psi_max, 1 + nbOfBins)
-        psi_values = bin_edges[:-1] + 0.5 * psi_step
-        intensityResult = np.zeros(nbOfBins);  # this will be the summed intensity
-        counts = np.zeros(nbOfBins);  # this will be the number of pixel contributing to each point
-
-        # calculating bin indices for each pixel
-        binIndices = np.floor((self.psis - psi_min) / psi_step).astype(np.int16)
-        binIndices[self.psis > psi_max] = -1
-        # mark out pixels with negative intensity
-        binIndices[self.corr_data < 0] = -1
-        # mark out pixels outside of psi range [-psi_max, psi_max]
-        if two_theta_mini:
-            binIndices[(self.two_thetas < two_theta_mini)] = -1
-        if two_theta_maxi:
-            binIndices[(self.two_thetas > two_theta_maxi)] = -1
-        for ii in range(nbOfBins):
-            intensityResult[ii] = self.corr_data[binIndices == ii].sum()
-            counts[ii] = (binIndices == ii).sum()
-        print counts
-        intensityResult /= counts
+        # a single 2theta bin covering [two_theta_mini, two_theta_maxi]
+        psi_values, _, counts, cake = self.cake((two_theta_mini, two_theta_maxi), two_theta_maxi - two_theta_mini,
+                                                (psi_min, psi_max), psi_step)[1:]
+        intensityResult, counts = cake[0], counts[0]
 
         if output_image:
             print self.image_path
@@ -185,6 +225,31 @@ class Detector2d:
                            fmt='%.6e')
         return psi_values, intensityResult, counts
 
+    def find_spots(self, **kwargs):
+        '''Find the diffraction spots in the detector data.
+
+        The detector mask, if any, is used to ignore pixels; the keyword arguments are passed to
+        :py:func:`~pymicro.xray.spots.find_spots`.
+
+        :returns: a `SpotTable` with the centroid, intensity and second moments of the spots.
+        '''
+        kwargs.setdefault('mask', self.mask)
+        return find_spots(self.data, **kwargs)
+
+    def get_flat_field(self):
+        '''Get the flat field correction for the current ref and dark images of the detector.
+
+        The correction is kept and reused as long as the ref and dark arrays are not replaced.
+
+        :returns: a :py:class:`FlatFieldCorrection` instance.
+        '''
+        flat_field = getattr(self, '_flat_field', None)
+        if flat_field is None or self._flat_field_sources[0] is not self.ref or \
+                self._flat_field_sources[1] is not self.dark:
+            flat_field = FlatFieldCorrection(self.ref, self.dark)
+            self._flat_field, self._flat_field_sources = flat_field, (self.ref, self.dark)
+        return flat_field
+
 
 class RegArrayDetector2d(Detector2d):
     '''Generic class to handle a flat detector with a regular grid of pixels.
@@ -199,7 +264,16 @@ class RegArrayDetector2d(Detector2d):
     - omega rotate around Z
     '''
 
-    def __init__(self, size=(2048, 2048), data_type=np.uint16, tilts=(0., 0., 0.)):
+    def __init__(self, size=(2048, 2048), data_type=np.uint16, tilts=(0., 0., 0.), u_dir=None, v_dir=None):
+        '''Initialization of a RegArrayDetector2d instance.
+
+        :param tuple size: the number of pixels along u and v ((2048, 2048) by default).
+        :param data_type: the data type of the images (np.uint16 by default).
+        :param tuple tilts: the (kappa, delta, omega) tilts of the detector in degrees, used to compute the u and v
+          directions.
+        :param u_dir: the direction of u in the laboratory frame (computed from the tilts by default).
+        :param v_dir: the direction of v in the laboratory frame (computed from the tilts by default).
+        '''
         Detector2d.__init__(self, size=size, data_type=data_type)
         kappa, delta, omega = np.radians(tilts[0]), np.radians(tilts[1]), np.radians(tilts[2])
         self.ref = np.ones(self.size, dtype=self.data_type)
@@ -223,7 +297,14 @@ class RegArrayDetector2d(Detector2d):
                                 np.sin(kappa)*np.cos(delta),
                                -np.cos(kappa)*np.cos(delta)])
 
+        if u_dir is not None:
+            self.u_dir = np.array(u_dir, dtype=float)
+        if v_dir is not None:
+            self.v_dir = np.array(v_dir, dtype=float)
         self.w_dir = np.cross(self.u_dir, self.v_dir)
+        self.geometry_cache_dir = None  # directory to memory-map the geometry arrays
+        self._geometry_cache = {}
+        self._geometry_cache_key = None
 
     def set_u_dir(self, tilts):
         '''Set the coordinates of the vector describing the first (horizontal) direction of the pixels.'''
@@ -273,7 +354,7 @@ class RegArrayDetector2d(Detector2d):
                 detector_edges[i * num_points + j] = corners[i] + grad[j] * (corners[i + 1] - corners[i])
         return detector_edges
 
-    def project_along_direction(self, direction, origin=[0., 0., 0.]):
+    def project_along_direction(self, direction, origin=[0., 0., 0.], return_mask=False):
         '''
         Return the intersection point of a line and the detector plane, in laboratory coordinates.
 
@@ -286,80 +367,117 @@ class RegArrayDetector2d(Detector2d):
 
            d=\dfrac{(p_0 - l_0).n}{l.n}
 
-        :param direction: the direction of the projection (in the laboratory frame).
-        :param origin: the origin of the projection ([0., 0., 0.] by default).
-        :returns: the point of projection in the detector plane (can be outside the detector bounds). 
+        Many rays can be projected at once by passing a (n, 3) array of directions and / or a (n, 3) array of
+        origins. Rays parallel to the detector plane have nan coordinates.
+
+        :param direction: the direction of the projection (in the laboratory frame), or a (n, 3) array of
+          directions.
+        :param origin: the origin of the projection ([0., 0., 0.] by default), or a (n, 3) array of origins.
+        :param bool return_mask: if True, also return a boolean mask of the rays hitting the detector plane
+          (going towards it).
+        :returns: the point of projection in the detector plane (can be outside the detector bounds), or a (n, 3)
+          array of points, and the mask if requested.
         '''
-        assert np.dot(self.w_dir, direction) != 0
-        origin = np.array(origin)
-        direction = np.array(direction)
-        d = np.dot((self.ref_pos - origin), self.w_dir) / np.dot(direction, self.w_dir)
-        p = origin + d * direction
+        origin = np.array(origin, dtype=float)
+        direction = np.array(direction, dtype=float)
+        if direction.ndim == 1 and origin.ndim == 1:
+            assert np.dot(self.w_dir, direction) != 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = np.dot((self.ref_pos - origin), self.w_dir) / np.dot(direction, self.w_dir)
+        d = np.where(np.isfinite(d), d, np.nan)
+        p = origin + np.expand_dims(d, -1) * direction
+        if return_mask:
+            with np.errstate(invalid='ignore'):
+                return p, d > 0
         return p
 
-    def lab_to_pixel(self, points):
+    def lab_to_pixel(self, points, return_mask=False):
         '''Compute the pixel numbers corresponding to a series physical point in space on the detector.
         The points can be given as an array of size (n, 3) for n points or just as a 3 elements tuple for 
         a single point.
 
         :param ndarray points: the coordinates of the points in the laboratory frame.
-        :return ndarray uv: the detector coordinates of the given points as an array of size (n, 2).
+        :param bool return_mask: if True, also return a boolean mask of the points within the detector area.
+        :return ndarray uv: the detector coordinates of the given points as an array of size (n, 2), and the mask
+          if requested.
         '''
-        if len(points) == 3:
+        points = np.asarray(points)
+        if points.ndim == 1:
             points = np.reshape(points, (1, 3))
         vec = points - np.array(self.ref_pos)
-        # check that each point is on the detector plane
-        assert np.count_nonzero(np.dot(vec, self.w_dir) > np.finfo(np.float32).eps) == 0
+        # check that each point is on the detector plane (within the precision of the coordinates)
+        tol = 4 * np.finfo(points.dtype if points.dtype.kind == 'f' else float).eps * \
+              max(1., np.nanmax(np.abs(points)) if points.size else 1., np.max(np.abs(self.ref_pos)))
+        with np.errstate(invalid='ignore'):
+            assert np.count_nonzero(np.abs(np.dot(vec, self.w_dir)) > tol) == 0
         prod = np.vstack((np.dot(vec, self.u_dir), np.dot(vec, self.v_dir))).T
         uv = prod / self.pixel_size + 0.5 * np.array(self.size)
+        if return_mask:
+            return uv, self.is_on_detector(uv[:, 0], uv[:, 1])
         return uv
 
-    def pixel_to_lab(self, u, v):
+    def is_on_detector(self, u, v):
+        '''Return a boolean mask of the pixel coordinates falling within the detector area.
+
+        :param u: the pixel coordinates along the first direction (can be arrays).
+        :param v: the pixel coordinates along the second direction (can be arrays).
+        '''
+        with np.errstate(invalid='ignore'):
+            return (u >= 0) & (u < self.size[0]) & (v >= 0) & (v < self.size[1])
+
+    def pixel_to_lab(self, u, v=None):
         """Compute the laboratory coordinates of a given pixel. , if the pixels coordinates are given using 1D arrays 
         of length n, a numpy array of size (n, 3) with the laboratory coordinates is returned. 
 
-        :param int u: the given pixel number along the first direction (can be 1D array).
+        :param int u: the given pixel number along the first direction (can be 1D array), or a (n, 2) array with
+          the (u, v) coordinates of the pixels if v is not given.
         :param int v: the given pixel number along the second direction (can be 1D array).
         :return tuple (x, y, z): the laboratory coordinates.
         """
-        '''
-        if type(u) == np.ndarray:
-            # use broadcasting
-            assert len(u) == len(v)
-            n = len(u)
-            r = (u.reshape((n, 1)) - 0.5 * self.size[0]) * self.u_dir + (v.reshape((n, 1)) - 0.5 * self.size[1]) * self.v_dir
-        else:
-            r = (u - 0.5 * self.size[0]) * self.u_dir + (v - 0.5 * self.size[1]) * self.v_dir
-        '''
-        try:
-            n = len(u)
-        except TypeError:
-            n = 1
+        if v is None:
+            uv = np.reshape(u, (-1, 2))
+            u, v = uv[:, 0], uv[:, 1]
+        n = np.size(u)
         r = (np.reshape(u, (n, 1)) - 0.5 * self.size[0]) * self.u_dir + (np.reshape(v, (n, 1)) - 0.5 * self.size[1]) * self.v_dir
         p = self.ref_pos + r * self.pixel_size
         return p
 
-    def load_image(self, image_path):
-        print('loading image %s' % image_path)
-        self.image_path = image_path
+    def read_image(self, image_path):
+        '''Read an image from a file and return it as a float32 array.
+
+        :param str image_path: the path to the image file (.tif or .raw).
+        :returns: the image data as a numpy array, or None if the file format is not recognized.
+        '''
         if image_path.endswith('.tif'):
-            self.data = TiffFile(image_path).asarray().T.astype(np.float32)
+            data = TiffFile(image_path).asarray().T.astype(np.float32)
         elif image_path.endswith('.raw'):
-            self.data = HST_read(self.image_path, data_type=self.data_type, dims=(self.size[0], self.size[1], 1))[:, :,
-                        0].astype(np.float32)
+            data = HST_read(image_path, data_type=self.data_type, dims=(self.size[0], self.size[1], 1))[:, :,
+                   0].astype(np.float32)
         else:
             print('unrecognized file format: %s' % image_path)
             return None
-        assert self.data.shape == self.size
+        assert data.shape == self.size
+        return data
+
+    def load_image(self, image_path):
+        print('loading image %s' % image_path)
+        self.image_path = image_path
+        data = self.read_image(image_path)
+        if data is None:
+            return None
+        self.data = data
         self.compute_corrected_image()
 
-    def compute_corrected_image(self):
-        if self.correction == 'none':
-            self.corr_data = self.data
-        elif self.correction == 'bg':
-            self.corr_data = self.data - self.bg
+    def correct_image(self, data):
+        '''Return the corrected version of an image according to the value of the correction attribute.'''
+        if self.correction == 'bg':
+            return data - self.bg
         elif self.correction == 'flat':
-            self.corr_data = (self.data - self.dark).astype(np.float32) / (self.ref - self.dark).astype(np.float32)
+            return self.get_flat_field().apply(data)
+        return data
+
+    def compute_corrected_image(self):
+        self.corr_data = self.correct_image(self.data)
 
     def compute_geometry(self):
         '''Calculate an array of the image size with the (2theta, psi) for each pixel.'''
@@ -368,28 +486,138 @@ class RegArrayDetector2d(Detector2d):
     def compute_TwoTh_Psi_arrays(self):
         '''Calculate two arrays (2theta, psi) TwoTheta and Psi angles arrays corresponding to repectively
         the vertical and the horizontal pixels.
+
+        The arrays are taken from the geometry cache (see :py:meth:`get_geometry`).
         '''
-        deg2rad = np.pi / 180.
-        inv_deg2rad = 1. / deg2rad
-        # distance xpad to sample, in pixel units
-        distance = self.calib / np.tan(1.0 * deg2rad)
-        u = np.linspace(0, self.size[0] - 1, self.size[0])
-        v = np.linspace(0, self.size[1] - 1, self.size[1])
-        vv, uu = np.meshgrid(v, u)
-        r = np.sqrt((uu - self.ucen) ** 2 + (vv - self.vcen) ** 2)
-        self.two_thetas = np.arctan(r / distance) * inv_deg2rad
-        self.psis = np.arccos((uu - self.ucen) / r) * inv_deg2rad
-        self.psis[vv > self.vcen] = 360 - self.psis[vv > self.vcen]
-
-    def angles_to_pixels(self, two_theta, psi):
-        '''given two values 2theta and psi in degrres (that could be arrays), compute the corresponding pixel on the detector.'''
+        self.two_thetas = self.get_geometry('two_thetas')
+        self.psis = self.get_geometry('psis')
+
+    def _geometry_key(self):
+        '''Return a tuple with all the parameters defining the pixel geometry.'''
+        return (tuple(np.ravel(self.ref_pos)), tuple(self.u_dir), tuple(self.v_dir), float(self.pixel_size),
+                tuple(self.size), self.ucen, self.vcen, self.calib)
+
+    def get_geometry(self, name):
+        '''Get a per-pixel geometry array of the detector.
+
+        The available arrays are:
+
+         * 'lab_positions': the (size[0], size[1], 3) array of the pixel positions in the laboratory frame (mm).
+         * 'two_thetas' and 'psis': the angles of each pixel in degrees, computed from the lab positions (or from
+           calib and the detector centre (ucen, vcen) if the detector is not positioned, see :py:meth:`is_positioned`).
+         * 'solid_angles': the solid angle of each pixel seen from the origin of the laboratory frame (sr).
+
+        The arrays are computed in float32 the first time they are requested and then kept in cache. The cache is
+        invalidated whenever ref_pos, the tilts (u_dir and v_dir), pixel_size, the centre, calib or the size of the
+        detector change. If the geometry_cache_dir attribute is set, the arrays are saved there as .npy files and
+        memory-mapped, so that they can also be reused from one session to the next. The arrays are read only.
+
+        :param str name: the name of the geometry array.
+        :returns: the geometry array.
+        '''
+        key = self._geometry_key()
+        if key != self._geometry_cache_key:
+            self._geometry_cache = {}
+            self._geometry_cache_key = key
+        if name not in self._geometry_cache:
+            compute = getattr(self, '_compute_%s' % name, None)
+            if compute is None:
+                raise ValueError('unknown detector geometry array: %s' % name)
+            file_path = None
+            if self.geometry_cache_dir:
+                digest = hashlib.sha1(repr(key)).hexdigest()[:16]
+                file_path = os.path.join(self.geometry_cache_dir, '%s_%s.npy' % (name, digest))
+            if file_path and os.path.exists(file_path):
+                array = np.load(file_path, mmap_mode='r')
+            else:
+                array = compute().astype(np.float32)
+                if file_path:
+                    if not os.path.exists(self.geometry_cache_dir):
+                        os.makedirs(self.geometry_cache_dir)
+                    np.save(file_path, array)
+                    array = np.load(file_path, mmap_mode='r')
+                else:
+                    array.flags.writeable = False
+            self._geometry_cache[name] = array
+        return self._geometry_cache[name]
+
+    def _compute_lab_positions(self):
+        '''Compute the positions of all the pixels in the laboratory frame.'''
+        u = (np.arange(self.size[0], dtype=np.float32) - 0.5 * self.size[0]) * self.pixel_size
+        v = (np.arange(self.size[1], dtype=np.float32) - 0.5 * self.size[1]) * self.pixel_size
+        positions = np.empty((self.size[0], self.size[1], 3), dtype=np.float32)
+        for i in range(3):
+            positions[:, :, i] = self.ref_pos[i] + u[:, np.newaxis] * self.u_dir[i] + v[np.newaxis, :] * self.v_dir[i]
+        return positions
+
+    def is_positioned(self):
+        '''Check if the detector is positioned in the laboratory frame.
+
+        This is the case when the detector plane does not contain the origin (where the sample sits), the pixel
+        angles are then computed from the pixel positions. Otherwise they are computed from calib and the detector
+        centre (ucen, vcen), which is the special case of a detector perpendicular to the beam.
+        '''
+        return abs(np.dot(self.ref_pos, self.w_dir)) > 0
+
+    def _compute_two_thetas(self):
+        '''Compute the 2theta angle of all the pixels.'''
+        if self.is_positioned():
+            positions = self.get_geometry('lab_positions').astype(float)
+            return np.degrees(np.arctan2(np.hypot(positions[:, :, 1], positions[:, :, 2]), positions[:, :, 0]))
+        # distance detector to sample, in pixel units
+        distance = self.calib / np.tan(np.radians(1.0))
+        u = np.arange(self.size[0], dtype=np.float32) - self.ucen
+        v = np.arange(self.size[1], dtype=np.float32) - self.vcen
+        r = np.hypot(u[:, np.newaxis], v[np.newaxis, :])
+        return np.degrees(np.arctan(r / distance))
+
+    def _compute_psis(self):
+        '''Compute the psi angle of all the pixels.
+
+        Psi is the azimuth around the beam, measured from -Y towards +Z (-u and -v for the default orientation).
+        '''
+        if self.is_positioned():
+            positions = self.get_geometry('lab_positions').astype(float)
+            return np.degrees(np.arctan2(positions[:, :, 2], -positions[:, :, 1])) % 360
+        u = np.arange(self.size[0], dtype=np.float32)[:, np.newaxis] - self.ucen
+        v = np.arange(self.size[1], dtype=np.float32)[np.newaxis, :] - self.vcen
+        with np.errstate(divide='ignore', invalid='ignore'):
+            psis = np.degrees(np.arccos(u / np.hypot(u, v)))
+        return np.where(v > 0, 360 - psis, psis)
+
+    def _compute_solid_angles(self):
+        '''Compute the solid angle of all the pixels seen from the origin of the laboratory frame.'''
+        positions = self.get_geometry('lab_positions')
+        distances = np.sqrt(np.sum(positions.astype(float) ** 2, axis=2))
+        return self.pixel_size ** 2 * np.abs(np.dot(positions, self.w_dir)) / distances ** 3
+
+    def angles_to_pixels(self, two_theta, psi, return_mask=False):
+        '''given two values 2theta and psi in degrres (that could be arrays), compute the corresponding pixel on the detector.
+
+        If return_mask is True, a boolean mask of the pixels within the detector area is also returned. For a
+        positioned detector, the rays going away from the detector plane are set to nan and masked out.
+        '''
+        if self.is_positioned():
+            tt, psi = np.radians(two_theta), np.radians(psi)
+            directions = np.stack(np.broadcast_arrays(np.cos(tt), -np.sin(tt) * np.cos(psi), np.sin(tt) * np.sin(psi)),
+                                  axis=-1)
+            shape = np.shape(directions)[:-1]
+            xyz, towards = self.project_along_direction(directions.reshape(-1, 3), return_mask=True)
+            xyz[~towards] = np.nan  # scattered ray going away from the detector
+            uv, on_detector = self.lab_to_pixel(xyz, return_mask=True)
+            (u, v) = uv[:, 0].reshape(shape), uv[:, 1].reshape(shape)
+            if return_mask:
+                return u, v, (towards & on_detector).reshape(shape)
+            return u, v
         distance = self.calib / np.tan(np.pi / 180.)
-        r = distance * np.tan(two_theta * np.pi / 180.)
+        r = distance * np.tan(np.asarray(two_theta) * np.pi / 180.)
         # use the psi value in [0, 2pi] range
-        psi_values = (psi * np.pi / 180.) % (2 * np.pi)
+        psi_values = (np.asarray(psi) * np.pi / 180.) % (2 * np.pi)
         u = self.ucen + r * np.cos(psi_values)
         #v = self.vcen - np.sign(psi) * np.sqrt(r ** 2 - (u - self.ucen) ** 2)
         v = self.vcen - r * np.sin(psi_values)
+        if return_mask:
+            return u, v, self.is_on_detector(u, v)
         return u, v
 
 
@@ -444,6 +672,8 @@ class Xpad(Detector2d):
 
     '''
 
+    _geometry_cache = {}  # remapping of the double pixels for each detector configuration
+
     def __init__(self):
         Detector2d.__init__(self)
         self.numberOfModules = 2
@@ -458,6 +688,24 @@ class Xpad(Detector2d):
         self.XcenDetector = 451.7 + 5 * 3
         self.YcenDetector = 116.0  # position of direct beam on xpad at del=gam=0
         self.verbose = True
+        self.angles_cache_size = 8  # number of (2theta, psi) arrays kept in cache
+        self._angles_cache = OrderedDict()
+
+    def read_image(self, image_path, stack='first'):
+        '''Read an image from a uint16 binary file (.raw) and return it as a float32 array.
+
+        :param str image_path: relative or absolute path to the file containing the image.
+        :params str stack: indicates what to do if many images are present, \
+        'first' (default) to keep only the first one, 'median' to compute \
+        the median over the third dimension.
+        '''
+        # check the use of [y, x] array instead of [x, y]
+        rawdata = HST_read(image_path, data_type=np.uint16, dims=(560, 240, 1))
+        if stack == 'first':
+            image = rawdata[:, :, 0]
+        elif stack == 'median':
+            image = np.median(rawdata, axis=2)
+        return image.astype(np.float32).transpose()
 
     def load_image(self, image_path, nxs_prefix=None, nxs_dataset=None, nxs_index=None, nxs_update_geometry=False,
                    stack='first'):
@@ -477,13 +725,7 @@ class Xpad(Detector2d):
         '''
         self.image_path = image_path
         if image_path.endswith('.raw'):
-            # check the use of [y, x] array instead of [x, y]
-            rawdata = HST_read(self.image_path, data_type=np.uint16, dims=(560, 240, 1))
-            if stack == 'first':
-                image = rawdata[:, :, 0]
-            elif stack == 'median':
-                image = np.median(rawdata, axis=2)
-            self.data = image.astype(np.float32).transpose()
+            self.data = self.read_image(image_path, stack=stack)
             self.compute_corrected_image()
         elif image_path.endswith('.nxs'):
             import tables
@@ -503,153 +745,132 @@ class Xpad(Detector2d):
             print(self.data.shape)
             self.compute_corrected_image()
         if self.orientation == 'vertical':
+            # the corrected image is already transposed
             self.data = self.data.transpose()
-            self.corr_data = self.corr_data.transpose()
             print('transposing data, shape is', self.corr_data.shape)
         if nxs_update_geometry:
             self.compute_TwoTh_Psi_arrays(diffracto_delta=delta, diffracto_gamma=gamma)
 
+    @staticmethod
+    def _junction_remap(n_chips, chip_size, factor, interp_offsets):
+        '''Compute the remapping of the raw pixels along one direction across the chip junctions.
+
+        Between two chips, the last raw pixel of the first chip and the first raw pixel of the next one are double
+        pixels. Each of them is spread over 2 corrected pixels (with the intensity divided by the double pixel
+        factor) and the corrected pixel in between is interpolated from 2 raw pixels.
+
+        :param int n_chips: the number of chips along this direction.
+        :param int chip_size: the size of a chip in pixels along this direction.
+        :param float factor: the intensity correction factor of the double pixels.
+        :param tuple interp_offsets: the positions of the 2 raw pixels used for the interpolated pixel, relative to
+          the last pixel of the first chip.
+        :returns: a tuple with the raw pixel indices and the weights, both (2, n) arrays where n is the number of
+          corrected pixels along this direction.
+        '''
+        n = n_chips * chip_size + 3 * (n_chips - 1)
+        index = np.zeros((2, n), dtype=np.int64)
+        weight = np.zeros((2, n), dtype=np.float32)
+        # regular pixels are shifted by 3 pixels per junction
+        raw = np.arange(n_chips * chip_size)
+        index[0, raw + 3 * (raw // chip_size)] = raw
+        weight[0, raw + 3 * (raw // chip_size)] = 1.
+        # double pixels at the junctions
+        j = np.arange(n_chips - 1)
+        last = (j + 1) * chip_size - 1
+        start = last + 3 * j
+        for k, raw_index in [(0, last), (1, last), (3, last + 1), (4, last + 1)]:
+            index[0, start + k] = raw_index
+            weight[0, start + k] = 1. / factor
+        for i in range(2):
+            index[i, start + 2] = last + interp_offsets[i]
+            weight[i, start + 2] = 0.5 / factor
+        return index, weight
+
     def compute_geometry(self):
-        '''Calculate the array with the corrected geometry (double pixels).'''
-
-        lines_to_remove_array = (
-            0, -3);  # adding 3 more lines, corresponding to the double pixels on the last and 1st line of the modules
-        # calculate the total number of lines to remove from the image
-        lines_to_remove = 0;  # initialize to 0 for calculating the sum. For xpad 3.2 these lines (negative value) will be added
-        for i in range(0, self.numberOfModules):
-            lines_to_remove += lines_to_remove_array[i]
-
-        # size of the resulting (corrected) image
-        image_corr1_sizeY = self.numberOfModules * self.chip_sizeY - lines_to_remove;
-        image_corr1_sizeX = (
-                                self.numberOfChips - 1) * 3 + self.numberOfChips * self.chip_sizeX;  # considers the 2.5x pixels
-
-        # calculate the corrected x coordinates
-        newX_array = np.zeros(image_corr1_sizeX)  # contains the new x coordinates
-        newX_Ifactor_array = np.zeros(image_corr1_sizeX)  # contains the mult. factor to apply for each x coordinate
-        for x in range(0, 79):  # this is the 1st chip (index chip = 0)
-            newX_array[x] = x;
-            newX_Ifactor_array[x] = 1  # no change in intensity
-
-        newX_array[79] = 79;
-        newX_Ifactor_array[79] = 1 / self.factorIdoublePixel;
-        newX_array[80] = 79;
-        newX_Ifactor_array[80] = 1 / self.factorIdoublePixel;
-        newX_array[81] = 79;
-        newX_Ifactor_array[81] = -1
-
-        for indexChip in range(1, 6):
-            temp_index0 = indexChip * 83
-            for x in range(1, 79):  # this are the regular size (130 um) pixels
-                temp_index = temp_index0 + x;
-                newX_array[temp_index] = x + 80 * indexChip;
-                newX_Ifactor_array[temp_index] = 1;  # no change in intensity
-            newX_array[temp_index0] = 80 * indexChip;
-            newX_Ifactor_array[temp_index0] = 1 / self.factorIdoublePixel;  # 1st double column
-            newX_array[temp_index0 - 1] = 80 * indexChip;
-            newX_Ifactor_array[temp_index0 - 1] = 1 / self.factorIdoublePixel;
-            newX_array[temp_index0 + 79] = 80 * indexChip + 79;
-            newX_Ifactor_array[temp_index0 + 79] = 1 / self.factorIdoublePixel;  # last double column
-            newX_array[temp_index0 + 80] = 80 * indexChip + 79;
-            newX_Ifactor_array[temp_index0 + 80] = 1 / self.factorIdoublePixel;
-            newX_array[temp_index0 + 81] = 80 * indexChip + 79;
-            newX_Ifactor_array[temp_index0 + 81] = -1;
-
-        for x in range(6 * 80 + 1, 560):  # this is the last chip (index chip = 6)
-            temp_index = 18 + x;
-            newX_array[temp_index] = x;
-            newX_Ifactor_array[temp_index] = 1;  # no change in intensity
-
-        newX_array[497] = 480;
-        newX_Ifactor_array[497] = 1 / self.factorIdoublePixel;
-        newX_array[498] = 480;
-        newX_Ifactor_array[498] = 1 / self.factorIdoublePixel;
-
-        newY_array = np.zeros(image_corr1_sizeY);  # correspondance oldY - newY
-        newY_array_moduleID = np.zeros(image_corr1_sizeY);  # will keep trace of module index
-
-        newYindex = 0;
-        for moduleIndex in range(0, self.numberOfModules):
-            for chipY in range(0, self.chip_sizeY):
-                y = chipY + self.chip_sizeY * moduleIndex;
-                newYindex = y - lines_to_remove_array[moduleIndex] * moduleIndex;
-                newY_array[newYindex] = y;
-                newY_array_moduleID[newYindex] = moduleIndex;
-        # plt.plot(newX_array)
-        # plt.plot(newY_array)
-        # plt.plot(newY_array_moduleID)
-        # plt.plot(newX_Ifactor_array)
-        # plt.show()
-        return newX_array, newY_array, newX_Ifactor_array
+        '''Calculate the remapping to correct the geometry (double pixels).
+
+        Each pixel of the corrected image is a weighted sum of up to 4 pixels of the raw image. The gather indices
+        and weights only depend on the detector configuration and are computed once and cached.
+
+        :returns: a tuple with the flat indices in the raw image and the corresponding weights, both arrays of
+          shape (4, n_lines, n_columns) where (n_lines, n_columns) is the shape of the corrected image.
+        '''
+        key = (self.numberOfModules, self.numberOfChips, self.chip_sizeY, self.chip_sizeX, self.factorIdoublePixel)
+        if key not in Xpad._geometry_cache:
+            # the double columns at the chip junctions are interpolated from their neighbours while the double
+            # lines at the module junctions are interpolated between the 2 modules
+            x_index, x_weight = Xpad._junction_remap(self.numberOfChips, self.chip_sizeX, self.factorIdoublePixel,
+                                                     (-1, 1))
+            y_index, y_weight = Xpad._junction_remap(self.numberOfModules, self.chip_sizeY, self.factorIdoublePixel,
+                                                     (0, 1))
+            shape = (4, y_index.shape[1], x_index.shape[1])
+            index = y_index[:, np.newaxis, :, np.newaxis] * self.numberOfChips * self.chip_sizeX + \
+                    x_index[np.newaxis, :, np.newaxis, :]
+            weight = y_weight[:, np.newaxis, :, np.newaxis] * x_weight[np.newaxis, :, np.newaxis, :]
+            Xpad._geometry_cache[key] = (index.reshape(shape), weight.reshape(shape))
+        return Xpad._geometry_cache[key]
+
+    def double_pixel_mask(self):
+        '''Compute a boolean mask of the corrected image, True around the double pixels.
+
+        The masked zones can be enlarged using the mask_size_increase attribute.
+        '''
+        index, weight = self.compute_geometry()
+        double_pixel_mask = np.zeros(index.shape[1:], dtype=bool)
+        hlist = ( \
+            (0, 4 + self.mask_size_increase), \
+            (77 - self.mask_size_increase, 85 + self.mask_size_increase), \
+            (160 - self.mask_size_increase, 168 + self.mask_size_increase), \
+            (243 - self.mask_size_increase, 250 + self.mask_size_increase), \
+            (326 - self.mask_size_increase, 332 + self.mask_size_increase), \
+            (410 - self.mask_size_increase, 417 + self.mask_size_increase), \
+            (492 - self.mask_size_increase, 498 + self.mask_size_increase), \
+            (573 - self.mask_size_increase, 577))
+        for (xLineStart, xLineEnd) in hlist:
+            double_pixel_mask[:, xLineStart:xLineEnd + 1] = True
+        vlist = ((118, 125),)
+        for (yLineStart, yLineEnd) in vlist:
+            double_pixel_mask[yLineStart:yLineEnd + 1, :] = True
+        if self.orientation == 'vertical':
+            double_pixel_mask = double_pixel_mask.transpose()
+        return double_pixel_mask
 
     def compute_corrected_image(self):
-        '''Compute a corrected image.
+        '''Compute the corrected image of the detector data (see :py:meth:`correct_image`).
+
+        If the mask_flag attribute is set to 1, the mask attribute is set to the double pixel mask.
+        '''
+        self.corr_data = self.correct_image(self.data)
+        self.mask = self.double_pixel_mask() if self.mask_flag == 1 else None
+
+    def correct_image(self, data):
+        '''Return the corrected version of an image or a stack of images.
 
         First the intensity is corrected either via background substraction
         or flat field correction. Then tiling and double pixels are accounted
         for to obtain a proper geometry where each pixel of the image
-        represent the same physical zone.'''
+        represent the same physical zone. Finally the image is transposed if
+        the detector orientation is vertical.
+
+        :param data: the raw image, or a stack of raw images with the image dimensions last.
+        :returns: the corrected image (or stack of images).
+        '''
         # now apply intensity corrections based on the value of self.correction
         if self.correction == 'bg':
-            self.corr_data = self.data - self.bg
+            corr_data = data - self.bg
         elif self.correction == 'flat':
-            self.corr_data = (self.data - self.dark).astype(np.float32) / (self.ref - self.dark).astype(np.float32)
-        else:
-            self.corr_data = self.data.copy()
-        newX_array, newY_array, newX_Ifactor_array = self.compute_geometry()
-        image_corr1_sizeX = len(newX_array)
-        image_corr1_sizeY = len(newY_array)
-        thisCorrectedImage = np.zeros((image_corr1_sizeY, image_corr1_sizeX))
-        for y in range(0, image_corr1_sizeY):  # correct for double pixels
-            yold = newY_array[y];
-            for x in range(0, image_corr1_sizeX):
-                xold = newX_array[x]
-                Ifactor = newX_Ifactor_array[x]
-                if (Ifactor > 0):
-                    # print "pos"
-                    thisCorrectedImage[y, x] = self.corr_data[yold, xold] * Ifactor
-                if (Ifactor < 0):
-                    # print "neg"
-                    thisCorrectedImage[y, x] = (self.corr_data[yold, xold - 1] + self.corr_data[
-                        yold, xold + 1]) / 2.0 / self.factorIdoublePixel
-
-        # correct the double lines (last and 1st line of the modules, at their junction)
-        lineIndex1 = self.chip_sizeY - 1;  # last line of module1 = 119, is the 1st line to correct
-        lineIndex5 = lineIndex1 + 3 + 1;  # 1st line of module2 (after adding the 3 empty lines), becomes the 5th line tocorrect
-        lineIndex2 = lineIndex1 + 1;
-        lineIndex3 = lineIndex1 + 2;
-        lineIndex4 = lineIndex1 + 3;
-        for x in range(0, image_corr1_sizeX):
-            i1 = thisCorrectedImage[lineIndex1, x];
-            i5 = thisCorrectedImage[lineIndex5, x];
-            i1new = i1 / self.factorIdoublePixel;
-            i5new = i5 / self.factorIdoublePixel;
-            i3 = (i1new + i5new) / 2.0;
-            thisCorrectedImage[lineIndex1, x] = i1new;
-            thisCorrectedImage[lineIndex2, x] = i1new;
-            thisCorrectedImage[lineIndex3, x] = i3;
-            thisCorrectedImage[lineIndex5, x] = i5new;
-            thisCorrectedImage[lineIndex4, x] = i5new
-
-        if self.mask_flag == 1:
-            double_pixel_mask = np.zeros_like(thisCorrectedImage)
-            hlist = ( \
-                (0, 4 + self.mask_size_increase), \
-                (77 - self.mask_size_increase, 85 + self.mask_size_increase), \
-                (160 - self.mask_size_increase, 168 + self.mask_size_increase), \
-                (243 - self.mask_size_increase, 250 + self.mask_size_increase), \
-                (326 - self.mask_size_increase, 332 + self.mask_size_increase), \
-                (410 - self.mask_size_increase, 417 + self.mask_size_increase), \
-                (492 - self.mask_size_increase, 498 + self.mask_size_increase), \
-                (573 - self.mask_size_increase, 577))
-            for (xLineStart, xLineEnd) in hlist:
-                double_pixel_mask[:, xLineStart:xLineEnd + 1] = True
-            vlist = ((118, 125),)
-            for (yLineStart, yLineEnd) in vlist:
-                double_pixel_mask[yLineStart:yLineEnd + 1, :] = True
-            self.corr_data = np.ma.array(thisCorrectedImage, mask=double_pixel_mask)
+            corr_data = self.get_flat_field().apply(data)
         else:
-            self.corr_data = thisCorrectedImage
+            corr_data = np.asarray(data)
+        # correct for double pixels and the module junction by gathering the raw pixels
+        index, weight = self.compute_geometry()
+        flat_data = corr_data.reshape(corr_data.shape[:-2] + (-1,))
+        corrected = flat_data[..., index[0]] * weight[0]
+        for k in range(1, 4):
+            corrected += flat_data[..., index[k]] * weight[k]
+        if self.orientation == 'vertical':
+            corrected = np.swapaxes(corrected, -1, -2)
+        return corrected
 
     def compute_TwoTh_Psi_arrays(self, diffracto_delta, diffracto_gamma):
         '''Computes TwoTheta and Psi angles arrays corresponding to repectively
@@ -665,66 +886,216 @@ class Xpad(Detector2d):
 
           This assume the detector is perfectly aligned with the delta and
           gamma axes (which should be the case).
+
+        The arrays are kept in a small least recently used cache (see the
+        `angles_cache_size` attribute) so that scans where delta takes a
+        handful of values do not recompute the geometry for every image.
+        The cached arrays are read only.
         '''
-        deg2rad = np.pi / 180
-        inv_deg2rad = 1 / deg2rad
+        key = (diffracto_delta, diffracto_gamma, self.deltaOffset, self.calib, self.XcenDetector,
+               self.YcenDetector, self.corr_data.shape)
+        if key in self._angles_cache:
+            # move the entry at the end to mark it as most recently used
+            self.two_thetas, self.psis = self._angles_cache.pop(key)
+        else:
+            self.two_thetas, self.psis = self._two_theta_psi(diffracto_delta, diffracto_gamma)
+            self.two_thetas.flags.writeable = False
+            self.psis.flags.writeable = False
+        self._angles_cache[key] = (self.two_thetas, self.psis)
+        while len(self._angles_cache) > max(self.angles_cache_size, 1):
+            self._angles_cache.popitem(last=False)
+        return self.two_thetas, self.psis
+
+    def _two_theta_psi(self, diffracto_delta, diffracto_gamma):
+        '''Compute the (2theta, psi) arrays for all the pixels at once, see :py:meth:`compute_TwoTh_Psi_arrays`.'''
         # distance xpad to sample, in pixel units
-        distance = self.calib / np.tan(1.0 * deg2rad)
-
-        diffracto_delta_rad = (diffracto_delta + self.deltaOffset) * deg2rad;
-        sindelta = np.sin(diffracto_delta_rad)
-        cosdelta = np.cos(diffracto_delta_rad)
-        singamma = np.sin(diffracto_gamma * deg2rad)
-        cosgamma = np.cos(diffracto_gamma * deg2rad);
-
+        distance = self.calib / np.tan(np.radians(1.0))
+        delta = np.radians(diffracto_delta + self.deltaOffset)
+        gamma = np.radians(diffracto_gamma)
         (image_corr1_sizeX, image_corr1_sizeY) = self.corr_data.shape
-        twoThArray = np.zeros_like(self.corr_data)
-        psiArray = np.zeros_like(self.corr_data)
-
-        # converting to 2th-psi
-        for x in range(0, image_corr1_sizeX):
-            for y in range(0, image_corr1_sizeY):
-                corrX = distance  # for xpad3.2 like
-                corrZ = self.YcenDetector - y  # for xpad3.2 like
-                corrY = self.XcenDetector - x  # sign is reversed
-                tempX = corrX
-                tempY = corrZ * (-1.0)
-                tempZ = corrY
-                # apply here the rotation matrixes as follows: delta rotation as Ry + gamma rotation as Rz
-                #        (cosTH  -sinTH  0)            ( cosTH  0  sinTH)
-                #   Rz = (sinTH   cosTH  0)       Ry = (   0    1    0  )
-                #        (  0       0    1)            (-sinTH  0  cosTH)
-                # apply Ry(-delta); sin = -1 sign; cos = +1 sign
-                x1 = tempX * cosdelta - tempZ * sindelta
-                y1 = tempY
-                z1 = tempX * sindelta + tempZ * cosdelta
-                # apply Rz(-gamma); due to geo consideration on the image, the gamma rotation should be negative for gam>0
-                # apply the same considerations as for the delta, and keep gam values positive
-                corrX = x1 * cosgamma + y1 * singamma
-                corrY = -x1 * singamma + y1 * cosgamma
-                corrZ = z1
-                # calculate the square values and normalization
-                corrX2 = corrX * corrX
-                corrY2 = corrY * corrY
-                corrZ2 = corrZ * corrZ
-                norm = np.sqrt(corrX2 + corrY2 + corrZ2)
-                # calculate the corresponding angles
-                # delta = angle between vector(corrX, corrY, corrZ) and the vector(1,0,0)
-                thisdelta = np.arccos(corrX / norm) * inv_deg2rad
-                # psi = angle between vector(0, corrY, corrZ) and the vector(0,1,0) *** NOT properly calculated *** but the approx should be rather good, since corrX ~0 (from -7 to +7 pixels)
-                # valid only for gam = del = 0 and flat detector
-                sign = 1;
-                if (corrZ < 0):
-                    sign = -1
-                cos_psi_rad = corrY / np.sqrt(corrY2 + corrZ2)
-                psi = np.arccos(cos_psi_rad) * inv_deg2rad * sign
-                if (psi < 0):
-                    psi += 360
-                psi -= 90
-                twoThArray[x, y] = thisdelta
-                psiArray[x, y] = psi
-        self.two_thetas = twoThArray
-        self.psis = psiArray
+        x, y = np.meshgrid(np.arange(image_corr1_sizeX), np.arange(image_corr1_sizeY), indexing='ij')
+        # pixel positions (for xpad3.2 like), the sign is reversed along x
+        pixels = np.empty((image_corr1_sizeX, image_corr1_sizeY, 3))
+        pixels[:, :, 0] = distance
+        pixels[:, :, 1] = y - self.YcenDetector
+        pixels[:, :, 2] = self.XcenDetector - x
+        # delta rotation as Ry(-delta) then gamma rotation as Rz(-gamma); due to geo consideration on the image,
+        # the gamma rotation should be negative for gam>0 (and keep gam values positive)
+        Ry = np.array([[np.cos(delta), 0., -np.sin(delta)],
+                       [0., 1., 0.],
+                       [np.sin(delta), 0., np.cos(delta)]])
+        Rz = np.array([[np.cos(gamma), np.sin(gamma), 0.],
+                       [-np.sin(gamma), np.cos(gamma), 0.],
+                       [0., 0., 1.]])
+        corr = np.dot(pixels, np.dot(Rz, Ry).T)
+        corrX, corrY, corrZ = corr[:, :, 0], corr[:, :, 1], corr[:, :, 2]
+        # delta = angle between vector(corrX, corrY, corrZ) and the vector(1,0,0)
+        twoThArray = np.degrees(np.arccos(corrX / np.sqrt(np.sum(corr ** 2, axis=2))))
+        # psi = angle between vector(0, corrY, corrZ) and the vector(0,1,0) *** NOT properly calculated *** but the
+        # approx should be rather good, since corrX ~0 (from -7 to +7 pixels)
+        # valid only for gam = del = 0 and flat detector
+        with np.errstate(divide='ignore', invalid='ignore'):
+            psiArray = np.degrees(np.arccos(corrY / np.sqrt(corrY ** 2 + corrZ ** 2)))
+            psiArray[corrZ < 0] *= -1
+            psiArray[psiArray < 0] += 360
+        psiArray -= 90
         return twoThArray, psiArray
 
 
+
+
+class FlatFieldCorrection:
+    '''Class to apply the flat field correction to images or stacks of images.
+
+    The dark image and the inverse gain 1 / (ref - dark) are computed once as float32 arrays, so that correcting
+    a frame only involves a subtraction and a multiplication done in place. Large stacks (eg. memory mapped
+    tomography scans) are corrected by chunks of frames with several threads, without ever holding the whole
+    stack in memory:
+
+    ::
+
+      ff = FlatFieldCorrection.from_series(darks, refs, hot_pixels=True)
+      stack = np.load('scan.npy', mmap_mode='r')
+      ff.correct_stack(stack, output='scan_flat.npy')
+
+    Pixels with a null or negative gain and hot pixels are replaced by the mean of their valid neighbours.
+    '''
+
+    def __init__(self, ref, dark=None, bad_pixels=None):
+        '''Initialization of a FlatFieldCorrection instance.
+
+        :param ref: the reference image (without the sample).
+        :param dark: the dark image (zero by default).
+        :param bad_pixels: a boolean array with True for the pixels to replace (eg. hot pixels).
+        '''
+        self.dark = np.zeros(np.shape(ref), dtype=np.float32) if dark is None else np.asarray(dark, dtype=np.float32)
+        gain = np.asarray(ref, dtype=np.float32) - self.dark
+        valid = gain > 0
+        self.inv_gain = np.zeros_like(gain)
+        np.divide(1., gain, out=self.inv_gain, where=valid)
+        self.bad_pixels = ~valid if bad_pixels is None else (~valid | bad_pixels)
+        self._neighbours, self._neighbour_weights = self._bad_pixel_neighbours(self.bad_pixels)
+
+    @staticmethod
+    def _bad_pixel_neighbours(bad_pixels):
+        '''Compute the indices of the 8 neighbours of each bad pixel and the weights to average the good ones.'''
+        (u, v) = np.nonzero(bad_pixels)
+        du, dv = np.meshgrid([-1, 0, 1], [-1, 0, 1], indexing='ij')
+        keep = (du != 0) | (dv != 0)
+        (nu, nv) = (u[:, np.newaxis] + du[keep], v[:, np.newaxis] + dv[keep])
+        inside = (nu >= 0) & (nu < bad_pixels.shape[0]) & (nv >= 0) & (nv < bad_pixels.shape[1])
+        (nu, nv) = (np.clip(nu, 0, bad_pixels.shape[0] - 1), np.clip(nv, 0, bad_pixels.shape[1] - 1))
+        weights = (inside & ~bad_pixels[nu, nv]).astype(np.float32)
+        n_good = weights.sum(axis=1)
+        weights[n_good > 0] /= n_good[n_good > 0, np.newaxis]
+        return (nu, nv), weights
+
+    @staticmethod
+    def hot_pixel_mask(dark, n_sigma=5.):
+        '''Find the hot pixels of a dark image.
+
+        A pixel is hot when it departs from the median of its 3x3 neighbourhood by more than n_sigma times the noise
+        level, estimated from the median absolute deviation of the difference.
+
+        :param dark: the dark image.
+        :param float n_sigma: the threshold in units of the noise level (5 by default).
+        :returns: a boolean array with True for the hot pixels.
+        '''
+        from scipy import ndimage
+        dark = np.asarray(dark, dtype=np.float32)
+        diff = dark - ndimage.median_filter(dark, size=3)
+        mad = np.median(np.abs(diff - np.median(diff)))
+        return np.abs(diff) > n_sigma * max(1.4826 * mad, np.finfo(np.float32).eps)
+
+    @staticmethod
+    def median_image(series, chunk_rows=64):
+        '''Compute the pixel wise median of a series of images.
+
+        The median is computed by blocks of rows so that a long (memory mapped) series is never fully loaded.
+
+        :param series: a 3D array with the series of images (first axis is the image index).
+        :param int chunk_rows: the number of image rows processed at once (64 by default).
+        :returns: the median image as a float32 array.
+        '''
+        median = np.empty(series.shape[1:], dtype=np.float32)
+        for i in range(0, series.shape[1], chunk_rows):
+            median[i:i + chunk_rows] = np.median(series[:, i:i + chunk_rows], axis=0)
+        return median
+
+    @staticmethod
+    def from_series(darks, refs, hot_pixels=False, n_sigma=5.):
+        '''Create a flat field correction from series of dark and reference images.
+
+        The dark and reference images are the pixel wise medians of the series, which removes the outliers such
+        as cosmic rays or zingers.
+
+        :param darks: a 3D array with the series of dark images, or a single dark image (may be None).
+        :param refs: a 3D array with the series of reference images, or a single reference image.
+        :param bool hot_pixels: detect the hot pixels in the dark image and replace them (False by default).
+        :param float n_sigma: the threshold used to detect the hot pixels (5 by default).
+        :returns: a new `FlatFieldCorrection` instance.
+        '''
+        if darks is not None and np.ndim(darks) == 3:
+            darks = FlatFieldCorrection.median_image(darks)
+        if np.ndim(refs) == 3:
+            refs = FlatFieldCorrection.median_image(refs)
+        bad_pixels = None
+        if hot_pixels and darks is not None:
+            bad_pixels = FlatFieldCorrection.hot_pixel_mask(darks, n_sigma)
+        return FlatFieldCorrection(refs, darks, bad_pixels)
+
+    def apply(self, data, out=None):
+        '''Apply the flat field correction to an image or a stack of images.
+
+        :param data: the image, or a stack of images with the image dimensions last.
+        :param out: the float32 array to write the result to, it can be `data` itself for an in place correction
+          (a new array by default).
+        :returns: the corrected image (or stack of images) as a float32 array.
+        '''
+        out = np.subtract(data, self.dark, out=out, dtype=np.float32)
+        out *= self.inv_gain
+        if len(self._neighbour_weights):
+            (nu, nv) = self._neighbours
+            out[..., self.bad_pixels] = np.sum(out[..., nu, nv] * self._neighbour_weights, axis=-1)
+        return out
+
+    def correct_stack(self, stack, output=None, chunk_size=16, n_threads=4, verbose=False):
+        '''Apply the flat field correction to a stack of images by chunks of frames.
+
+        The chunks are corrected by a pool of threads, each one only allocating a few temporary arrays of the
+        size of a frame.
+
+        :param stack: a 3D array with the stack of images (first axis is the frame index), typically memory mapped.
+        :param output: where to write the corrected stack: a float32 3D array of the same shape, or the path of a
+          .npy file written as a memory mapped array. By default the correction is done in place, which requires
+          a float32 (writable) stack.
+        :param int chunk_size: the number of frames processed at once by a thread (16 by default).
+        :param int n_threads: the number of threads (4 by default).
+        :param bool verbose: activate verbose mode.
+        :returns: the corrected stack.
+        '''
+        from multiprocessing.pool import ThreadPool
+        if output is None:
+            if stack.dtype != np.float32:
+                raise ValueError('in place correction requires a float32 stack, got %s' % stack.dtype)
+            output = stack
+        elif not isinstance(output, np.ndarray):
+            # a (str or unicode) file path
+            output = np.lib.format.open_memmap(output, mode='w+', dtype=np.float32, shape=stack.shape)
+        n_frames = len(stack)
+
+        def correct_chunk(start):
+            end = min(start + chunk_size, n_frames)
+            self.apply(stack[start:end], out=output[start:end])
+            if verbose:
+                print('corrected frames %d to %d / %d' % (start + 1, end, n_frames))
+
+        pool = ThreadPool(n_threads)
+        try:
+            pool.map(correct_chunk, range(0, n_frames, chunk_size))
+        finally:
+            pool.terminate()
+            pool.join()
+        if isinstance(output, np.memmap):
+            output.flush()
+        return output
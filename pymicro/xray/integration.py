@@ -0,0 +1,322 @@
+"""The integration module provide tools to regroup the intensity of 2D detector images.
+
+The pixel to bin assignment only depends on the detector geometry, so it is computed once and stored as a sparse
+lookup table (a CSR matrix with one row per bin and one column per pixel). Each image is then integrated with a
+single sparse matrix-vector product. Masks and normalisation (solid angle, polarisation...) are handled as pixel
+weights so that no masked arrays are needed:
+
+::
+
+  integrator = AzimuthalIntegrator(detector.two_thetas, two_theta_range=(5., 25.), two_theta_step=0.02)
+  two_theta_values, intensity, counts = integrator.integrate(detector.corr_data, mask=detector.corr_data < 0)
+"""
+import os
+import numpy as np
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from scipy import sparse
+
+
+def pixel_widths(angles):
+    '''Estimate the angular extent of each pixel of a 2D angle array.
+
+    The extent is taken as the sum of the absolute angular increments along both pixel directions.
+
+    :param angles: a 2D array with the angle value of each pixel.
+    :returns: a 2D array of the same shape with the angular width of each pixel.
+    '''
+    grad_u, grad_v = np.gradient(np.asarray(angles, dtype=float))
+    return np.abs(grad_u) + np.abs(grad_v)
+
+
+class AzimuthalIntegrator:
+    '''Class to regroup the intensity of a detector image in 2theta bins.
+
+    The pixel to bin lookup table is computed at construction. Without pixel splitting, each pixel contributes
+    entirely to the bin containing its center. With pixel splitting, each pixel covers an angular interval and
+    contributes to each bin in proportion to the overlap.
+    '''
+
+    def __init__(self, two_thetas, two_theta_range=None, two_theta_step=None, n_bins=None, pixel_split=False,
+                 two_theta_widths=None):
+        '''Build the lookup table for a given geometry.
+
+        :param two_thetas: a 2D array with the 2theta value of each pixel in degrees.
+        :param tuple two_theta_range: the (min, max) 2theta values to consider (the whole range by default).
+        :param float two_theta_step: the bin width in degrees.
+        :param int n_bins: the number of bins, used when the step is not specified (1000 by default).
+        :param bool pixel_split: split the pixel intensity between the bins it overlaps (False by default).
+        :param two_theta_widths: the angular width of each pixel for pixel splitting (estimated from the
+          2theta array by default).
+        '''
+        self.shape = two_thetas.shape
+        self.two_thetas = two_thetas
+        if two_theta_range is None:
+            two_theta_range = (two_thetas.min(), two_thetas.max())
+        self.two_theta_min, self.two_theta_max = two_theta_range
+        if two_theta_step is None:
+            if n_bins is None:
+                n_bins = 1000
+            two_theta_step = (self.two_theta_max - self.two_theta_min) / n_bins
+        self.two_theta_step = two_theta_step
+        self.n_bins = int((self.two_theta_max - self.two_theta_min) / two_theta_step)
+        self.pixel_split = pixel_split
+        bin_edges = np.linspace(self.two_theta_min, self.two_theta_max, 1 + self.n_bins)
+        self.two_theta_values = bin_edges[:-1] + 0.5 * two_theta_step
+        tt = np.asarray(two_thetas, dtype=float).ravel()
+        if pixel_split:
+            if two_theta_widths is None:
+                two_theta_widths = pixel_widths(two_thetas)
+            half_width = 0.5 * np.asarray(two_theta_widths, dtype=float).ravel()
+            self.lut = self._split_table(tt - half_width, tt + half_width)
+        else:
+            self.lut = self._center_table(tt)
+
+    def _center_table(self, tt):
+        '''Lookup table assigning each pixel to the bin containing its center.'''
+        bin_id = np.floor((tt - self.two_theta_min) / self.two_theta_step).astype(np.int64)
+        inside = (bin_id >= 0) & (bin_id < self.n_bins) & (tt >= self.two_theta_min) & (tt <= self.two_theta_max)
+        pixels = np.nonzero(inside)[0]
+        coefs = np.ones(len(pixels), dtype=np.float32)
+        return sparse.csr_matrix((coefs, (bin_id[pixels], pixels)), shape=(self.n_bins, len(tt)))
+
+    def _split_table(self, lower, upper):
+        '''Lookup table distributing each pixel interval [lower, upper] over the bins it overlaps.'''
+        first = np.floor((lower - self.two_theta_min) / self.two_theta_step).astype(np.int64)
+        last = np.floor((upper - self.two_theta_min) / self.two_theta_step).astype(np.int64)
+        width = upper - lower
+        rows, cols, coefs = [], [], []
+        # loop over the (small) number of bins a pixel may span rather than over the pixels
+        for k in range(int((last - first).max()) + 1):
+            b = first + k
+            pixels = np.nonzero((b <= last) & (b >= 0) & (b < self.n_bins))[0]
+            bin_lower = self.two_theta_min + b[pixels] * self.two_theta_step
+            overlap = np.minimum(upper[pixels], bin_lower + self.two_theta_step) - \
+                      np.maximum(lower[pixels], bin_lower)
+            rows.append(b[pixels])
+            cols.append(pixels)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                coefs.append(np.where(width[pixels] > 0, np.clip(overlap / width[pixels], 0., 1.), 1.))
+        coefs = np.concatenate(coefs).astype(np.float32)
+        return sparse.csr_matrix((coefs, (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(self.n_bins, len(lower)))
+
+    def pixel_weights(self, mask=None, normalization=None):
+        '''Combine a mask and a normalisation array into pixel weights.
+
+        :param mask: a boolean array, True for the pixels to exclude.
+        :param normalization: an array to divide the pixel intensities with (eg. solid angle or polarisation).
+        :returns: a flat float array with the weight of each pixel, or None if there is nothing to weight.
+        '''
+        if mask is None and normalization is None:
+            return None
+        weights = np.ones(np.prod(self.shape), dtype=np.float32)
+        if normalization is not None:
+            weights *= np.asarray(normalization, dtype=np.float32).ravel()
+        if mask is not None:
+            weights[np.asarray(mask, dtype=bool).ravel()] = 0.
+        return weights
+
+    def integrate(self, image, mask=None, normalization=None):
+        '''Integrate a detector image.
+
+        The normalised intensity of a bin is the sum of the contributing pixel intensities divided by the sum of
+        the contributing pixel normalisation values (the number of pixels without normalisation).
+
+        :param image: the 2D image to integrate, masked values of a numpy masked array are excluded.
+        :param mask: a boolean array, True for the pixels to exclude.
+        :param normalization: an array to divide the pixel intensities with.
+        :returns: a tuple with the 2theta values of the bins, the normalised intensity and the (weighted) number
+          of contributing pixels.
+        '''
+        if np.ma.isMaskedArray(image):
+            mask = np.ma.getmaskarray(image) if mask is None else (mask | np.ma.getmaskarray(image))
+            image = image.filled(0)
+        data = np.asarray(image, dtype=np.float32).ravel()
+        valid = None if mask is None else ~np.asarray(mask, dtype=bool).ravel()
+        if valid is None:
+            signal = self.lut.dot(data)
+            counts = self.lut.dot(np.ones_like(data))
+        else:
+            signal = self.lut.dot(data * valid)
+            counts = self.lut.dot(valid.astype(np.float32))
+        if normalization is None:
+            norm = counts
+        else:
+            weights = self.pixel_weights(mask, normalization)
+            norm = self.lut.dot(weights)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intensity = signal / norm
+        return self.two_theta_values, intensity, counts
+
+
+class CakeIntegrator:
+    '''Class to regroup the intensity of a detector image on a (2theta, psi) grid.
+
+    Each pixel is assigned once to a flat bin index of the cake, the pixels outside of the angular ranges going
+    to an extra dump bin. Integrating an image is then a single `bincount` call. The 1D profiles along 2theta and
+    psi are reductions of the cake arrays:
+
+    ::
+
+      cake = CakeIntegrator(detector.two_thetas, detector.psis, two_theta_step=0.05, psi_step=5.)
+      intensity, counts, normalised = cake.integrate(detector.corr_data)
+      two_theta_profile = cake.two_theta_profile(intensity, counts)
+    '''
+
+    def __init__(self, two_thetas, psis, two_theta_range=None, two_theta_step=None, psi_range=None, psi_step=None,
+                 n_bins=(1000, 360)):
+        '''Build the flat bin indices for a given geometry.
+
+        :param two_thetas: a 2D array with the 2theta value of each pixel in degrees.
+        :param psis: a 2D array with the psi value of each pixel in degrees.
+        :param tuple two_theta_range: the (min, max) 2theta values to consider (the whole range by default).
+        :param float two_theta_step: the 2theta bin width in degrees.
+        :param tuple psi_range: the (min, max) psi values to consider (the whole range by default).
+        :param float psi_step: the psi bin width in degrees.
+        :param tuple n_bins: the number of (2theta, psi) bins, used when the steps are not specified.
+        '''
+        self.shape = two_thetas.shape
+        self.two_thetas = two_thetas
+        self.psis = psis
+        self.two_theta_bins, self.two_theta_values, tt_id = self._bin(two_thetas, two_theta_range, two_theta_step,
+                                                                      n_bins[0])
+        self.psi_bins, self.psi_values, psi_id = self._bin(psis, psi_range, psi_step, n_bins[1])
+        self.n_bins = (len(self.two_theta_values), len(self.psi_values))
+        self.size = self.n_bins[0] * self.n_bins[1]
+        outside = (tt_id < 0) | (tt_id >= self.n_bins[0]) | (psi_id < 0) | (psi_id >= self.n_bins[1])
+        self.flat_index = tt_id * self.n_bins[1] + psi_id
+        self.flat_index[outside] = self.size  # dump bin
+        self.pixel_counts = self._bincount(self.flat_index)
+
+    @staticmethod
+    def _bin(angles, angle_range, step, n_bins):
+        '''Compute the bin edges, bin centers and bin index of each pixel for one angle.'''
+        if angle_range is None:
+            angle_range = (angles.min(), angles.max())
+        angle_min, angle_max = angle_range
+        if step is None:
+            step = float(angle_max - angle_min) / n_bins
+        n_bins = int((angle_max - angle_min) / step)
+        edges = np.linspace(angle_min, angle_min + n_bins * step, 1 + n_bins)
+        bin_id = np.floor((np.asarray(angles, dtype=float).ravel() - angle_min) / step).astype(np.int64)
+        return edges, edges[:-1] + 0.5 * step, bin_id
+
+    def _bincount(self, flat_index, weights=None):
+        '''Sum the weights in each bin of the cake and reshape, discarding the dump bin.'''
+        sums = np.bincount(flat_index, weights=weights, minlength=self.size + 1)
+        return sums[:self.size].reshape(self.n_bins)
+
+    def integrate(self, image, mask=None, normalization=None):
+        '''Integrate a detector image on the cake.
+
+        :param image: the 2D image to integrate, masked values of a numpy masked array are excluded.
+        :param mask: a boolean array, True for the pixels to exclude.
+        :param normalization: an array to divide the pixel intensities with (eg. solid angle or polarisation).
+        :returns: a tuple with the summed intensity, the (weighted) number of contributing pixels and the
+          normalised intensity, each as a (n_two_theta, n_psi) array.
+        '''
+        if np.ma.isMaskedArray(image):
+            mask = np.ma.getmaskarray(image) if mask is None else (mask | np.ma.getmaskarray(image))
+            image = image.filled(0)
+        flat_index = self.flat_index
+        if mask is not None:
+            flat_index = np.where(np.asarray(mask, dtype=bool).ravel(), self.size, flat_index)
+        intensity = self._bincount(flat_index, np.asarray(image, dtype=np.float64).ravel())
+        counts = self.pixel_counts if mask is None else self._bincount(flat_index)
+        if normalization is None:
+            norm = counts
+        else:
+            norm = self._bincount(flat_index, np.asarray(normalization, dtype=np.float64).ravel())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cake = intensity / norm
+        return intensity, counts, cake
+
+    @staticmethod
+    def two_theta_profile(intensity, counts):
+        '''Compute the normalised intensity profile along 2theta from the cake arrays.'''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return intensity.sum(axis=1) / counts.sum(axis=1)
+
+    @staticmethod
+    def psi_profile(intensity, counts):
+        '''Compute the normalised intensity profile along psi from the cake arrays.'''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return intensity.sum(axis=0) / counts.sum(axis=0)
+
+
+def batch_integrate(detector, images, integrator, output=None, mask=None, normalization=None, n_threads=2,
+                    prefetch=4, verbose=False):
+    """Integrate a series of detector images against a shared geometry.
+
+    The images are read and corrected (using the `read_image` and `correct_image` methods of the detector) by a
+    pool of background threads, up to `prefetch` frames ahead of the frame being integrated. Each integrated
+    profile is written as soon as it is computed, so that a series of thousands of frames never needs to be held
+    in memory.
+
+    :param detector: the detector used to read and correct the images (eg. a `RegArrayDetector2d` or `Xpad`).
+    :param images: a list of image file paths or a 3D array with the stack of raw images (first axis is the
+      frame index).
+    :param integrator: an :py:class:`AzimuthalIntegrator` or a :py:class:`CakeIntegrator` instance.
+    :param str output: path of the file to write the profiles to; a .h5 (or .hdf5) file holds a `profiles`
+      dataset together with the bin values, a .npy file is written as a memory mapped array (None by default).
+    :param mask: a boolean array, True for the pixels to exclude.
+    :param normalization: an array to divide the pixel intensities with.
+    :param int n_threads: the number of threads used to read and correct the images (2 by default).
+    :param int prefetch: the maximum number of frames read ahead (4 by default).
+    :param bool verbose: activate verbose mode.
+    :returns: the array of the normalised profiles, one per frame (memory mapped when writing a .npy file). With
+      a HDF5 output, the profiles are only written to the file and None is returned.
+    """
+    n_frames = len(images)
+    if isinstance(integrator, CakeIntegrator):
+        profile_shape = integrator.n_bins
+    else:
+        profile_shape = (integrator.n_bins,)
+    shape = (n_frames,) + tuple(profile_shape)
+
+    if isinstance(images, np.ndarray):
+        def load(i):
+            return detector.correct_image(images[i].astype(np.float32))
+    else:
+        def load(i):
+            return detector.correct_image(detector.read_image(images[i]))
+
+    h5_file = None
+    if output is None:
+        profiles = np.empty(shape, dtype=np.float32)
+    elif os.path.splitext(output)[1] in ['.h5', '.hdf5']:
+        import h5py
+        h5_file = h5py.File(output, 'w')
+        profiles = h5_file.create_dataset('profiles', shape=shape, dtype=np.float32,
+                                          chunks=(1,) + tuple(profile_shape))
+        h5_file.create_dataset('two_theta', data=integrator.two_theta_values)
+        if isinstance(integrator, CakeIntegrator):
+            h5_file.create_dataset('psi', data=integrator.psi_values)
+    else:
+        profiles = np.lib.format.open_memmap(output, mode='w+', dtype=np.float32, shape=shape)
+
+    pool = ThreadPool(n_threads)
+    pending = deque()
+    next_frame = 0
+    try:
+        for i in range(n_frames):
+            # keep the pool busy reading and correcting the next frames
+            while next_frame < n_frames and len(pending) < max(prefetch, 1):
+                pending.append(pool.apply_async(load, (next_frame,)))
+                next_frame += 1
+            image = pending.popleft().get()
+            result = integrator.integrate(image, mask=mask, normalization=normalization)
+            profiles[i] = result[2] if isinstance(integrator, CakeIntegrator) else result[1]
+            if verbose:
+                print('integrated frame %d / %d' % (i + 1, n_frames))
+    finally:
+        pool.terminate()
+        pool.join()
+        if h5_file is not None:
+            h5_file.close()
+    if h5_file is not None:
+        return None
+    if isinstance(profiles, np.memmap):
+        profiles.flush()
+    return profiles
@@ -2,9 +2,9 @@
 """
 import numpy as np
 from math import cos, sin, tan, atan2, pi
-from pymicro.crystal.lattice import HklPlane, Symmetry, HklDirection, HklObject
+from pymicro.crystal.lattice import Lattice, HklPlane, Symmetry, HklDirection, HklObject, ReflectionTable
 from pymicro.crystal.microstructure import Orientation
-from pymicro.xray.xray_utils import lambda_nm_to_keV, lambda_keV_to_nm
+from pymicro.xray.xray_utils import lambda_nm_to_keV, lambda_keV_to_nm, atomic_form_factor
 from pymicro.xray.dct import add_to_image
 import os
 
@@ -38,34 +38,25 @@ def select_lambda(hkl, orientation, Xu=(1., 0., 0.), verbose=False):
 
 
 def build_list(lattice=None, max_miller=3, extinction=None, Laue_extinction=False, max_keV=120.):
-    hklplanes = []
-    indices = range(-max_miller, max_miller + 1)
-    for h in indices:
-        for k in indices:
-            for l in indices:
-                if h == k == l == 0:  # skip (0, 0, 0)
-                    continue
-                if not extinction :
-                    hklplanes.append(HklPlane(h, k, l, lattice))
-                if extinction == 'FCC':
-                    # take plane if only all odd or all even hkl indices
-                    if (h % 2 == 0 and k % 2 == 0 and l % 2 == 0) or (h % 2 == 1 and k % 2 == 1 and l % 2 == 1):
-                        hklplanes.append(HklPlane(h, k, l, lattice))
-                if extinction == 'BCC':
-                    # take plane only if the sum indices is even
-                    if ((h**2 + k**2 + l**2) % 2 == 0):
-                        hklplanes.append(HklPlane(h, k, l, lattice))
-    if Laue_extinction is True:
-        lam_min = lambda_keV_to_nm(max_keV)
-        val = 2. * lattice._lengths[0] / lam_min # lattice have to be cubic !
-        print 'Limit value is %d' % val
-        for hkl in hklplanes:
-            (h, k, l) = hkl.miller_indices()
-            test = h ** 2 + k ** 2 + l ** 2
-            if val < test: # TODO check the test
-                hklplanes.remove(HklPlane(h, k, l, lattice))
-
-    return hklplanes
+    """Build a list of lattice planes.
+
+    The planes are generated with :py:meth:`~pymicro.crystal.lattice.ReflectionTable.generate` and sorted by
+    decreasing interplanar spacing.
+
+    :param lattice: the crystal lattice.
+    :param int max_miller: the maximum absolute value of the Miller indices (3 by default).
+    :param str extinction: apply the extinction rules of a 'FCC' or 'BCC' lattice, or of any lattice centering
+      ('P', 'I', 'F', 'A', 'B', 'C' or 'R'), no rule is applied by default.
+    :param bool Laue_extinction: remove the planes which cannot diffract up to max_keV (False by default).
+    :param float max_keV: the maximum X-ray energy in keV (120 by default).
+    :returns list: a list of :py:class:`~pymicro.crystal.lattice.HklPlane` instances.
+    """
+    if lattice is None:
+        lattice = Lattice.cubic(1.0)
+    centering = {None: 'P', 'FCC': 'F', 'BCC': 'I'}.get(extinction, extinction)
+    table = ReflectionTable.generate(lattice, max_miller, max_keV=max_keV if Laue_extinction else None,
+                                     centering=centering)
+    return table.planes()
 
 
 def compute_ellipsis(orientation, detector, uvw, Xu=(1., 0., 0.), n=101, verbose=False):
@@ -216,16 +207,9 @@ def diffracted_intensity(hkl, I0=1.0, symbol='Ni', verbose=False):
     :return: the diffracted intensity.
     :rtype: float.
     '''
-    # TODO find a way to load the atom scattering data from the lattice... and not load it for every reflection!
-    path = os.path.dirname(__file__)
-    scat_data = np.genfromtxt(os.path.join(path, 'data', '%s_atom_scattering.txt' % symbol))
-    # scale the intensity with the atomic scattering factor
-    q = 1 / (2 * hkl.interplanar_spacing())
-    try:
-        index = (scat_data[:, 0] < q).tolist().index(False)
-    except ValueError:
-        index = -1
-    fa = scat_data[index, 1] / scat_data[0, 1]  # should we normalize with respect to Z?
+    # scale the intensity with the atomic scattering factor (loaded only once per element)
+    q = 1 / (2 * hkl.interplanar_spacing())  # in nm^-1
+    fa = float(atomic_form_factor(symbol, 0.1 * q) / atomic_form_factor(symbol, 0.))  # should we normalize with respect to Z?
 
     I = I0 * fa
 
@@ -282,6 +266,7 @@ def compute_Laue_pattern(orientation, detector, hkl_planes=None, Xu=np.array([1.
         #if verbose:
         print('energy bounds: [{0:.1f}, {1:.1f}] keV'.format(E_min, E_max))
 
+    beams = []  # the (hkl, energy, theta, K) values for each diffracted beam
     for hkl in hkl_planes:
         (the_energy, theta) = select_lambda(hkl, orientation, Xu=Xu, verbose=False)
         if the_energy < 0:
@@ -301,17 +286,23 @@ def compute_Laue_pattern(orientation, detector, hkl_planes=None, Xu=np.array([1.
         K = diffracted_vector(hkl, orientation, Xu=Xu, use_friedel_pair=False, verbose=verbose)
         if K is None or np.dot(Xu, K) == 0:
             continue  # skip diffraction // to the detector
-        d = np.dot((detector.ref_pos - np.array([0., 0., 0.])), detector.w_dir) / np.dot(K, detector.w_dir)
-        if d < 0:
-            if verbose:
-                print('skipping diffraction not towards the detector')
-            continue
+        beams.append((hkl, the_energy, theta, K))
 
-        R = detector.project_along_direction(K, origin=[0., 0., 0.])
-        (u, v) = detector.lab_to_pixel(R)[0]
-        if verbose and u >= 0 and u < detector.size[0] and v >= 0 and v < detector.size[1]:
+    if len(beams) == 0:
+        towards_ids = []
+    else:
+        # project all the diffracted beams on the detector at once
+        R, towards = detector.project_along_direction(np.array([beam[3] for beam in beams]), return_mask=True)
+        uv, on_detector = detector.lab_to_pixel(R, return_mask=True)
+        if verbose and np.any(~towards):
+            print('skipping %d diffracted beams not towards the detector' % np.sum(~towards))
+        towards_ids = np.nonzero(towards)[0]
+    for i in towards_ids:
+        (hkl, the_energy, theta, K) = beams[i]
+        (u, v) = uv[i]
+        if verbose and on_detector[i]:
             print('* %d%d%d reflexion' % hkl.miller_indices())
-            print('diffracted beam will hit the detector at (%.3f, %.3f) mm or (%d, %d) pixels' % (R[1], R[2], u, v))
+            print('diffracted beam will hit the detector at (%.3f, %.3f) mm or (%d, %d) pixels' % (R[i, 1], R[i, 2], u, v))
             print('diffracted beam energy is {0:.1f} keV'.format(abs(the_energy)))
             print('Bragg angle is {0:.2f} deg'.format(abs(theta * 180 / pi)))
         # mark corresponding pixels on the image detector
@@ -379,10 +370,12 @@ def gnomonic_projection_point(data, OC=None):
     return data_gp
 
 
-def gnomonic_projection(detector, pixel_size=None, OC=None, verbose=False):
+def gnomonic_projection(detector, pixel_size=None, OC=None, verbose=False, spots=None):
     """This function carries out the gnomonic projection of the detector image.
     
-    The data must be of uint8 type (between 0 and 255) with diffraction spots equals to 255.
+    The data must be of uint8 type (between 0 and 255) with diffraction spots equals to 255. Alternatively, a table of 
+    spots found with :py:func:`~pymicro.xray.spots.find_spots` can be given, in which case only the spot centroids are 
+    projected and the detector data is not used.
     The function create a new detector instance (think of it as a virtual detector) located at the same position 
     as the given detector and with an inverse pixel size. The gnomonic projection is stored into this new detector data.
     The gnomonic projection of each white pixel (value at 255) is computed. The projection is carried out with respect 
@@ -392,11 +385,15 @@ def gnomonic_projection(detector, pixel_size=None, OC=None, verbose=False):
     :param float pixel_size: pixel size to use in the virtual detector for the gnomonic projection.
     :param tuple OC: coordinates of the center of the gnomonic projection in the laboratory frame.
     :param bool verbose: flag to activate verbose mode.
+    :param SpotTable spots: the diffraction spots to project (None by default).
     :returns RegArrayDetector2d gnom: A virtual detector with the gnomonic projection as its data.
     """
-    assert detector.data.dtype == np.uint8
-    dif = detector.data == 255  # boolean array used to select pixels with diffracted intensity
-    dif_indices = np.where(dif)  # (ui, vi) tuple with 1D arrays of the coordinates u and v
+    if spots is not None:
+        dif_indices = (spots['u'], spots['v'])
+    else:
+        assert detector.data.dtype == np.uint8
+        dif = detector.data == 255  # boolean array used to select pixels with diffracted intensity
+        dif_indices = np.where(dif)  # (ui, vi) tuple with 1D arrays of the coordinates u and v
     n = dif_indices[0].shape
     if verbose:
         print('%d points in the gnomonic projection' % n)
@@ -419,13 +416,9 @@ def gnomonic_projection(detector, pixel_size=None, OC=None, verbose=False):
 
     # create the gnom.data array (zeros with pixels set to 1 for gnomonic projection points)
     gnom.data = np.zeros(gnom.size, dtype=np.uint8)
-    # uvg_px = gnom.lab_to_pixel(uvg_mm)
-    uvg_px = np.zeros((uvg_mm.shape[0], 2), dtype=np.int)
-    for i in range(uvg_mm.shape[0]):
-        uvg_px[i, :] = gnom.lab_to_pixel(uvg_mm[i, :])
+    uvg_px = gnom.lab_to_pixel(uvg_mm).astype(np.int)
     # filter out point outside the virtual detector
-    detin = (uvg_px[:, 0] >= 0) & (uvg_px[:, 0] <= gnom.size[0] - 1) & \
-            (uvg_px[:, 1] >= 0) & (uvg_px[:, 1] <= gnom.size[1] - 1)
+    detin = gnom.is_on_detector(uvg_px[:, 0], uvg_px[:, 1])
     gnom.data[uvg_px[detin, 0], uvg_px[detin, 1]] = 1
     return gnom
 
@@ -687,19 +680,23 @@ def index(hkl_normals, hkl_planes, tol_angle=0.5, tol_disorientation=1.0, symmet
                 PoleFigure.plot(final_orientation, axis='Z')
         return final_orientation_matrix, ci
 
-def zone_axis_list(angle, orientation, lattice,  max_miller=5,  Xu=np.array([1., 0., 0.]), verbose=False):
+def zone_axis_list(angle, orientation, lattice,  max_miller=5,  Xu=np.array([1., 0., 0.]), indices_only=False,
+                   verbose=False):
     """
     This function allows to get easily the Miller indices of zone axis present in a pattern.
 
+    All the directions up to max_miller are rotated in the laboratory frame at once and filtered with
+    a single angular mask, only the first order directions are retained.
+
     :param float list angle: the angle max or the zone axis angle range admissible around the detector center.
     :param orientation: The orientation of the crystal lattice.
     :param lattice: The corresponding crystal lattice, instance of Lattice.
     :param int max_miller: Maximal value allowed of Miller indices direction.
     :param array Xu: The unit vector of the incident X-ray beam (default along the X-axis).
+    :param bool indices_only: return a (n, 3) array of Miller indices instead of a list (False by default).
     :param bool verbose: activate verbose mode (default False).
     :return: A list of HklDirection instance of all zone axis in the angle range.
     """
-    ZA_list = []
     if len(angle) == 1:
         angle_max = angle[0] * np.pi / 180.
         angle_min = 0.
@@ -707,22 +704,22 @@ def zone_axis_list(angle, orientation, lattice,  max_miller=5,  Xu=np.array([1.,
         angle_max = max(angle) * np.pi / 180.
         angle_min = min(angle) * np.pi / 180.
         print("Get the indices of directions between [%d, %d] degrees" %(min(angle), max(angle)))
-    indices = range(-max_miller, max_miller+1)
-    for h in indices:
-        for k in indices:
-            for l in indices:
-                if h == k == l == 0:  # skip (0, 0, 0)
-                    continue
-                uvw = HklDirection(h, k, l, lattice)
-                # compute the direction in the lab frame
-                ZA = np.dot(orientation.orientation_matrix().transpose(), uvw.direction())
-                psi = np.arccos(np.dot(ZA, Xu))
-                if angle_min < psi < angle_max:
-                    if verbose == True:
-                        print('found zone axis [%d%d%d] at %.1f deg from incident beam' % (h,k,l,(psi*180/pi)))
-                    ZA_list.append(uvw) #zones axis list which are inferior with max angle
-    ZA_list = HklObject.skip_higher_order(ZA_list)
-    return ZA_list
+    uvw = HklObject.miller_indices_grid(max_miller)
+    # compute the directions in the lab frame
+    ZA = np.dot(uvw, lattice.matrix)
+    ZA /= np.linalg.norm(ZA, axis=1)[:, np.newaxis]
+    ZA = np.dot(ZA, orientation.orientation_matrix())
+    psi = np.arccos(np.clip(np.dot(ZA, Xu), -1., 1.))
+    in_range = (angle_min < psi) & (psi < angle_max)
+    uvw, psi = uvw[in_range], psi[in_range]
+    first_order = HklObject.skip_higher_order_indices(uvw)
+    uvw, psi = uvw[first_order], psi[first_order]
+    if verbose:
+        for (h, k, l), p in zip(uvw, psi):
+            print('found zone axis [%d%d%d] at %.1f deg from incident beam' % (h, k, l, (p * 180 / pi)))
+    if indices_only:
+        return uvw
+    return [HklDirection(h, k, l, lattice) for (h, k, l) in uvw.tolist()]
 
 def get_gnomonic_edges(detector, gnom, OC=None, num_points=21):
     """
@@ -751,10 +748,24 @@ def diffracting_normals_vector(gnom):
     :return: Normalized normal vector of diffracting plane
     """
     uv_g = np.argwhere(gnom.data == 1)  # points on the gnomonic projection
-    OP = [gnom.pixel_to_lab(uv_g[i, 0], uv_g[i, 1]).tolist() for i in range(len(uv_g))]
-    hkl_normals = [(n / np.linalg.norm(n)).tolist() for n in OP]  # normalized list of vectors
+    OP = gnom.pixel_to_lab(uv_g)
+    hkl_normals = (OP / np.linalg.norm(OP, axis=1)[:, np.newaxis]).tolist()  # normalized list of vectors
     print('%d normals found in the gnomonic projection' % len(hkl_normals))
 
     return hkl_normals
 
 
+def spots_normals(detector, spots, OC=None):
+    """Compute the normals of the diffracting planes from the spots found on the detector.
+
+    The gnomonic projection of the spot centroids is computed directly, without rasterizing it on a virtual detector.
+
+    :param RegArrayDetector2d detector: the detector instance on which the spots were found.
+    :param SpotTable spots: the diffraction spots, as found by :py:func:`~pymicro.xray.spots.find_spots`.
+    :param ndarray OC: coordinates of the center of the gnomonic projection in the laboratory frame.
+    :return: a (n, 3) array of the normalized normals of the diffracting planes.
+    """
+    OP = gnomonic_projection_point(detector.pixel_to_lab(spots['u'], spots['v']), OC)
+    return OP / np.linalg.norm(OP, axis=1)[:, np.newaxis]
+
+
@@ -0,0 +1,165 @@
+"""The spots module provide helper functions to find diffraction spots on detector images and to store them.
+"""
+import numpy as np
+from collections import OrderedDict
+from scipy import ndimage
+
+
+class SpotTable:
+    '''A columnar table of diffraction spots.
+
+    Each column is a numpy array with one entry per spot, the table can be filtered with a boolean mask or an
+    index array (which returns a new table) and saved to or loaded from a npz file:
+
+    ::
+
+      spots = rotating_crystal_spots(micro, table, 40., detector)
+      on_detector = spots[spots.on_detector(detector)]
+      on_detector.save('spots.npz')
+    '''
+
+    def __init__(self, columns):
+        '''Create a new spot table.
+
+        :param columns: an ordered dictionary (or a list of (name, array) pairs) of the columns of the table.
+        '''
+        self.columns = OrderedDict(columns)
+
+    def __len__(self):
+        return len(self.columns.values()[0]) if self.columns else 0
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return SpotTable([(name, column[key]) for (name, column) in self.columns.items()])
+
+    def __repr__(self):
+        return '%s with %d spots (%s)' % (self.__class__.__name__, len(self), ', '.join(self.columns.keys()))
+
+    def keys(self):
+        return self.columns.keys()
+
+    def on_detector(self, detector):
+        '''Boolean mask of the spots falling within the bounds of the given detector.'''
+        return detector.is_on_detector(self.columns['u'], self.columns['v'])
+
+    def save(self, file_path):
+        '''Save the spot table to a npz file.'''
+        np.savez(file_path, column_names=np.array(self.columns.keys()), **self.columns)
+
+    @staticmethod
+    def load(file_path):
+        '''Load a spot table from a npz file.'''
+        data = np.load(file_path)
+        return SpotTable([(name, data[name]) for name in data['column_names']])
+
+
+def estimate_background(image, block_size=32):
+    '''Estimate the smooth background of a detector image.
+
+    The median of each block of `block_size` pixels is computed at once by reshaping the image, the block medians
+    are then interpolated linearly to the full image size. The diffraction spots being small compared to the
+    blocks, they do not contribute to the background.
+
+    :param image: the 2D detector image.
+    :param int block_size: the size of the blocks in pixels (32 by default).
+    :returns: the background as a float32 array of the same shape as the image.
+    '''
+    image = np.asarray(image, dtype=np.float32)
+    n_blocks = [max(1, s // block_size) for s in image.shape]
+    # crop the image to a whole number of blocks, the image edges are covered by extrapolating the last blocks
+    sizes = [min(s, block_size) for s in image.shape]
+    cropped = image[:n_blocks[0] * sizes[0], :n_blocks[1] * sizes[1]]
+    blocks = cropped.reshape(n_blocks[0], sizes[0], n_blocks[1], sizes[1]).transpose(0, 2, 1, 3)
+    medians = np.median(blocks.reshape(n_blocks[0], n_blocks[1], -1), axis=2)
+    # separable linear interpolation of the block medians, the weight matrices are small
+    (w0, w1) = [_interpolation_weights(n, size, nb) for (n, size, nb) in zip(image.shape, sizes, n_blocks)]
+    return np.dot(np.dot(w0, medians), w1.T).astype(np.float32)
+
+
+def _interpolation_weights(n, block_size, n_blocks):
+    """Compute the (n, n_blocks) weights of the linear interpolation of block values at the pixel positions."""
+    # pixel coordinates in units of blocks, 0 being the centre of the first block
+    x = np.clip((np.arange(n) + 0.5) / block_size - 0.5, 0, n_blocks - 1)
+    i = np.minimum(np.floor(x).astype(int), max(n_blocks - 2, 0))
+    weights = np.zeros((n, n_blocks))
+    weights[np.arange(n), i] = 1 - (x - i)
+    if n_blocks > 1:
+        weights[np.arange(n), i + 1] = x - i
+    return weights
+
+
+def find_spots(image, threshold=None, n_sigma=5., block_size=32, background=None, mask=None, min_size=1,
+               structure=None, return_labels=False):
+    '''Find the diffraction spots of a detector image.
+
+    The background is subtracted and the pixels above the threshold are grouped into spots by connected component
+    labeling. The centroid, integrated intensity, maximum and second moments of all the spots are then computed at
+    once with weighted bincounts on the labeled pixels, the weights being the background subtracted intensities:
+
+    ::
+
+      spots = find_spots(detector.data, n_sigma=8, min_size=4)
+      gnom = gnomonic_projection(detector, spots=spots)
+
+    The centroids are given in the same pixel coordinates as the image indices.
+
+    :param image: the 2D detector image.
+    :param float threshold: the threshold on the background subtracted image (n_sigma times the noise by default).
+    :param float n_sigma: the threshold in units of the noise level estimated from the median absolute deviation
+      of the background subtracted image (5 by default).
+    :param int block_size: the block size used to estimate the background (32 by default).
+    :param background: the background image or value to subtract (estimated with `estimate_background` by default).
+    :param mask: a boolean array with True for the pixels to ignore (None by default).
+    :param int min_size: the minimum number of pixels of a spot (1 by default).
+    :param structure: the structuring element for the labeling (4-connectivity by default).
+    :param bool return_labels: if True, also return the label image (False by default).
+    :returns: a `SpotTable` with the columns u, v (the centroid), intensity, max, size, var_u, var_v and cov_uv (the
+      second central moments) and, if requested, the label image where the label of each spot is its index in the
+      table plus one.
+    '''
+    image = np.asarray(image, dtype=np.float32)
+    if background is None:
+        background = estimate_background(image, block_size)
+    signal = image - background
+    if threshold is None:
+        # the noise level is estimated on a subsample of the pixels
+        sample = signal[::2, ::2]
+        mad = np.median(np.abs(sample - np.median(sample)))
+        threshold = n_sigma * 1.4826 * mad
+    above = signal > threshold
+    if mask is not None:
+        above &= ~mask
+    labels, n_spots = ndimage.label(above, structure=structure)
+    # work on the labeled pixels only
+    indices = np.flatnonzero(labels)
+    spot_ids = labels.ravel()[indices]
+    weights = signal.ravel()[indices].astype(np.float64)
+    u, v = np.divmod(indices, image.shape[1])
+    size = np.bincount(spot_ids, minlength=n_spots + 1)[1:]
+    intensity = np.bincount(spot_ids, weights, minlength=n_spots + 1)[1:]
+
+    def moment(values):
+        return np.bincount(spot_ids, weights * values, minlength=n_spots + 1)[1:] / intensity
+
+    u_mean, v_mean = moment(u), moment(v)
+    columns = [('u', u_mean),
+               ('v', v_mean),
+               ('intensity', intensity),
+               ('max', np.maximum.reduceat(weights[np.argsort(spot_ids, kind='mergesort')],
+                                           np.cumsum(size) - size) if n_spots else np.empty(0)),
+               ('size', size),
+               ('var_u', moment(u.astype(np.float64) ** 2) - u_mean ** 2),
+               ('var_v', moment(v.astype(np.float64) ** 2) - v_mean ** 2),
+               ('cov_uv', moment(u.astype(np.float64) * v) - u_mean * v_mean)]
+    spots = SpotTable(columns)
+    keep = size >= min_size
+    if np.all(keep):
+        return (spots, labels) if return_labels else spots
+    spots = spots[keep]
+    if return_labels:
+        # relabel so that the labels follow the filtered table
+        new_ids = np.zeros(n_spots + 1, dtype=labels.dtype)
+        new_ids[1:][keep] = np.arange(1, np.sum(keep) + 1)
+        return spots, new_ids[labels]
+    return spots
@@ -2,8 +2,10 @@ import unittest
 import numpy as np
 from pymicro.crystal.lattice import Lattice, HklDirection, HklPlane, Symmetry
 from pymicro.crystal.microstructure import Orientation
-from pymicro.xray.laue import select_lambda, diffracted_vector, gnomonic_projection_point, gnomonic_projection, index
+from pymicro.xray.laue import select_lambda, diffracted_vector, gnomonic_projection_point, gnomonic_projection, index, \
+    zone_axis_list, build_list, spots_normals
 from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.xray.spots import SpotTable
 
 
 class LaueTests(unittest.TestCase):
@@ -38,6 +40,27 @@ class LaueTests(unittest.TestCase):
         psi0 = np.arccos(np.dot(ZA, np.array([1., 0., 0.])))
         self.assertAlmostEqual(psi0 * 180 / np.pi, 9.2922, 3)
 
+    def test_zone_axis_list(self):
+        """Verify the zone axes found close to the incident beam."""
+        orientation = Orientation.from_euler([89.4, 92.0, 86.8])
+        uvw = zone_axis_list([10.], orientation, self.ni, max_miller=5, indices_only=True)
+        self.assertTrue([1, 0, 5] in uvw.tolist())
+        za_list = zone_axis_list([10.], orientation, self.ni, max_miller=5)
+        self.assertEqual(len(za_list), len(uvw))
+        gt = orientation.orientation_matrix().transpose()
+        for za in za_list:
+            psi = np.arccos(np.dot(gt.dot(za.direction()), [1., 0., 0.]))
+            self.assertTrue(psi < np.radians(10.))
+        uvw15 = zone_axis_list([10.], orientation, self.ni, max_miller=15, indices_only=True)
+        self.assertTrue(set(map(tuple, uvw.tolist())).issubset(map(tuple, uvw15.tolist())))
+
+    def test_build_list(self):
+        hkl_planes = build_list(self.al, max_miller=3, extinction='FCC')
+        self.assertEqual(len(hkl_planes), 8 + 6 + 12 + 24 + 8 + 24 + 8)  # up to {333}
+        for plane in hkl_planes:
+            (h, k, l) = plane.miller_indices()
+            self.assertTrue((h - k) % 2 == 0 and (k - l) % 2 == 0)
+
     def test_select_lambda(self):
         """Verify the wavelength diffracted by a given hkl plane."""
         orientation = Orientation.cube()
@@ -119,7 +142,12 @@ class LaueTests(unittest.TestCase):
         test_dir = os.path.dirname(os.path.realpath(__file__))
         ref_gnom_data = np.load(os.path.join(test_dir, 'ref_gnom_data.npy'))
         self.assertTrue(np.array_equal(gnom.data, ref_gnom_data))
-        pass
+        # same projection from a table of spots
+        spots = SpotTable([('u', self.spots[:, 0]), ('v', self.spots[:, 1])])
+        gnom_spots = gnomonic_projection(detector, pixel_size=4, OC=OC, spots=spots)
+        self.assertTrue(np.array_equal(gnom_spots.data, ref_gnom_data))
+        normals = spots_normals(detector, spots, OC=OC)
+        self.assertTrue(np.allclose(np.linalg.norm(normals, axis=1), 1.))
 
     def test_indexation(self):
         """Verify indexing solution from a known Laue pattern."""
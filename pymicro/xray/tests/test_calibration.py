@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+from pymicro.crystal.lattice import Lattice
+from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.xray.calibration import ring_two_thetas, pixel_two_thetas, refine_geometry, calibrate, \
+    apply_parameters, detector_parameters
+
+
+class CalibrationTests(unittest.TestCase):
+    def setUp(self):
+        """testing the calibration module:"""
+        self.ceo2 = Lattice.face_centered_cubic(0.5411)
+        self.lambda_keV = 30.
+        self.two_thetas = ring_two_thetas(self.ceo2, self.lambda_keV, two_theta_max=30.)
+        # the true geometry: distance, ucen, vcen, kappa, delta, omega, pixel size
+        self.params = np.array([100., 260.3, 248.7, 0.8, -1.2, 0.5, 0.2])
+
+    def powder_image(self, size=(512, 512), width=0.1):
+        # gaussian rings computed with the forward model
+        u, v = np.meshgrid(np.arange(size[0]), np.arange(size[1]), indexing='ij')
+        tt = np.degrees(pixel_two_thetas(self.params, u, v)).reshape(size)
+        image = np.zeros(size, dtype=np.float32)
+        for two_theta in ring_two_thetas(self.ceo2, self.lambda_keV, two_theta_max=45.):
+            image += 1000 * np.exp(-0.5 * ((tt - two_theta) / width) ** 2)
+        return image + np.random.RandomState(0).normal(10., 2., size)
+
+    def test_ring_two_thetas(self):
+        lambda_nm = 1.2398 / self.lambda_keV
+        # the first ring of a fcc lattice is 111
+        d111 = 0.5411 / np.sqrt(3)
+        self.assertAlmostEqual(self.two_thetas[0], np.degrees(2 * np.arcsin(lambda_nm / (2 * d111))))
+        self.assertTrue(np.all(np.diff(self.two_thetas) > 0))
+        self.assertTrue(self.two_thetas[-1] <= 30.)
+
+    def test_jacobian(self):
+        u, v = np.array([10., 300., 480.]), np.array([50., 400., 20.])
+        tt, jac = pixel_two_thetas(self.params, u, v, jacobian=True)
+        for i in range(len(self.params)):
+            dp = np.zeros_like(self.params)
+            dp[i] = 1e-6
+            num = (pixel_two_thetas(self.params + dp, u, v) - pixel_two_thetas(self.params - dp, u, v)) / 2e-6
+            self.assertTrue(np.allclose(jac[:, i], num, rtol=1e-5, atol=1e-9))
+
+    def test_apply_parameters(self):
+        detector = RegArrayDetector2d(size=(512, 512), tilts=self.params[3:6])
+        apply_parameters(detector, self.params)
+        self.assertTrue(np.allclose(detector_parameters(detector, self.params[3:6]), self.params))
+        # the detector 2theta follow the model
+        lab = detector.pixel_to_lab(np.array([10., 300.]), np.array([50., 400.]))
+        tt = np.arctan2(np.sqrt(lab[:, 1] ** 2 + lab[:, 2] ** 2), lab[:, 0])
+        self.assertTrue(np.allclose(tt, pixel_two_thetas(self.params, [10., 300.], [50., 400.])))
+        # the cached detector angles follow the refined tilts
+        detector.compute_TwoTh_Psi_arrays()
+        u, v = np.meshgrid(np.arange(512), np.arange(512), indexing='ij')
+        self.assertTrue(np.allclose(detector.two_thetas, np.degrees(pixel_two_thetas(self.params, u, v)).reshape(512, 512),
+                                    atol=1e-4))
+
+    def test_refine_geometry(self):
+        # exact points on the rings are found back from a perturbed geometry
+        phi = np.linspace(0, 2 * np.pi, 36, endpoint=False)
+        guess = self.params + [3., -4., 5., 0., 0.5, -0.3, 0.]
+        uv, ring_ids = [], []
+        for j in range(4):
+            radius = np.full_like(phi, 100. * np.tan(np.radians(self.two_thetas[j])) / 0.2)
+            for it in range(20):
+                # move the points radially onto the ring
+                p = np.stack((self.params[1] + radius * np.cos(phi), self.params[2] + radius * np.sin(phi)), axis=1)
+                tt = np.degrees(pixel_two_thetas(self.params, p[:, 0], p[:, 1]))
+                radius *= np.tan(np.radians(self.two_thetas[j])) / np.tan(np.radians(tt))
+            uv.append(p)
+            ring_ids.append(np.full(len(phi), j, dtype=int))
+        params, rms = refine_geometry(np.concatenate(uv), np.concatenate(ring_ids), self.two_thetas, guess)
+        self.assertTrue(np.allclose(params, self.params, atol=1e-5))
+        self.assertTrue(rms < 1e-6)
+
+    def test_calibrate(self):
+        detector = RegArrayDetector2d(size=(512, 512))
+        detector.pixel_size = 0.2
+        detector.ref_pos = np.array([98., 0.4, -1.])
+        params, rms = calibrate(detector, self.ceo2, self.lambda_keV, image=self.powder_image(),
+                                tilts=(self.params[3], 0., 0.))
+        self.assertTrue(rms < 0.005)
+        self.assertTrue(abs(params[0] - self.params[0]) < 0.1)
+        self.assertTrue(np.allclose(params[1:3], self.params[1:3], atol=0.2))
+        self.assertTrue(np.allclose(params[3:6], self.params[3:6], atol=0.1))
+        self.assertAlmostEqual(detector.calib, 100. / 0.2 * np.tan(np.radians(1.)), delta=0.1)
+        self.assertTrue(np.allclose(detector.u_dir, RegArrayDetector2d(tilts=self.params[3:6]).u_dir, atol=1e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pymicro.crystal.lattice import Lattice, HklPlane, ReflectionTable
+from pymicro.crystal.microstructure import Orientation
+from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.xray.dct import omega_angles, topotomo_tilts, rotating_crystal_spots, SpotTable
+
+
+class DctTests(unittest.TestCase):
+    def setUp(self):
+        """testing the dct module:"""
+        self.al = Lattice.from_symbol('Al')
+        self.orientations = [Orientation.from_rodrigues([0.1449, -0.0281, 0.0616]),
+                             Orientation.from_euler([20., 35., 50.])]
+
+    def test_omega_angles(self):
+        table = ReflectionTable.generate(self.al, max_miller=2, max_keV=40.)
+        omegas, two_thetas, etas, valid = omega_angles(self.orientations, table, 40.)
+        self.assertEqual(omegas.shape, (2, len(table), 2))
+        self.assertEqual(valid.shape, (2, len(table)))
+        for i, o in enumerate(self.orientations):
+            for j in range(len(table)):
+                plane = table[j]
+                if not valid[i, j]:
+                    self.assertRaises(ValueError, o.dct_omega_angles, plane, 40.)
+                    continue
+                self.assertTrue(np.allclose(omegas[i, j], o.dct_omega_angles(plane, 40.)))
+                self.assertTrue(np.allclose(two_thetas[i, j], 2 * np.degrees(plane.bragg_angle(40.))))
+        self.assertTrue(np.all(np.isnan(omegas[~valid])))
+        # same result with Euler angles
+        eulers = np.array([o.euler for o in self.orientations])
+        self.assertTrue(np.allclose(omega_angles(eulers, table, 40.)[0][valid], omegas[valid]))
+
+    def test_topotomo_tilts(self):
+        planes = [HklPlane(0, 0, 2, self.al), HklPlane(1, 1, 1, self.al)]
+        ut, lt = topotomo_tilts(self.orientations, planes)
+        for i, o in enumerate(self.orientations):
+            for j, plane in enumerate(planes):
+                self.assertTrue(np.allclose((ut[i, j], lt[i, j]), o.topotomo_tilts(plane)))
+        # same result with Miller indices
+        ut2, lt2 = topotomo_tilts(self.orientations, [[0, 0, 2], [1, 1, 1]], lattice=self.al)
+        self.assertTrue(np.allclose(ut, ut2) and np.allclose(lt, lt2))
+
+    def test_rotating_crystal_spots(self):
+        table = ReflectionTable.generate(self.al, max_miller=2, max_keV=40.)
+        detector = RegArrayDetector2d(size=(1024, 1024))
+        detector.pixel_size = 0.02  # mm
+        detector.ref_pos = np.array([100., 0., 0.])  # mm
+        positions = np.array([[0.1, 0.2, -0.1], [-0.3, 0., 0.2]])
+        spots = rotating_crystal_spots(self.orientations, table, 40., detector, positions=positions)
+        omegas, two_thetas, etas, valid = omega_angles(self.orientations, table, 40.)
+        self.assertEqual(len(spots), 2 * np.sum(valid))
+        self.assertTrue(np.all((spots['omega'] >= 0.) & (spots['omega'] < 360.)))
+        self.assertTrue(np.allclose(spots['hkl'], table.hkl[spots['reflection']]))
+        # check a spot against the detector projection
+        i = np.nonzero(spots['x'] > 0)[0][0]
+        g, w = spots['grain'][i], np.radians(spots['omega'][i])
+        tt, eta = np.radians(spots['two_theta'][i]), np.radians(spots['eta'][i])
+        origin = np.dot(np.array([[np.cos(w), -np.sin(w), 0], [np.sin(w), np.cos(w), 0], [0, 0, 1]]), positions[g])
+        K = np.array([np.cos(tt), np.sin(tt) * np.sin(eta), np.sin(tt) * np.cos(eta)])
+        p = detector.project_along_direction(K, origin)
+        self.assertTrue(np.allclose(p, [spots['x'][i], spots['y'][i], spots['z'][i]]))
+        self.assertTrue(np.allclose(detector.lab_to_pixel(p)[0], [spots['u'][i], spots['v'][i]]))
+        # restrict the omega range
+        half = rotating_crystal_spots(self.orientations, table, 40., omega_range=(-90., 90.))
+        self.assertTrue(np.all((half['omega'] >= -90.) & (half['omega'] < 90.)))
+        self.assertTrue(len(half) < len(spots))
+        # filtering and saving the spot table
+        visible = spots[spots.on_detector(detector)]
+        self.assertTrue(0 < len(visible) < len(spots))
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        file_path = os.path.join(tmp_dir, 'spots.npz')
+        visible.save(file_path)
+        loaded = SpotTable.load(file_path)
+        self.assertEqual(loaded.keys(), visible.keys())
+        self.assertTrue(np.allclose(loaded['u'], visible['u']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
-from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.xray.detectors import RegArrayDetector2d, Xpad, FlatFieldCorrection
 
 class DetectorsTests(unittest.TestCase):
 
@@ -39,6 +42,25 @@ class DetectorsTests(unittest.TestCase):
         RR = self.detector.pixel_to_lab(u, v)[0]
         self.assertListEqual(RR.tolist(), R.tolist())
 
+    def test_project_many_rays(self):
+        """Verify the vectorized detector transforms."""
+        directions = np.array([[1., 0., 0.], [0.1, 0.04, 0.02], [-1., 0., 0.], [0., 1., 0.], [1., 0.1, 0.]])
+        origins = np.array([[0., 0., 0.], [0., 0., 0.], [0., 0., 0.], [0., 0., 0.], [0., 0., 30.]])
+        R, mask = self.detector.project_along_direction(directions, origins, return_mask=True)
+        self.assertEqual(R.shape, (5, 3))
+        self.assertListEqual(mask.tolist(), [True, True, False, False, True])
+        self.assertTrue(np.allclose(R[1], self.detector.project_along_direction(directions[1])))
+        self.assertTrue(np.all(np.isnan(R[3])))  # parallel to the detector
+        uv, on_detector = self.detector.lab_to_pixel(R, return_mask=True)
+        self.assertTrue(np.allclose(uv[:2], [[512, 256], [112, 56]], atol=1.))
+        self.assertListEqual(on_detector.tolist(), [True, True, True, False, False])
+        # back to the laboratory frame
+        RR = self.detector.pixel_to_lab(uv[:2])
+        self.assertTrue(np.allclose(RR, R[:2]))
+        u, v, mask = self.detector.angles_to_pixels(np.array([0., 1., 90.]), np.array([0., 45., 0.]),
+                                                    return_mask=True)
+        self.assertListEqual(mask.tolist(), [True, True, False])
+
     def test_detector_tilt(self):
         """Verify the tilted coordinate frame """
         for tilt in [1, 5, 10, 15]:
@@ -67,3 +89,203 @@ class DetectorsTests(unittest.TestCase):
             self.assertAlmostEqual(w1, det_tilt.w_dir[0], 7)
             self.assertAlmostEqual(w2, det_tilt.w_dir[1], 7)
             self.assertAlmostEqual(w3, det_tilt.w_dir[2], 7)
+
+
+class GeometryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        """testing the detector geometry cache:"""
+        self.detector = RegArrayDetector2d(size=(128, 96))
+        self.detector.pixel_size = 0.1  # mm
+        self.detector.ref_pos = np.array([50., 0., 0.])  # mm
+
+    def test_geometry_cache(self):
+        positions = self.detector.get_geometry('lab_positions')
+        self.assertEqual(positions.shape, (128, 96, 3))
+        self.assertEqual(positions.dtype, np.float32)
+        self.assertTrue(np.allclose(positions[10, 20], self.detector.pixel_to_lab(10, 20)[0]))
+        self.assertTrue(self.detector.get_geometry('lab_positions') is positions)
+        # solid angle of the pixel facing the beam
+        self.assertAlmostEqual(self.detector.get_geometry('solid_angles')[64, 48], 0.1 ** 2 / 50. ** 2)
+        # 2theta and psi arrays
+        self.detector.compute_TwoTh_Psi_arrays()
+        two_thetas = self.detector.two_thetas
+        self.detector.compute_TwoTh_Psi_arrays()
+        self.assertTrue(self.detector.two_thetas is two_thetas)
+        self.assertAlmostEqual(self.detector.psis[80, 48], 0.)
+        self.assertAlmostEqual(self.detector.psis[64, 60], 270.)
+        # moving the detector invalidates the cache
+        self.detector.ref_pos = np.array([60., 0., 0.])
+        self.assertFalse(self.detector.get_geometry('lab_positions') is positions)
+        self.assertAlmostEqual(self.detector.get_geometry('lab_positions')[64, 48, 0], 60.)
+        self.detector.ucen = 60
+        self.detector.compute_TwoTh_Psi_arrays()
+        self.assertFalse(self.detector.two_thetas is two_thetas)
+        self.assertRaises(ValueError, self.detector.get_geometry, 'foo')
+
+    def test_positioned_angles(self):
+        # an untilted detector gives the same angles from its position and from calib
+        self.detector.calib = 50. / 0.1 * np.tan(np.radians(1.))
+        self.detector.ucen, self.detector.vcen = 64, 48
+        self.detector.compute_TwoTh_Psi_arrays()
+        detector = RegArrayDetector2d(size=(128, 96))
+        detector.calib, detector.ucen, detector.vcen = self.detector.calib, 64, 48
+        self.assertFalse(detector.is_positioned())
+        detector.compute_TwoTh_Psi_arrays()
+        self.assertTrue(np.allclose(self.detector.two_thetas, detector.two_thetas, atol=1e-4))
+        valid = self.detector.two_thetas > 0.1
+        self.assertTrue(np.allclose(self.detector.psis[valid], detector.psis[valid], atol=1e-3))
+        # a tilted detector uses the lab positions
+        tilted = RegArrayDetector2d(size=(128, 96), tilts=(0., 10., 5.))
+        tilted.pixel_size, tilted.ref_pos = 0.1, np.array([50., 0., 0.])
+        tilted.compute_TwoTh_Psi_arrays()
+        p = tilted.get_geometry('lab_positions')[100, 20].astype(float)
+        self.assertAlmostEqual(tilted.two_thetas[100, 20], np.degrees(np.arctan2(np.hypot(p[1], p[2]), p[0])), 4)
+        u, v = tilted.angles_to_pixels(tilted.two_thetas[[100, 30], [20, 70]], tilted.psis[[100, 30], [20, 70]])
+        self.assertTrue(np.allclose(u, [100, 30], atol=1e-2) and np.allclose(v, [20, 70], atol=1e-2))
+        # a back scattered ray does not reach the detector
+        u, v, mask = self.detector.angles_to_pixels([1., 179.], [45., 225.], return_mask=True)
+        self.assertTrue(mask[0] and not mask[1])
+        self.assertTrue(np.isfinite(u[0]) and np.isnan(u[1]) and np.isnan(v[1]))
+
+    def test_geometry_cache_dir(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.detector.geometry_cache_dir = os.path.join(tmp_dir, 'geometry')
+        solid_angles = self.detector.get_geometry('solid_angles')
+        self.assertTrue(isinstance(solid_angles, np.memmap))
+        self.assertEqual(len(os.listdir(self.detector.geometry_cache_dir)), 2)  # solid angles and positions
+        # a new detector with the same geometry reads the arrays from the disk
+        detector = RegArrayDetector2d(size=(128, 96))
+        detector.pixel_size = 0.1
+        detector.ref_pos = np.array([50., 0., 0.])
+        detector.geometry_cache_dir = self.detector.geometry_cache_dir
+        self.assertTrue(np.array_equal(detector.get_geometry('solid_angles'), solid_angles))
+        self.assertEqual(len(os.listdir(self.detector.geometry_cache_dir)), 2)
+
+
+class XpadTests(unittest.TestCase):
+
+    def setUp(self):
+        """testing the Xpad detector:"""
+        self.xpad = Xpad()
+        self.xpad.correction = 'none'
+        np.random.seed(13)
+        self.raw = np.random.rand(240, 560).astype(np.float32)
+
+    def test_correct_image(self):
+        f = self.xpad.factorIdoublePixel
+        corr = self.xpad.correct_image(self.raw)
+        self.assertEqual(corr.shape, (243, 578))
+        # regular pixels are shifted by 3 pixels at each junction
+        self.assertAlmostEqual(corr[10, 10], self.raw[10, 10])
+        self.assertAlmostEqual(corr[10, 83 + 10], self.raw[10, 80 + 10])
+        self.assertAlmostEqual(corr[200, 577], self.raw[197, 559])
+        # double pixels are spread over 2 pixels plus an interpolated one
+        self.assertAlmostEqual(corr[10, 79], self.raw[10, 79] / f)
+        self.assertAlmostEqual(corr[10, 80], self.raw[10, 79] / f)
+        self.assertAlmostEqual(corr[10, 81], 0.5 * (self.raw[10, 78] + self.raw[10, 80]) / f)
+        self.assertAlmostEqual(corr[10, 82], self.raw[10, 80] / f)
+        # double lines at the module junction
+        self.assertAlmostEqual(corr[121, 10], 0.5 * (self.raw[119, 10] + self.raw[120, 10]) / f)
+        self.assertAlmostEqual(corr[123, 10], self.raw[120, 10] / f)
+        # a stack of images is corrected at once
+        stack = np.array([self.raw, 2 * self.raw])
+        self.assertTrue(np.allclose(self.xpad.correct_image(stack)[1], 2 * corr))
+        self.xpad.orientation = 'vertical'
+        self.assertTrue(np.allclose(self.xpad.correct_image(self.raw), corr.T))
+
+    def test_double_pixel_mask(self):
+        self.xpad.data = self.raw
+        self.xpad.compute_corrected_image()
+        self.assertTrue(self.xpad.mask is None)
+        self.xpad.mask_flag = 1
+        self.xpad.compute_corrected_image()
+        self.assertEqual(self.xpad.mask.dtype, bool)
+        self.assertEqual(self.xpad.mask.shape, self.xpad.corr_data.shape)
+        self.assertTrue(self.xpad.mask[10, 80] and self.xpad.mask[121, 10] and not self.xpad.mask[10, 10])
+
+    def test_compute_TwoTh_Psi_arrays(self):
+        self.xpad.orientation = 'vertical'
+        self.xpad.corr_data = self.xpad.correct_image(self.raw)
+        two_thetas, psis = self.xpad.compute_TwoTh_Psi_arrays(diffracto_delta=5., diffracto_gamma=0.)
+        self.assertEqual(two_thetas.shape, (578, 243))
+        # check one pixel against the angle between the pixel direction and the beam
+        distance = self.xpad.calib / np.tan(np.radians(1.))
+        delta = np.radians(5. + self.xpad.deltaOffset)
+        (x, y) = (100, 30)
+        X, Z = distance, self.xpad.XcenDetector - x
+        p = np.array([X * np.cos(delta) - Z * np.sin(delta), y - self.xpad.YcenDetector,
+                      X * np.sin(delta) + Z * np.cos(delta)])
+        self.assertAlmostEqual(two_thetas[x, y], np.degrees(np.arccos(p[0] / np.linalg.norm(p))))
+        # the arrays are cached for each delta value
+        self.assertTrue(self.xpad.compute_TwoTh_Psi_arrays(5., 0.)[0] is two_thetas)
+        self.xpad.compute_TwoTh_Psi_arrays(6., 0.)
+        self.assertTrue(self.xpad.compute_TwoTh_Psi_arrays(5., 0.)[1] is psis)
+        self.xpad.angles_cache_size = 1
+        self.xpad.compute_TwoTh_Psi_arrays(6., 0.)
+        self.assertFalse(self.xpad.compute_TwoTh_Psi_arrays(5., 0.)[0] is two_thetas)
+
+
+class FlatFieldTests(unittest.TestCase):
+
+    def setUp(self):
+        """testing the flat field correction:"""
+        rs = np.random.RandomState(0)
+        self.dark = (100 + rs.normal(0, 2, (64, 48))).astype(np.uint16)
+        self.ref = (self.dark + rs.uniform(800, 1200, (64, 48))).astype(np.uint16)
+        self.stack = (self.dark + rs.uniform(0.2, 1., (20, 64, 48)) * (self.ref - self.dark)).astype(np.uint16)
+
+    def test_apply(self):
+        ff = FlatFieldCorrection(self.ref, self.dark)
+        expected = (self.stack[0] - self.dark.astype(np.float32)) / (self.ref - self.dark.astype(np.float32))
+        self.assertTrue(np.allclose(ff.apply(self.stack[0]), expected))
+        # in place correction of a stack
+        stack = self.stack.astype(np.float32)
+        self.assertTrue(ff.apply(stack, out=stack) is stack)
+        self.assertTrue(np.allclose(stack[0], expected))
+        # the correction is reused by the detector
+        detector = RegArrayDetector2d(size=(64, 48))
+        detector.ref, detector.dark, detector.correction = self.ref, self.dark, 'flat'
+        self.assertTrue(np.allclose(detector.correct_image(self.stack[0]), expected))
+        self.assertTrue(detector.get_flat_field() is detector.get_flat_field())
+        detector.dark = self.dark.copy()
+        self.assertFalse(detector.get_flat_field() is ff)
+
+    def test_bad_pixels(self):
+        dark = self.dark.astype(np.float32)
+        dark[10, 20] += 500.  # a hot pixel
+        ref = self.ref.copy()
+        ref[0, 0] = self.dark[0, 0]  # a dead pixel
+        hot = FlatFieldCorrection.hot_pixel_mask(dark)
+        self.assertEqual(zip(*np.nonzero(hot)), [(10, 20)])
+        ff = FlatFieldCorrection(ref, dark, bad_pixels=hot)
+        image = ff.apply(np.full((64, 48), 2000, dtype=np.uint16))
+        self.assertTrue(np.all(np.isfinite(image)))
+        self.assertAlmostEqual(image[10, 20], np.mean(image[9:12, 19:22].ravel()[np.arange(9) != 4]), 5)
+        self.assertAlmostEqual(image[0, 0], np.mean([image[0, 1], image[1, 0], image[1, 1]]), 5)
+
+    def test_from_series(self):
+        darks = np.repeat(self.dark[np.newaxis], 5, axis=0)
+        darks[2, 5, 5] = 4000  # a zinger
+        ff = FlatFieldCorrection.from_series(darks, self.ref[np.newaxis].repeat(3, axis=0))
+        self.assertTrue(np.allclose(ff.dark, self.dark))
+        self.assertTrue(np.allclose(FlatFieldCorrection.median_image(darks, chunk_rows=7), self.dark))
+
+    def test_correct_stack(self):
+        ff = FlatFieldCorrection(self.ref, self.dark)
+        expected = ff.apply(self.stack)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        stack_path = os.path.join(tmp_dir, 'stack.npy')
+        np.save(stack_path, self.stack)
+        stack = np.load(stack_path, mmap_mode='r')
+        output_path = os.path.join(os.path.dirname(stack_path), u'stack_flat.npy')  # unicode paths are accepted
+        corrected = ff.correct_stack(stack, output=output_path, chunk_size=3, n_threads=2)
+        self.assertTrue(np.allclose(corrected, expected))
+        self.assertTrue(np.allclose(np.load(output_path), expected))
+        # in place correction requires a float32 stack
+        self.assertRaises(ValueError, ff.correct_stack, self.stack)
+        stack = self.stack.astype(np.float32)
+        ff.correct_stack(stack, chunk_size=7)
+        self.assertTrue(np.allclose(stack, expected))
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.xray.integration import AzimuthalIntegrator, CakeIntegrator, pixel_widths, batch_integrate
+
+
+class IntegrationTests(unittest.TestCase):
+    def setUp(self):
+        """testing the integration module:"""
+        self.detector = RegArrayDetector2d(size=(64, 48))
+        self.detector.calib = 10.
+        self.detector.compute_TwoTh_Psi_arrays()
+        np.random.seed(42)
+        self.image = np.random.rand(64, 48).astype(np.float32)
+
+    def test_azimuthal_integrator(self):
+        tt = self.detector.two_thetas
+        integrator = AzimuthalIntegrator(tt, (0.5, 3.), 0.1)
+        two_theta_values, intensity, counts = integrator.integrate(self.image)
+        self.assertEqual(len(two_theta_values), 25)
+        self.assertAlmostEqual(two_theta_values[0], 0.55)
+        # compare with a brute force binning
+        bin_id = np.floor((tt - 0.5) / 0.1).astype(int)
+        for i in [0, 10, 24]:
+            self.assertEqual(counts[i], np.sum(bin_id == i))
+            self.assertAlmostEqual(intensity[i], self.image[bin_id == i].mean(), 5)
+        # masks are handled as weights
+        mask = self.image < 0.2
+        two_theta_values, intensity, counts = integrator.integrate(self.image, mask=mask)
+        self.assertEqual(counts[10], np.sum((bin_id == 10) & ~mask))
+        self.assertAlmostEqual(intensity[10], self.image[(bin_id == 10) & ~mask].mean(), 5)
+        masked_image = np.ma.array(self.image, mask=mask)
+        self.assertTrue(np.allclose(integrator.integrate(masked_image)[1], intensity))
+        # normalisation
+        norm = 2 * np.ones_like(self.image)
+        self.assertTrue(np.allclose(integrator.integrate(self.image, mask=mask, normalization=norm)[1],
+                                    0.5 * intensity))
+
+    def test_pixel_splitting(self):
+        tt = self.detector.two_thetas
+        integrator = AzimuthalIntegrator(tt, (0., tt.max() + 1.), 0.05, pixel_split=True)
+        # pixels fully inside the range are entirely distributed
+        inside = (tt - 0.5 * pixel_widths(tt)).ravel() >= 0.
+        self.assertTrue(np.allclose(np.asarray(integrator.lut.sum(axis=0)).ravel()[inside], 1., atol=1.e-5))
+        two_theta_values, intensity, counts = integrator.integrate(np.ones_like(self.image))
+        self.assertTrue(counts.sum() <= self.image.size)
+        self.assertTrue(counts.sum() >= np.sum(inside) - 0.01)
+        self.assertTrue(np.allclose(intensity[counts > 0], 1.))
+
+    def test_azimuthal_regroup(self):
+        self.detector.corr_data = self.image
+        two_theta_values, intensity, counts = self.detector.azimuthal_regroup(0.5, 3., 0.1)
+        integrator = self.detector.get_azimuthal_integrator(0.5, 3., 0.1)
+        self.assertTrue(integrator is self.detector.get_azimuthal_integrator(0.5, 3., 0.1))
+        self.assertTrue(np.allclose(intensity, integrator.integrate(self.image)[1]))
+
+    def test_cake_integrator(self):
+        tt, psis = self.detector.two_thetas, self.detector.psis
+        cake = CakeIntegrator(tt, psis, (0.5, 3.), 0.1, (0., 360.), 30.)
+        self.assertEqual(cake.n_bins, (25, 12))
+        mask = self.image < 0.2
+        intensity, counts, normalised = cake.integrate(self.image, mask=mask)
+        # compare with a brute force binning
+        tt_id = np.floor((tt - 0.5) / 0.1).astype(int)
+        psi_id = np.floor(psis / 30.).astype(int)
+        selection = (tt_id == 10) & (psi_id == 4) & ~mask
+        self.assertEqual(counts[10, 4], np.sum(selection))
+        self.assertAlmostEqual(intensity[10, 4], self.image[selection].sum(), 4)
+        self.assertAlmostEqual(normalised[10, 4], self.image[selection].mean(), 5)
+        # the 2theta profile is the same as with the azimuthal integrator
+        profile = AzimuthalIntegrator(tt, (0.5, 3.), 0.1).integrate(self.image, mask=mask)[1]
+        self.assertTrue(np.allclose(cake.two_theta_profile(intensity, counts), profile))
+        psi_profile = cake.psi_profile(intensity, counts)
+        self.assertAlmostEqual(psi_profile[4], self.image[(tt_id >= 0) & (tt_id < 25) & (psi_id == 4) & ~mask].mean())
+
+    def test_sagital_regroup(self):
+        self.detector.corr_data = self.image
+        psi_values, intensity, counts = self.detector.sagital_regroup(1., 2., 0., 360., 45.)
+        self.assertEqual(len(psi_values), 8)
+        tt, psis = self.detector.two_thetas, self.detector.psis
+        selection = (tt >= 1.) & (tt < 2.) & (psis >= 90.) & (psis < 135.)
+        self.assertEqual(counts[2], np.sum(selection))
+        self.assertAlmostEqual(intensity[2], self.image[selection].mean(), 5)
+
+    def test_batch_integrate(self):
+        stack = (1000 * np.random.rand(5, 64, 48)).astype(np.uint16)
+        integrator = AzimuthalIntegrator(self.detector.two_thetas, (0.5, 3.), 0.1)
+        profiles = batch_integrate(self.detector, stack, integrator, n_threads=2, prefetch=2)
+        self.assertEqual(profiles.shape, (5, 25))
+        for i in [0, 4]:
+            self.assertTrue(np.allclose(profiles[i], integrator.integrate(stack[i].astype(np.float32))[1]))
+        # write the profiles incrementally to a file
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        batch_integrate(self.detector, stack, integrator, output=os.path.join(output_dir, 'p.npy'))
+        self.assertTrue(np.allclose(np.load(os.path.join(output_dir, 'p.npy')), profiles))
+        cake = CakeIntegrator(self.detector.two_thetas, self.detector.psis, (0.5, 3.), 0.1, (0., 360.), 30.)
+        batch_integrate(self.detector, stack, cake, output=os.path.join(output_dir, 'cakes.h5'))
+        import h5py
+        with h5py.File(os.path.join(output_dir, 'cakes.h5'), 'r') as f:
+            self.assertEqual(f['profiles'].shape, (5, 25, 12))
+            self.assertTrue(np.allclose(f['profiles'][3], cake.integrate(stack[3].astype(np.float32))[2],
+                                        equal_nan=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
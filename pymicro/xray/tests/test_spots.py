@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+from pymicro.xray.spots import find_spots
+
+
+class SpotsTests(unittest.TestCase):
+    def test_find_spots(self):
+        # gaussian spots on a sloped background with noise
+        u, v = np.meshgrid(np.arange(300), np.arange(200), indexing='ij')
+        image = 100 + 0.2 * u + 0.1 * v + np.random.RandomState(0).normal(0., 2., u.shape)
+        centres = np.array([[50.3, 40.7], [120., 180.6], [150.5, 120.2], [240.8, 60.4]])
+        sigmas = np.array([1.5, 2.5, 2., 1.])
+        for (uc, vc), sigma in zip(centres, sigmas):
+            image += 500 * np.exp(-0.5 * ((u - uc) ** 2 + (v - vc) ** 2) / sigma ** 2)
+        image[10, 10] += 100.  # a hot pixel
+        spots = find_spots(image.astype(np.uint16), n_sigma=8.)
+        self.assertEqual(len(spots), 5)
+        spots, labels = find_spots(image, n_sigma=8., min_size=4, return_labels=True)
+        self.assertEqual(len(spots), 4)
+        self.assertEqual(labels.max(), 4)
+        order = np.argsort(spots['u'])
+        self.assertTrue(np.allclose(spots['u'][order], centres[:, 0], atol=0.1))
+        self.assertTrue(np.allclose(spots['v'][order], centres[:, 1], atol=0.1))
+        self.assertTrue(np.all(spots['size'] == np.bincount(labels.ravel())[1:]))
+        # the second moments are those of the gaussian truncated by the threshold
+        self.assertTrue(np.all(spots['var_u'][order] < sigmas ** 2))
+        self.assertTrue(np.all(np.abs(spots['cov_uv']) < 0.1 * spots['var_u']))
+        # masked pixels are ignored
+        mask = np.zeros(image.shape, dtype=bool)
+        mask[140:160, 110:130] = True
+        self.assertEqual(len(find_spots(image, n_sigma=8., min_size=4, mask=mask)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
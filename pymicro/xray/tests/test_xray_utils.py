@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from pymicro.crystal.lattice import Lattice, Crystal, ReflectionTable
+from pymicro.xray.xray_utils import atomic_form_factor, structure_factors, structure_factor_intensities
+
+
+class StructureFactorTests(unittest.TestCase):
+    def setUp(self):
+        """testing the structure factor computation:"""
+        self.table = ReflectionTable.generate(Lattice.cubic(0.352), max_miller=2)
+
+    def test_atomic_form_factor(self):
+        f = atomic_form_factor('Ni', [0., 0.3])
+        self.assertAlmostEqual(f[0], 28., 1)  # Z
+        self.assertAlmostEqual(f[1], 18.696, 1)  # tabulated value
+        self.assertAlmostEqual(atomic_form_factor('Mo', 0.), atomic_form_factor('Mo', [0.])[0])
+        self.assertRaises(ValueError, atomic_form_factor, 'Xx', 0.)
+
+    def test_centering(self):
+        """The structure factors of a FCC lattice do not depend on the way the 4 atoms are described."""
+        fcc = Crystal(Lattice.face_centered_cubic(0.352), basis=[(0., 0., 0.)], basis_labels=['Ni'])
+        cubic = Crystal(Lattice.cubic(0.352), basis=[(0., 0., 0.), (0., 0.5, 0.5), (0.5, 0., 0.5), (0.5, 0.5, 0.)],
+                        basis_labels=4 * ['Ni'])
+        I_fcc = structure_factor_intensities(fcc, self.table)
+        self.assertTrue(np.allclose(I_fcc, structure_factor_intensities(cubic, self.table.hkl)))
+        allowed = ReflectionTable.extinction_mask(self.table.hkl, 'F')
+        self.assertTrue(np.all(I_fcc[~allowed] < 1.e-6))
+        # the 111 structure factor is 4 times the atomic scattering factor
+        F = structure_factors(fcc, [[1, 1, 1]])
+        self.assertAlmostEqual(abs(F[0]), 4 * atomic_form_factor('Ni', 0.05 * np.sqrt(3) / 0.352), 6)
+
+    def test_debye_waller(self):
+        fcc = Crystal(Lattice.face_centered_cubic(0.352), basis=[(0., 0., 0.)], basis_labels=['Ni'])
+        I = structure_factor_intensities(fcc, self.table)
+        I_dw = structure_factor_intensities(fcc, self.table, debye_waller={'Ni': 0.4})
+        s = 0.05 / self.table.d_spacings
+        self.assertTrue(np.allclose(I_dw, I * np.exp(-2 * 0.4 * s ** 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
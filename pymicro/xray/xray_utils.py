@@ -55,6 +55,106 @@ def atom_scat_factor_function(mat='Al', sintheta_lambda_max=12, display=True):
     return fit
 
 
+_form_factor_data = {}
+
+
+def _load_form_factor_data(element):
+    """Load (once) the atomic scattering factor data of a given element.
+
+    The coefficients of the analytical fit are used if the file `<element>_fit_fatom` exists in the data folder,
+    otherwise the tabulated values of `<element>_atom_scattering.txt` are used.
+    """
+    if element not in _form_factor_data:
+        data_dir = os.path.join(os.path.dirname(__file__), 'data')
+        fit_path = os.path.join(data_dir, '%s_fit_fatom' % element)
+        table_path = os.path.join(data_dir, '%s_atom_scattering.txt' % element)
+        if os.path.exists(fit_path):
+            _form_factor_data[element] = ('fit', np.genfromtxt(fit_path)[:, 1])
+        elif os.path.exists(table_path):
+            _form_factor_data[element] = ('table', np.genfromtxt(table_path))
+        else:
+            raise ValueError('no atomic scattering data for element %s' % element)
+    return _form_factor_data[element]
+
+
+def atomic_form_factor(element, sintheta_lambda):
+    """Compute the atomic scattering factor of an element.
+
+    The data is read only once per element and kept in memory. With the fit coefficients, the scattering factor
+    is given by:
+
+    .. math::
+
+      f(s) = \\sum_{i=1}^4 a_i\\exp(-b_i s^2) + c
+
+    :param str element: the chemical symbol of the element (e.g. 'Ni').
+    :param sintheta_lambda: a value or an array of :math:`\\sin\\theta/\\lambda` in angstrom^-1.
+    :raise ValueError: if no data is available for this element.
+    :returns: the atomic scattering factor(s) in electrons.
+    """
+    kind, data = _load_form_factor_data(element)
+    s = np.asarray(sintheta_lambda, dtype=float)
+    if kind == 'fit':
+        return np.dot(np.exp(-np.multiply.outer(s ** 2, data[1:8:2])), data[0:8:2]) + data[8]
+    return np.interp(s, data[:, 0], data[:, 1])
+
+
+def structure_factors(crystal, hkl, debye_waller=None):
+    """Compute the structure factors of a crystal for a series of reflections.
+
+    The structure factor is computed for all the reflections at once from the basis of the crystal, taking into
+    account the translations associated with the centering of the lattice:
+
+    .. math::
+
+      F(hkl) = \\sum_j f_j(s)\\exp(-B_j s^2)\\exp\\left(2i\\pi(hx_j + ky_j + lz_j)\\right)
+
+    where :math:`s = \\sin\\theta/\\lambda = 1/2d_{hkl}`. The atomic scattering factors are evaluated once per
+    element using the labels of the basis.
+
+    :param crystal: the :py:class:`~pymicro.crystal.lattice.Crystal` instance.
+    :param hkl: the reflections, either a `ReflectionTable`, a list of `HklPlane` or a (n, 3) array of Miller indices.
+    :param debye_waller: optional Debye-Waller B factor(s) in angstrom^2, either a float, a dictionary with the
+      element labels as keys or a sequence with one value per atom of the basis.
+    :returns: a complex numpy array of the structure factors.
+    """
+    lattice = crystal._lattice
+    if hasattr(hkl, 'd_spacings'):
+        hkl = hkl.hkl
+    elif len(hkl) > 0 and hasattr(hkl[0], 'miller_indices'):
+        hkl = [plane.miller_indices() for plane in hkl]
+    hkl = np.asarray(hkl, dtype=float).reshape(-1, 3)
+    d = 1. / np.linalg.norm(np.dot(hkl, lattice.reciprocal_matrix), axis=1)
+    s = 0.05 / d  # sin(theta) / lambda in angstrom^-1
+    labels = list(crystal._labels)
+    f = np.empty((len(hkl), len(labels)))
+    for element in set(labels):
+        columns = [i for i in range(len(labels)) if labels[i] == element]
+        f[:, columns] = atomic_form_factor(element, s)[:, np.newaxis]
+    if debye_waller is not None:
+        if isinstance(debye_waller, dict):
+            B = np.array([debye_waller.get(label, 0.) for label in labels])
+        else:
+            B = np.broadcast_to(np.asarray(debye_waller, dtype=float), (len(labels),))
+        f *= np.exp(-np.outer(s ** 2, B))
+    basis = np.asarray(crystal._basis, dtype=float)
+    F = np.sum(f * np.exp(2j * np.pi * np.dot(hkl, basis.T)), axis=1)
+    # lattice centering
+    F *= np.sum(np.exp(2j * np.pi * np.dot(hkl, lattice.centering_translations().T)), axis=1)
+    return F
+
+
+def structure_factor_intensities(crystal, hkl, debye_waller=None):
+    """Compute the squared modulus of the structure factors :math:`|F(hkl)|^2`.
+
+    See :py:func:`structure_factors` for the parameters.
+
+    :returns: a numpy array of the squared structure factors.
+    """
+    F = structure_factors(crystal, hkl, debye_waller=debye_waller)
+    return F.real ** 2 + F.imag ** 2
+
+
 def lambda_keV_to_nm(lambda_keV):
     '''Change the unit of wavelength from keV to nm.
 